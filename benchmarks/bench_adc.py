@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Samples a simulated ADS1115 and ADS7830 whose inputs carry sine waves,
+with one analog_read per sample and in continuous mode, and reports
+samples per second, bus transactions per sample and CPU time per sample.
+
+The simulated bus answers instantly, so the rates of the ADS7830 are only
+bounded by the CPU; on a real 400 kHz bus each transaction takes tens of
+microseconds, which makes the block reads matter even more.
+"""
+
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pywiring.adc import ADS1115IO, ADS7830IO
+from pywiring.sim import Simulation, SimADS1115, SimADS7830
+
+DURATION = 0.5
+FREQUENCY = 10.0
+
+
+class SineWaves(object):
+    """
+    Inputs of an ADC: channel N carries a sine wave of
+    ``FREQUENCY * (N + 1)`` Hz between 0 and :py:data:`full_scale`,
+    sampled when it's read.
+    """
+
+    def __init__(self, full_scale):
+        self.full_scale = full_scale
+        self.start = time.perf_counter()
+
+    def __getitem__(self, channel):
+        t = time.perf_counter() - self.start
+        return int(self.full_scale * (0.5 + 0.5 * math.sin(2 * math.pi * FREQUENCY * (channel + 1) * t)))
+
+
+def report(label, adc, samples, seconds, cpu, transactions):
+    print("{0:<30} {1:9.0f} samples/s  {2:5.2f} transactions/sample  {3:6.2f} us CPU/sample".format(
+        label, samples / seconds, transactions / float(samples), cpu / samples * 1e6))
+
+
+def single(label, adc, channels, raw):
+    transactions = raw.transactions
+    start = time.perf_counter()
+    cpu = time.process_time()
+    samples = 0
+    while time.perf_counter() - start < DURATION:
+        for channel in channels:
+            adc.analog_read(channel)
+        samples += len(channels)
+    report(label, adc, samples, time.perf_counter() - start, time.process_time() - cpu,
+           raw.transactions - transactions)
+
+
+def continuous(label, adc, channels, raw, rate=None):
+    transactions = raw.transactions
+    cpu = time.process_time()
+    reader = adc.start_continuous(channels, rate, size=1 << 16)
+    samples = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < DURATION:
+        time.sleep(0.01)
+        timestamps, frames = reader.read()
+        samples += frames.size
+    seconds = time.perf_counter() - start
+    adc.stop_continuous()
+    report(label, adc, samples, seconds, time.process_time() - cpu, raw.transactions - transactions)
+
+
+def main():
+    with Simulation() as sim:
+        bus = sim.bus(1)
+        bus.attach(0x48, SimADS1115()).inputs = SineWaves(32767)
+        bus.attach(0x4B, SimADS7830()).inputs = SineWaves(255)
+
+        ads1115 = ADS1115IO(1, 0x48, data_rate=860)
+        single("ads1115 analog_read, 1 ch", ads1115, [0], bus)
+        continuous("ads1115 continuous, 1 ch", ads1115, [0], bus)
+        single("ads1115 analog_read, 4 ch", ads1115, range(4), bus)
+        continuous("ads1115 continuous, 4 ch", ads1115, range(4), bus)
+
+        ads7830 = ADS7830IO(1, 0x4B)
+        single("ads7830 analog_read, 1 ch", ads7830, [0], bus)
+        continuous("ads7830 continuous, 1 ch", ads7830, [0], bus)
+        continuous("ads7830 continuous, 1 ch, 20k", ads7830, [0], bus, 20000)
+        single("ads7830 analog_read, 8 ch", ads7830, range(8), bus)
+        continuous("ads7830 continuous, 8 ch", ads7830, range(8), bus)
+
+        ads1115.close()
+        ads7830.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measures the event loop latency while another task performs sustained
+I/O on a slow fake interface, calling it directly (blocking the loop) and
+through :py:class:`pywiring.aio.AsyncIO`.
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pywiring import IOBase
+from pywiring.aio import AsyncIO
+
+OPS = 500
+OP_TIME = 0.0005
+TICK = 0.001
+
+
+class SlowIO(IOBase):
+    """
+    Fake interface whose operations block for :py:data:`OP_TIME` seconds,
+    roughly like a byte transaction on a 100 kHz I2C bus.
+    """
+
+    number_of_pins = 8
+
+    def __init__(self):
+        self._port = 0
+
+    def read_port(self):
+        time.sleep(OP_TIME)
+        return self._port
+
+    def modify_port(self, set_mask, clear_mask):
+        time.sleep(OP_TIME)
+        self._port = (self._port & ~clear_mask) | set_mask
+
+
+async def ticker(lags, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+
+async def blocking_workload(io):
+    for i in range(OPS):
+        io.modify_port(1 << (i % 8), 0xFF)
+        io.read_port()
+        await asyncio.sleep(0)
+
+
+async def async_workload(io):
+    aio = AsyncIO(io)
+    for i in range(OPS):
+        await aio.modify_port(1 << (i % 8), 0xFF)
+        await aio.read_port()
+    await aio.close()
+
+
+async def measure(label, workload):
+    lags = []
+    stop = asyncio.Event()
+    tick_task = asyncio.ensure_future(ticker(lags, stop))
+    start = time.perf_counter()
+    await workload(SlowIO())
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await tick_task
+    lags.sort()
+    print("{0:<10} {1:6.0f} ops/s  loop lag p50 {2:6.3f} ms  p99 {3:6.3f} ms  max {4:6.3f} ms".format(
+        label, 2 * OPS / elapsed, lags[len(lags) // 2] * 1e3,
+        lags[int(len(lags) * 0.99)] * 1e3, lags[-1] * 1e3))
+
+
+def main():
+    asyncio.run(measure("blocking", blocking_workload))
+    asyncio.run(measure("AsyncIO", async_workload))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Shifts bytes out to a 74HC595 chain wired to a simulated PCF8574 and
+parallel port: with one digital_write per pin change, as compiled
+sequences, and as compiled sequences served from the payload cache.
+Reports bytes per second (CPU time only: the simulation doesn't model the
+bus speed) and hardware transactions per byte.
+"""
+
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pywiring.i2c import PCF8574IO
+from pywiring.parport import ParallelIO
+from pywiring.bitbang import ShiftOut
+from pywiring.sim import Simulation, SimPCF8574
+
+PAYLOAD = 8
+ROUNDS = 200
+
+
+def naive(io, data, clock, latch, payload):
+    io.digital_write(latch, False)
+    for byte in payload:
+        for i in range(8):
+            io.digital_write(data, (byte >> (7 - i)) & 1)
+            io.digital_write(clock, True)
+            io.digital_write(clock, False)
+    io.digital_write(latch, True)
+
+
+def run(label, io, raw, pins):
+    shift = ShiftOut(io, *pins, cache_size=ROUNDS)
+    payloads = [bytes((i * 7 + j) & 0xFF for j in range(PAYLOAD)) for i in range(ROUNDS)]
+    methods = [
+        ("digital_write", lambda payload: naive(io, pins[0], pins[1], pins[2], payload)),
+        ("compiled", shift.write),
+        ("cached", shift.write),
+    ]
+    for name, write in methods:
+        if name == "compiled":
+            shift._cache.clear()
+        transactions = raw.transactions
+        start = time.perf_counter()
+        for payload in payloads:
+            write(payload)
+        seconds = time.perf_counter() - start
+        count = ROUNDS * PAYLOAD
+        print("{0:<8} {1:<13} {2:9.0f} bytes/s  {3:6.2f} transactions/byte".format(
+            label, name, count / seconds, (raw.transactions - transactions) / float(count)))
+
+
+def main():
+    # Pin modes can't be set on the parallel port
+    warnings.simplefilter("ignore", RuntimeWarning)
+    with Simulation() as sim:
+        sim.bus(1).attach(0x20, SimPCF8574())
+        pcf = PCF8574IO(1, 0x20)
+        run("pcf8574", pcf, sim.bus(1), (0, 1, 2))
+        lpt = ParallelIO(0)
+        run("parport", lpt, sim.port(0), (1, 2, 3))
+        pcf.close()
+        lpt.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compares sampling a port by appending digital_read_bulk() dicts to a list
+with IOBase.capture(), and reports the throughput of the streaming mode.
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pywiring.i2c import PCF8574IO
+from pywiring.sim import Simulation, SimPCF8574
+
+RATE = 50000
+DURATION = 0.5
+
+
+def dict_loop(io):
+    samples = []
+    end = time.perf_counter() + DURATION
+    while time.perf_counter() < end:
+        samples.append(io.digital_read_bulk(*range(8)))
+    return len(samples)
+
+
+def report(label, count, peak):
+    print("{0:<12} {1:8.0f} samples/s  {2:8.1f} B/sample".format(label, count / DURATION, peak / max(count, 1)))
+
+
+def main():
+    with Simulation() as sim:
+        sim.bus(1).attach(0x20, SimPCF8574())
+        io = PCF8574IO(1, 0x20)
+        # Imports NumPy and pywiring.capture before measuring allocations
+        io.capture(rate=RATE, duration=0.01)
+
+        tracemalloc.start()
+        count = dict_loop(io)
+        report("dict loop", count, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        result = io.capture(rate=RATE, duration=DURATION)
+        report("capture", len(result.samples), tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        print("capture dropped {0} samples at {1} Hz".format(result.dropped, RATE))
+
+        with io.capture_stream(rate=RATE, chunk_size=4096) as chunks:
+            received = 0
+            start = time.perf_counter()
+            for timestamps, samples in chunks:
+                received += len(samples)
+                if time.perf_counter() - start > DURATION:
+                    break
+            print("stream       {0:8.0f} samples/s  dropped {1}  overruns {2}".format(
+                received / (time.perf_counter() - start), chunks.dropped, chunks.overruns))
+        io.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Writes all the pins of 64 relays driven by eight PCF8574 spread over 1, 2
+and 4 I2C buses, through a CompositeIO: pin by pin, with one bulk write,
+and with the same bulk write split by hand and sent to the devices one
+after the other.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pywiring.i2c import PCF8574IO
+from pywiring.composite import CompositeIO
+from pywiring.sim import STANDARD_MODE, Simulation, SimPCF8574
+
+DEVICES = 8
+N = 100
+
+
+def run(sim, buses):
+    for i in range(DEVICES):
+        sim.bus(1 + i % buses).attach(0x20 + i, SimPCF8574())
+    composite = CompositeIO([PCF8574IO(1 + i % buses, 0x20 + i) for i in range(DEVICES)])
+    composite.port_mode(False)
+    pins = composite.number_of_pins
+    patterns = [0x5555555555555555, 0xAAAAAAAAAAAAAAAA]
+
+    start = time.perf_counter()
+    for i in range(N // 10):
+        for pin in range(pins):
+            composite.digital_write(pin, (patterns[i % 2] >> pin) & 1)
+    per_pin = (time.perf_counter() - start) / (N // 10)
+
+    start = time.perf_counter()
+    for i in range(N):
+        mask = patterns[i % 2]
+        for io, offset, device_pins in composite.devices:
+            io.write_port((mask >> offset) & device_pins)
+    serial = (time.perf_counter() - start) / N
+
+    start = time.perf_counter()
+    for i in range(N):
+        composite.write_port(patterns[i % 2])
+    bulk = (time.perf_counter() - start) / N
+
+    print("{0} bus(es): pin by pin {1:7.2f} ms  serial {2:5.2f} ms  bulk {3:5.2f} ms  ({4:.1f}x serial)".format(
+        buses, per_pin * 1e3, serial * 1e3, bulk * 1e3, serial / bulk))
+    composite.close()
+
+
+def main():
+    # A byte write takes 200 us
+    with Simulation(i2c_frequency=STANDARD_MODE) as sim:
+        for buses in (1, 2, 4):
+            run(sim, buses)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Feeds synthetic quadrature and pulse edge streams to a RasPiIO through
+the simulated RPi.GPIO and compares a per-edge Python decoder callback with
+the counters of pywiring.counter: CPU time spent per edge in the event
+callback, CPU time per edge of the batch decoding, and the resulting
+position and missed-edge counts, also when edges are lost. The "no-op"
+line is the cost of the simulation itself, with a callback doing nothing.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pywiring.raspi import RasPiIO
+from pywiring.counter import QuadratureCounter, PulseCounter
+from pywiring.sim import Simulation
+
+A, B, PULSE = 17, 27, 22
+EDGES = 200000
+BATCH = 4096
+
+
+def quadrature_edges(steps):
+    """
+    Returns the (pin, level) changes of an encoder moving forwards by
+    :py:data:`steps` counts, starting with both pins low.
+    """
+    sequence = ((0, 0), (1, 0), (1, 1), (0, 1))
+    edges = []
+    for position in range(steps):
+        state, new = sequence[position % 4], sequence[(position + 1) % 4]
+        if new[0] != state[0]:
+            edges.append((A, new[0]))
+        else:
+            edges.append((B, new[1]))
+    return edges
+
+
+def reset(gpio):
+    # Both pins low, without edges
+    gpio.inject([(A, 0), (B, 0)], lost=(0, 1))
+
+
+class NaiveDecoder(object):
+    """
+    What the counters replace: a decoder run in every edge callback.
+    """
+
+    TRANSITIONS = {(0, 2): 1, (2, 3): 1, (3, 1): 1, (1, 0): 1,
+                   (2, 0): -1, (3, 2): -1, (1, 3): -1, (0, 1): -1}
+
+    def __init__(self, io):
+        self.io = io
+        self.position = 0
+        self.missed = 0
+        self.state = 0
+        io.pin_mode_bulk({A: (True,), B: (True,)})
+        io.enable_event_detect(A, "BOTH", self.edge)
+        io.enable_event_detect(B, "BOTH", self.edge)
+
+    def edge(self, pin):
+        state = self.io.digital_read(A) << 1 | self.io.digital_read(B)
+        step = self.TRANSITIONS.get((self.state, state))
+        if step is None:
+            self.missed += state != self.state
+        else:
+            self.position += step
+        self.state = state
+
+    def close(self):
+        self.io.disable_event_detect(A)
+        self.io.disable_event_detect(B)
+
+
+def feed(gpio, edges, counter=None, lost=()):
+    """
+    Injects the edges in batches, decoding after each one; the callbacks of
+    the edges whose index is in :py:data:`lost` aren't called. Returns the
+    CPU time spent in the callbacks and in the decoding.
+    """
+    inject_time = decode_time = 0.0
+    for i in range(0, len(edges), BATCH):
+        batch_lost = {index - i for index in lost if i <= index < i + BATCH}
+        start = time.process_time()
+        gpio.inject(edges[i:i + BATCH], batch_lost)
+        inject_time += time.process_time() - start
+        if counter is not None:
+            start = time.process_time()
+            counter.update()
+            decode_time += time.process_time() - start
+    return inject_time, decode_time
+
+
+def report(label, count, inject_time, decode_time, position, missed):
+    print("{0:<25} callback {1:6.2f} us/edge  decode {2:6.3f} us/edge  position {3:7d}  missed {4}".format(
+        label, inject_time / count * 1e6, decode_time / count * 1e6, position, missed))
+
+
+def main():
+    with Simulation() as sim:
+        io = RasPiIO()
+        gpio = sim.gpio
+        edges = quadrature_edges(EDGES)
+        io.pin_mode_bulk({A: (True,), B: (True,)})
+        for pin in (A, B):
+            io.enable_event_detect(pin, "BOTH", lambda pin: None)
+        inject_time, _ = feed(gpio, edges)
+        report("no-op", len(edges), inject_time, 0, 0, 0)
+        for pin in (A, B):
+            io.disable_event_detect(pin)
+
+        # One edge in a thousand lost in the second run
+        for label, lost in (("quadrature", ()), ("quadrature, lossy", set(range(500, EDGES, 1000)))):
+            reset(gpio)
+            naive = NaiveDecoder(io)
+            inject_time, _ = feed(gpio, edges, lost=lost)
+            report("naive " + label, len(edges), inject_time, 0, naive.position, naive.missed)
+            naive.close()
+
+            reset(gpio)
+            with QuadratureCounter(io, A, B) as counter:
+                inject_time, decode_time = feed(gpio, edges, counter, lost)
+                report("counter " + label, len(edges), inject_time, decode_time, counter.position,
+                       counter.missed)
+
+        pulses = [(PULSE, i & 1) for i in range(1, EDGES + 1)]
+        with PulseCounter(io, PULSE) as counter:
+            inject_time, decode_time = feed(gpio, pulses, counter)
+            report("counter pulses", EDGES // 2, inject_time, decode_time, counter.position, counter.missed)
+
+        # A ring too small for the batches: the overruns are reported
+        reset(gpio)
+        with QuadratureCounter(io, A, B, size=1024) as counter:
+            inject_time, decode_time = feed(gpio, edges, counter)
+            report("counter overrun", len(edges), inject_time, decode_time, counter.position, counter.missed)
+        io.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Reports the CPU cost per tick and the adaptive interval of the shared
+event poller watching several PCF8574IO devices, idle and while their
+inputs toggle.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pywiring.events import get_poller
+from pywiring.i2c import PCF8574IO
+from pywiring.sim import Simulation, SimPCF8574
+
+DEVICES = 8
+
+
+def report(label, poller, edges):
+    stats = poller.stats()
+    print("{0:<8} ticks {1:5d}  interval {2:6.1f} ms  cpu/tick {3:6.1f} us  wall/tick {4:6.1f} us  edges {5}".format(
+        label, stats["ticks"], stats["interval"] * 1e3, stats["avg_tick_cpu"] * 1e6,
+        stats["avg_tick_time"] * 1e6, len(edges)))
+
+
+def main():
+    with Simulation() as sim:
+        devices = [sim.bus(1).attach(0x20 + i, SimPCF8574()) for i in range(DEVICES)]
+        ios = [PCF8574IO(1, 0x20 + i) for i in range(DEVICES)]
+        edges = []
+        for io in ios:
+            for pin in range(8):
+                io.enable_event_detect(pin, "BOTH", edges.append)
+        poller = get_poller()
+
+        time.sleep(1)
+        report("idle", poller, edges)
+
+        for i in range(200):
+            devices[i % DEVICES].inputs = i & 0xFF
+            time.sleep(0.005)
+        report("active", poller, edges)
+
+        for io in ios:
+            io.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compares 16-pin bulk operations on a PCF8575, an MCP23017 and two PCF8574
+joined by a CompositeIO, on a simulated 100 kHz bus where every
+transaction costs 9 bit times per byte, address included.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pywiring.composite import CompositeIO
+from pywiring.i2c import PCF8574IO, PCF8575IO, MCP23017IO
+from pywiring.sim import STANDARD_MODE, Simulation, SimMCP23017, SimPCF8574, SimPCF8575
+
+N = 200
+
+
+def measure(io, raw, func):
+    transactions = raw.transactions
+    start = time.perf_counter()
+    for i in range(N):
+        func(i)
+    seconds = (time.perf_counter() - start) / N
+    return seconds, (raw.transactions - transactions) / float(N)
+
+
+def run(label, io, raw):
+    # Pins 0 to 11 are outputs, 12 to 15 inputs
+    modes = {pin: (pin >= 12, False) for pin in range(16)}
+    io.pin_mode_bulk(modes)
+    operations = [
+        ("digital_write_bulk", lambda i: io.digital_write_bulk({pin: (pin + i) & 1 for pin in range(12)})),
+        ("write_port", lambda i: io.write_port(0x0FFF if i & 1 else 0x0000)),
+        ("read_port", lambda i: io.read_port()),
+        ("pin_mode_bulk, same", lambda i: io.pin_mode_bulk(modes)),
+    ]
+    for name, func in operations:
+        seconds, transactions = measure(io, raw, func)
+        print("{0:<12} {1:<20} {2:6.3f} ms  {3:4.1f} transactions".format(label, name, seconds * 1e3, transactions))
+
+
+def main():
+    with Simulation(i2c_frequency=STANDARD_MODE) as sim:
+        bus = sim.bus(1)
+        bus.attach(0x20, SimPCF8575())
+        bus.attach(0x21, SimMCP23017())
+        bus.attach(0x22, SimPCF8574())
+        bus.attach(0x23, SimPCF8574())
+
+        run("PCF8575", PCF8575IO(1, 0x20), bus)
+        run("MCP23017", MCP23017IO(1, 0x21), bus)
+        run("2x PCF8574", CompositeIO([PCF8574IO(1, 0x22), PCF8574IO(1, 0x23)]), bus)
+
+
+if __name__ == "__main__":
+    main()
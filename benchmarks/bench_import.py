@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measures the startup cost of importing PyWiring and of resolving a
+backend through the registry, each in a fresh interpreter.
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = 20
+
+CASES = (
+    ("import pywiring", "import pywiring"),
+    ("import pywiring.i2c", "import pywiring.i2c"),
+    ("get_backend('pcf8574')", "import pywiring; pywiring.get_backend('pcf8574')"),
+)
+
+
+def run(code):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    best = None
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        subprocess.check_call([sys.executable, "-c", code], env=env)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    baseline = run("pass")
+    print("{0:<28} {1:7.2f} ms".format("python -c pass", baseline * 1e3))
+    for label, code in CASES:
+        elapsed = run(code)
+        print("{0:<28} {1:7.2f} ms (+{2:.2f} ms)".format(label, elapsed * 1e3, (elapsed - baseline) * 1e3))
+
+
+if __name__ == "__main__":
+    main()
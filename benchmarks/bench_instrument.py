@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measures the cost of the instrumentation layer on read_port and
+modify_port: never instrumented, instrumented, and instrumented then
+uninstrumented (which must cost the same as never instrumented). The
+cases are measured on separate interfaces, in turn, with a second
+never-instrumented interface as a control: the spread of its difference
+with the first is the noise of the measurement.
+
+Each round measures new interfaces; the median, minimum and maximum
+difference over the rounds are reported.
+"""
+
+import itertools
+import os
+import statistics
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pywiring import instrument
+from pywiring.i2c import PCF8574IO
+from pywiring.parport import ParallelIO
+from pywiring.raspi import RasPiIO
+from pywiring.sim import Simulation, SimPCF8574
+
+N = 20000
+REPEAT = 5
+ROUNDS = 9
+
+CASES = ("never", "control", "instrumented", "uninstrumented")
+
+
+def per_call(funcs):
+    # Runs the candidates in turn, so that they all see the same machine load
+    best = [float("inf")] * len(funcs)
+    for _ in range(REPEAT):
+        for i, func in enumerate(funcs):
+            best[i] = min(best[i], timeit.timeit(func, number=N))
+    return [seconds / N * 1e6 for seconds in best]
+
+
+def summary(values):
+    return "{0:+6.1f}% [{1:+6.1f}, {2:+6.1f}]".format(statistics.median(values), min(values), max(values))
+
+
+def measure(name, make):
+    # case -> method -> [difference with never, in percent, per round]
+    results = {case: {"read_port": [], "modify_port": []} for case in CASES}
+    for _ in range(ROUNDS):
+        ios = [make() for _ in CASES]
+        instrument.instrument(ios[2])
+        instrument.instrument(ios[3])
+        instrument.uninstrument(ios[3])
+
+        reads = per_call([io.read_port for io in ios])
+        writes = per_call([lambda io=io: io.modify_port(0x50, 0xA0) for io in ios])
+        for i, case in enumerate(CASES):
+            results[case]["read_port"].append((reads[i] / reads[0] - 1) * 100)
+            results[case]["modify_port"].append((writes[i] / writes[0] - 1) * 100)
+
+        device = instrument.snapshot()[instrument.instrument(ios[2]).label]
+        instrument.uninstrument(ios[2])
+        for io in ios:
+            io.close()
+
+    for case in CASES[1:]:
+        print("{0:<11} {1:<15} read_port {2}  modify_port {3}".format(
+            name, case, summary(results[case]["read_port"]), summary(results[case]["modify_port"])))
+    latency = device["latency"]
+    print("{0:<11} {1} transactions, p50 {2:.2f} us, p99 {3:.2f} us, avg_exec_time {4:.5f} ms".format(
+        name, device["transactions"], latency["p50"] * 1e6, latency["p99"] * 1e6, device["avg_exec_time"]))
+
+
+def make_pcf(sim, addresses=itertools.count(0x20)):
+    address = next(addresses)
+    sim.bus(1).attach(address, SimPCF8574())
+    io = PCF8574IO(1, address)
+    io.pin_mode_bulk({i: (i < 4,) for i in range(8)})
+    return io
+
+
+def make_rpi():
+    io = RasPiIO()
+    for pin in range(8):
+        io.pin_mode(pin, pin < 4)
+    return io
+
+
+def main():
+    with Simulation() as sim:
+        measure("PCF8574IO", lambda: make_pcf(sim))
+        measure("ParallelIO", ParallelIO)
+        measure("RasPiIO", make_rpi)
+
+
+if __name__ == "__main__":
+    main()
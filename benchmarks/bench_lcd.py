@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measures full-screen and partial updates per second of the HD44780
+driver on a PCF8574 backpack, against a simulated bus that counts
+transactions and models the time a 100 kHz transfer takes. The naive
+approach, toggling E and the data pins with digital_write, is shown for
+comparison.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pywiring.i2c import LCDBackpack
+from pywiring.lcd import HD44780
+from pywiring.sim import STANDARD_MODE, Simulation, SimPCF8574
+
+UPDATES = 50
+
+
+def naive_char(io, value):
+    for nibble in (value >> 4, value & 0x0F):
+        io.digital_write(0, True)
+        for i in range(4):
+            io.digital_write(4 + i, (nibble >> i) & 1)
+        io.digital_write(2, True)
+        io.digital_write(2, False)
+
+
+def run(label, lcd, bus, update):
+    bus.reset_stats()
+    for i in range(UPDATES):
+        update(lcd, i)
+    print("{0:<22} {1:6.1f} transactions/update  {2:7.1f} updates/s".format(
+        label, bus.transactions / float(UPDATES), UPDATES / bus.busy_time))
+
+
+def full(lcd, i):
+    for row in range(lcd.rows):
+        lcd.set_cursor(0, row)
+        lcd.write(chr(0x41 + (i + row) % 26) * lcd.cols)
+    lcd.refresh()
+
+
+def partial(lcd, i):
+    lcd.set_cursor(12, 1)
+    lcd.write("{0:4d}".format(i))
+    lcd.refresh()
+
+
+def naive_full(lcd, i):
+    for row in range(lcd.rows):
+        for col in range(lcd.cols):
+            naive_char(lcd.io, 0x41 + (i + row) % 26)
+
+
+def main():
+    # The bus time is only added up
+    with Simulation(i2c_frequency=STANDARD_MODE, realtime=False) as sim:
+        bus = sim.bus(1)
+        bus.attach(0x27, SimPCF8574())
+        backpack = LCDBackpack(1, 0x27)
+        lcd = HD44780(backpack, 16, 2)
+        run("full screen", lcd, bus, full)
+        run("partial (4 cells)", lcd, bus, partial)
+        run("naive full screen", lcd, bus, naive_full)
+        backpack.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Counts the ioctls issued by ParallelIO operations against a simulated
+parallel port.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pywiring.parport import ParallelIO
+from pywiring.sim import Simulation
+
+
+def main():
+    with Simulation() as sim:
+        io = ParallelIO()
+        lpt = sim.port(0)
+        cases = (
+            ("digital_write_bulk({0..11})", lambda i: io.digital_write_bulk({pin: (pin + i) % 2 for pin in range(12)})),
+            ("digital_write_bulk({1..8})", lambda i: io.digital_write_bulk({pin: (pin + i) % 2 for pin in range(1, 9)})),
+            ("digital_write(3)", lambda i: io.digital_write(3, i % 2)),
+            ("digital_write(3), unchanged", lambda i: io.digital_write(3, True)),
+            ("digital_read_bulk(0..4)", lambda i: io.digital_read_bulk(*range(5))),
+            ("read_port()", lambda i: io.read_port()),
+        )
+        for label, func in cases:
+            before = lpt.transactions
+            for i in range(100):
+                func(i)
+            print("{0:<30} {1:4.1f} ioctls".format(label, (lpt.transactions - before) / 100.0))
+        io.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compares writing a waveform state by state with IOBase.play(), counting
+the transactions issued and the update rate on a simulated I2C bus that
+models the time a 100 kHz transfer takes (9 bit times per byte, plus
+start/stop).
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pywiring.i2c import PCF8574IO
+from pywiring.parport import ParallelIO
+from pywiring.sim import STANDARD_MODE, Simulation, SimPCF8574
+
+STATES = [i & 0xFF for i in range(1024)]
+
+
+def i2c(sim, label, play):
+    bus = sim.bus(1)
+    io = PCF8574IO(1, 0x20)
+    io.port_mode(False)
+    bus.reset_stats()
+    start = time.perf_counter()
+    play(io)
+    cpu = time.perf_counter() - start
+    print("PCF8574IO  {0:<14} {1:5d} transactions  {2:8.0f} states/s on a 100 kHz bus  ({3:.1f} us CPU/state)".format(
+        label, bus.transactions, len(STATES) / bus.busy_time, cpu / len(STATES) * 1e6))
+    io.close()
+
+
+def parport(sim, label, play):
+    port = sim.port(0)
+    io = ParallelIO()
+    port.reset_stats()
+    start = time.perf_counter()
+    play(io)
+    elapsed = time.perf_counter() - start
+    print("ParallelIO {0:<14} {1:5d} ioctls        {2:8.0f} states/s".format(
+        label, port.transactions, len(STATES) / elapsed))
+    io.close()
+
+
+def per_state(io):
+    for state in STATES:
+        io.write_port(state)
+
+
+def main():
+    # The I2C bus time is only added up
+    with Simulation(i2c_frequency=STANDARD_MODE, realtime=False) as sim:
+        sim.bus(1).attach(0x20, SimPCF8574())
+        i2c(sim, "write_port", per_state)
+        i2c(sim, "play", lambda io: io.play(STATES))
+        parport(sim, "write_port", lambda io: per_state(io))
+        parport(sim, "play", lambda io: io.play([state << 1 for state in STATES], mask=0x1FE))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compares the dict-based bulk methods with the integer bitmask port API
+on every backend, reporting time and allocated memory per call.
+"""
+
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pywiring.i2c import PCF8574IO
+from pywiring.parport import ParallelIO
+from pywiring.raspi import RasPiIO
+from pywiring.sim import Simulation, SimPCF8574
+
+N = 20000
+
+
+def measure(label, func):
+    seconds = timeit.timeit(func, number=N)
+    tracemalloc.start()
+    func()
+    tracemalloc.reset_peak()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print("  {0:<36} {1:8.2f} us/call {2:6d} B peak".format(label, seconds / N * 1e6, peak))
+
+
+def main():
+    with Simulation() as sim:
+        sim.bus(1).attach(0x20, SimPCF8574())
+        pcf = PCF8574IO(1, 0x20)
+        pcf.pin_mode_bulk({i: (i < 4,) for i in range(8)})
+        lpt = ParallelIO()
+        rpi = RasPiIO()
+        for pin in range(8):
+            rpi.pin_mode(pin, pin < 4)
+
+        for name, io in (("PCF8574IO", pcf), ("ParallelIO", lpt), ("RasPiIO", rpi)):
+            print(name)
+            measure("digital_read_bulk(0..7)", lambda: io.digital_read_bulk(0, 1, 2, 3, 4, 5, 6, 7))
+            measure("read_port()", io.read_port)
+            measure("digital_write_bulk({4..7})", lambda: io.digital_write_bulk({4: 1, 5: 0, 6: 1, 7: 0}))
+            measure("modify_port(0x50, 0xA0)", lambda: io.modify_port(0x50, 0xA0))
+
+
+if __name__ == "__main__":
+    main()
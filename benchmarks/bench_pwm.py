@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Drives eight dimmed channels on a Raspberry Pi and on a PCF8574 and
+reports the CPU usage, the number of port writes per edge and the edge
+jitter of the PWM scheduler, sleeping and busy-waiting before each edge,
+compared with one sleeping thread per channel.
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pywiring.i2c import PCF8574IO
+from pywiring.pwm import PWMScheduler
+from pywiring.raspi import RasPiIO
+from pywiring.sim import Simulation, SimPCF8574
+
+CHANNELS = 8
+FREQUENCY = 100
+DURATION = 2.0
+SPIN = 0.0002
+
+
+def thread_per_channel(io, pins, frequency, duration):
+    # Each channel toggles its own pin from its own thread
+    period = 1.0 / frequency
+    stop = time.perf_counter() + duration
+    jitters = []
+
+    def run(pin, duty):
+        deadline = time.perf_counter()
+        while deadline < stop:
+            for level, length in ((True, duty * period), (False, (1 - duty) * period)):
+                delay = deadline - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                io.digital_write(pin, level)
+                jitters.append(time.perf_counter() - deadline)
+                deadline += length
+
+    threads = [threading.Thread(target=run, args=(pin, (i + 1) / (len(pins) + 1.0)))
+               for i, pin in enumerate(pins)]
+    start_cpu = time.process_time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    cpu = (time.process_time() - start_cpu) / duration
+    return cpu, len(jitters), sum(jitters) / len(jitters), max(jitters)
+
+
+def scheduled(io, pins, frequency, duration, spin):
+    scheduler = PWMScheduler(spin)
+    start_cpu = time.process_time()
+    for i, pin in enumerate(pins):
+        scheduler.set(io, pin, frequency, (i + 1) / (len(pins) + 1.0))
+    time.sleep(duration)
+    stats = scheduler.stats()
+    cpu = (time.process_time() - start_cpu) / duration
+    scheduler.remove_io(io)
+    return cpu, stats
+
+
+def main():
+    with Simulation() as sim:
+        sim.bus(1).attach(0x20, SimPCF8574())
+        raspi = RasPiIO()
+        pcf = PCF8574IO(1, 0x20)
+        pcf.port_mode(False)
+        for pin in range(CHANNELS):
+            raspi.pin_mode(pin, False)
+
+        for label, io in (("raspi", raspi), ("pcf8574", pcf)):
+            pins = list(range(CHANNELS))
+            cpu, edges, avg, worst = thread_per_channel(io, pins, FREQUENCY, DURATION)
+            print("{0:<8} threads    cpu {1:5.1f}%  edges {2:6d}  writes/edge 1.00  jitter avg {3:7.1f} us  max {4:7.1f} us".format(
+                label, cpu * 100, edges, avg * 1e6, worst * 1e6))
+            for name, spin in (("scheduler", 0), ("spin", SPIN)):
+                cpu, stats = scheduled(io, pins, FREQUENCY, DURATION, spin)
+                print("{0:<8} {1:<10} cpu {2:5.1f}%  edges {3:6d}  writes/edge {4:4.2f}  jitter avg {5:7.1f} us  max {6:7.1f} us".format(
+                    label, name, cpu * 100, stats["edges"], stats["writes"] / float(stats["edges"] or 1),
+                    stats["avg_jitter"] * 1e6, stats["max_jitter"] * 1e6))
+
+        raspi.close()
+        pcf.close()
+
+
+if __name__ == "__main__":
+    main()
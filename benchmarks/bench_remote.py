@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measures RemoteIO over loopback TCP and a Unix socket, against a
+simulated PCF8574: round-trip latency of read_port, throughput of pipelined writes
+compared with waiting for every reply, and the round trip of a whole
+digital_write_bulk.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pywiring.i2c import PCF8574IO
+from pywiring.remote import IOServer, RemoteIO
+from pywiring.sim import Simulation, SimPCF8574
+
+N = 5000
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+
+def run(label, io):
+    io.pin_mode_bulk({i: (i < 4,) for i in range(8)})
+    latencies = []
+    for _ in range(N):
+        start = time.perf_counter()
+        io.read_port()
+        latencies.append(time.perf_counter() - start)
+    print("{0:<5} read_port round trip    p50 {1:6.1f} us  p99 {2:6.1f} us  {3:8.0f} ops/s".format(
+        label, percentile(latencies, 50) * 1e6, percentile(latencies, 99) * 1e6, N / sum(latencies)))
+
+    start = time.perf_counter()
+    for i in range(N):
+        io.modify_port(0x10 << (i & 3), 0xF0)
+        io.sync()
+    seconds = time.perf_counter() - start
+    print("{0:<5} modify_port, waiting   {1:8.0f} ops/s".format(label, N / seconds))
+
+    start = time.perf_counter()
+    for i in range(N):
+        io.modify_port(0x10 << (i & 3), 0xF0)
+    io.sync()
+    seconds = time.perf_counter() - start
+    print("{0:<5} modify_port, pipelined {1:8.0f} ops/s".format(label, N / seconds))
+
+    pins = {pin: pin & 1 for pin in range(4, 8)}
+    start = time.perf_counter()
+    for _ in range(N // 10):
+        io.digital_write_bulk(pins)
+        io.sync()
+    per_bulk = (time.perf_counter() - start) / (N // 10)
+    start = time.perf_counter()
+    for _ in range(N // 10):
+        for pin, level in pins.items():
+            io.digital_write(pin, level)
+            io.sync()
+    per_pins = (time.perf_counter() - start) / (N // 10)
+    print("{0:<5} 4-pin write: bulk {1:6.1f} us, pin by pin {2:6.1f} us".format(
+        label, per_bulk * 1e6, per_pins * 1e6))
+
+
+def main():
+    with Simulation() as sim:
+        sim.bus(1).attach(0x20, SimPCF8574())
+        pcf = PCF8574IO(1, 0x20)
+
+        server = IOServer(pcf, port=0)
+        server.start()
+        client = RemoteIO(port=server.address[1])
+        run("tcp", client)
+        client.close()
+        server.close()
+
+        path = os.path.join(tempfile.mkdtemp(), "pywiring.sock")
+        server = IOServer(pcf, path=path)
+        server.start()
+        client = RemoteIO(path=path)
+        run("unix", client)
+        client.close()
+        server.close()
+        os.rmdir(os.path.dirname(path))
+        pcf.close()
+
+
+if __name__ == "__main__":
+    main()
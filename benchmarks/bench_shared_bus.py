@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measures the throughput of N PCF8574IO devices sharing one I2C bus,
+driven by M threads.
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pywiring.i2c import PCF8574IO
+from pywiring.sim import Simulation, SimPCF8574
+
+OPS = 1000
+
+
+def run(sim, devices, threads):
+    for i in range(devices):
+        sim.bus(1).attach(0x20 + i, SimPCF8574())
+    ios = [PCF8574IO(1, 0x20 + i) for i in range(devices)]
+    for io in ios:
+        io.port_mode(False)
+
+    def worker(index):
+        for i in range(OPS):
+            io = ios[(index + i) % devices]
+            io.digital_write(index % 8, i % 2)
+            io.read_port()
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    fds = len({id(io._bus) for io in ios})
+    print("{0} devices x {1:2d} threads: {2:7.0f} ops/s, {3} bus handle(s)".format(
+        devices, threads, 2 * OPS * threads / elapsed, fds))
+    for io in ios:
+        io.close()
+
+
+def main():
+    # Every transaction takes 100 us
+    with Simulation(i2c_overhead=0.0001) as sim:
+        for devices in (1, 8):
+            for threads in (1, 4, 16):
+                run(sim, devices, threads)
+
+
+if __name__ == "__main__":
+    main()
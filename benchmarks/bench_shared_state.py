@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Several processes toggle their own pin of the same PCF8574, in three
+modes: private shadow registers (the default), a global file lock with a
+re-read of the port before every write (the usual workaround), and shared
+mode. Reports the aggregate write rate, the bus transactions per write and
+how many of the processes' pins ended up with the wrong level.
+
+The device is emulated by a byte in shared memory, so that all the
+processes see the same port. The emulated bus doesn't serialize the
+processes' transactions like a real one, so the private mode scales
+better than it would on hardware.
+"""
+
+import fcntl
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from multiprocessing import shared_memory
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pywiring.i2c import PCF8574IO
+from pywiring.sim import STANDARD_MODE, Simulation, SimDevice
+
+DEVICE = "pywiring-bench-device"
+ITERATIONS = 1000
+
+
+class SharedPCF8574(SimDevice):
+    """
+    PCF8574 whose port is the byte of the shared memory segment, written
+    and read as is.
+    """
+
+    def __init__(self):
+        self._shm = shared_memory.SharedMemory(DEVICE)
+
+    def write(self, data):
+        self._shm.buf[0] = data[-1]
+
+    def read(self, count):
+        return [self._shm.buf[0]] * count
+
+    def close(self):
+        self._shm.close()
+
+
+def worker(mode, pin, results):
+    # Byte transfers at 100 kHz
+    sim = Simulation(i2c_frequency=STANDARD_MODE)
+    device = sim.bus(1).attach(0x20, SharedPCF8574())
+
+    io = PCF8574IO(1, 0x20, shared=(mode == "shared"))
+    io.port_mode(False)
+    lockfd = os.open(os.path.join(tempfile.gettempdir(), "pywiring-bench.lock"), os.O_RDWR | os.O_CREAT)
+    raw = sim.bus(1)
+
+    start = time.perf_counter()
+    for i in range(ITERATIONS + 1):
+        # Ends high
+        high = i % 2 == 0
+        set_mask, clear_mask = (1 << pin, 0) if high else (0, 1 << pin)
+        if mode == "reread":
+            fcntl.flock(lockfd, fcntl.LOCK_EX)
+            io._shadow = io._bus.read_byte(io.address)
+            io.modify_port(set_mask, clear_mask)
+            fcntl.flock(lockfd, fcntl.LOCK_UN)
+        else:
+            io.modify_port(set_mask, clear_mask)
+    seconds = time.perf_counter() - start
+    results.put((seconds, raw.transactions))
+    io.close()
+    os.close(lockfd)
+    device.close()
+    sim.close()
+
+
+def run(mode, processes):
+    device = shared_memory.SharedMemory(DEVICE, create=True, size=1)
+    device.buf[0] = 0
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=worker, args=(mode, pin, results)) for pin in range(processes)]
+    for process in workers:
+        process.start()
+    stats = [results.get() for _ in workers]
+    for process in workers:
+        process.join()
+
+    wrong = sum(1 for pin in range(processes) if not (device.buf[0] >> pin) & 1)
+    writes = processes * (ITERATIONS + 1)
+    # Setup transactions: the initial read and port_mode's write
+    transactions = sum(count - 2 for _, count in stats)
+    print("{0:<7} {1} processes  {2:8.0f} writes/s  {3:4.2f} transactions/write  {4} wrong pins".format(
+        mode, processes, writes / max(seconds for seconds, _ in stats), transactions / float(writes), wrong))
+    device.close()
+    device.unlink()
+
+
+def reset_shared_state():
+    with Simulation() as sim:
+        sim.bus(1).attach(0x20, SimDevice())
+        state = PCF8574IO(1, 0x20, shared=True)
+        state._shared.unlink()
+        state.close()
+
+
+def main():
+    for processes in (1, 2, 4):
+        for mode in ("private", "reread", "shared"):
+            if mode == "shared":
+                reset_shared_state()
+            run(mode, processes)
+    reset_shared_state()
+
+
+if __name__ == "__main__":
+    main()
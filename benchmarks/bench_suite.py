@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Runs every IOBase method on every backend against the simulated hardware
+of pywiring.sim and reports, per method, operations per second, hardware
+transactions per operation, modeled bus time per operation, and the
+memory allocated per operation (the peak of what a call allocates, and
+what it leaves allocated). capture() and capture_stream() are left out:
+they run at a fixed rate.
+
+Without timing options the hardware takes no time, so the figures are
+PyWiring's own overhead, plus the cost of the simulated library calls. With --i2c-frequency (e.g. 100000 or 400000),
+--parport-access and --gpio-access, the modeled bus time is spent
+busy-waiting and included.
+
+The results can be saved as JSON with --json, and compared with a
+previous run with --compare, e.g. to compare two releases:
+
+    python benchmarks/bench_suite.py --json new.json --compare old.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pywiring.events import PolledEvents
+from pywiring.sim import Simulation, SimPCF8574
+
+ALLOC_CALLS = 200
+
+
+def make_backends(sim):
+    """
+    Returns (name, factory, outputs, inputs) for every backend.
+    """
+    from pywiring.i2c import PCF8574IO
+    from pywiring.parport import ParallelIO
+    from pywiring.raspi import RasPiIO
+
+    sim.bus(1).attach(0x20, SimPCF8574())
+    return [
+        ("pcf8574", lambda: PCF8574IO(1, 0x20), (0, 1, 2, 3), (4, 5, 6, 7)),
+        ("parport", lambda: ParallelIO(0), (5, 6, 7, 8), (0, 1, 2, 3)),
+        ("raspi", lambda: RasPiIO(), (5, 6, 13, 19), (17, 22, 23, 27)),
+    ]
+
+
+def make_operations(io, outputs, inputs):
+    """
+    Returns (method, function) pairs, each function running the method
+    once; its argument is the iteration number.
+    """
+    out = outputs[0]
+    inp = inputs[0]
+    out_mask = sum(1 << pin for pin in outputs)
+    states = [(i * 0x55) & out_mask for i in range(16)]
+
+    def batch(i):
+        with io.batch():
+            for pin in outputs:
+                io.digital_write(pin, i & 1)
+
+    def event_detect(i):
+        io.enable_event_detect(inp, "BOTH")
+        io.add_event_callback(inp, lambda pin: None)
+        io.disable_event_detect(inp)
+
+    operations = [
+        ("get_pin_modes", lambda i: io.get_pin_modes()),
+        ("pin_mode", lambda i: io.pin_mode(out, False)),
+        ("pin_mode_bulk", lambda i: io.pin_mode_bulk(dict.fromkeys(outputs, (False,)))),
+        ("port_mode", lambda i: io.port_mode(False)),
+        ("digital_read", lambda i: io.digital_read(inp)),
+        ("digital_read_bulk", lambda i: io.digital_read_bulk(*inputs)),
+        ("read_port", lambda i: io.read_port()),
+        ("digital_write", lambda i: io.digital_write(out, i & 1)),
+        ("digital_write_bulk", lambda i: io.digital_write_bulk(dict.fromkeys(outputs, i & 1))),
+        ("write_port", lambda i: io.write_port(out_mask if i & 1 else 0)),
+        ("modify_port", lambda i: io.modify_port(out_mask, 0) if i & 1 else io.modify_port(0, out_mask)),
+        ("play", lambda i: io.play(states, out_mask)),
+        ("batch", batch),
+        ("analog_read", lambda i: io.analog_read(inp)),
+        ("analog_write", lambda i: io.analog_write(out, 255 if i & 1 else 0)),
+    ]
+    # Polled backends would start the shared poller thread, whose bus
+    # reads would be counted as the method's
+    if not isinstance(io, PolledEvents):
+        operations += [
+            ("enable_event_detect", event_detect),
+            ("event_detected", lambda i: io.event_detected(inp)),
+        ]
+    return operations
+
+
+def transactions(sim):
+    stats = sim.stats().values()
+    return sum(s["transactions"] for s in stats), sum(s["busy_time"] for s in stats)
+
+
+def measure(sim, func, duration):
+    for i in range(10):
+        func(i)
+
+    sim.reset_stats()
+    count = 0
+    clock = time.perf_counter
+    start = clock()
+    elapsed = 0.0
+    while elapsed < duration:
+        for i in range(count, count + 64):
+            func(i)
+        count += 64
+        elapsed = clock() - start
+    total_transactions, busy_time = transactions(sim)
+
+    tracemalloc.start()
+    peak_total = 0
+    before_all = tracemalloc.get_traced_memory()[0]
+    for i in range(ALLOC_CALLS):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        func(i)
+        peak_total += tracemalloc.get_traced_memory()[1] - before
+    retained = tracemalloc.get_traced_memory()[0] - before_all
+    tracemalloc.stop()
+
+    return {
+        "ops_per_sec": count / elapsed,
+        "us_per_op": elapsed / count * 1e6,
+        "transactions_per_op": total_transactions / float(count),
+        "bus_us_per_op": busy_time / count * 1e6,
+        "alloc_bytes_per_op": peak_total / float(ALLOC_CALLS),
+        "retained_bytes_per_op": retained / float(ALLOC_CALLS),
+    }
+
+
+def run_backend(sim, name, factory, outputs, inputs, duration, methods):
+    modes = dict([(pin, (False,)) for pin in outputs] + [(pin, (True,)) for pin in inputs])
+    results = {}
+    io = factory()
+    # Each method runs on a new interface, so that pin_mode and port_mode
+    # don't affect the others
+    for method, _ in make_operations(io, outputs, inputs):
+        if methods and method not in methods:
+            continue
+        io.close()
+        io = factory()
+        io.pin_mode_bulk(modes)
+        func = dict(make_operations(io, outputs, inputs))[method]
+        try:
+            results[method] = measure(sim, func, duration)
+        except NotImplementedError:
+            results[method] = {"error": "NotImplementedError"}
+    io.close()
+
+    if not methods or "close" in methods:
+        results["close"] = measure(sim, lambda i: factory().close(), duration)
+        results["close"]["note"] = "includes creating the interface"
+    return {
+        "class": type(io).__name__,
+        "avg_exec_time": type(io).avg_exec_time,
+        "methods": results,
+    }
+
+
+def print_results(results):
+    print("{0:<9} {1:<20} {2:>11} {3:>9} {4:>8} {5:>9} {6:>9} {7:>9}".format(
+        "backend", "method", "ops/s", "us/op", "trans/op", "bus us/op", "alloc B", "kept B"))
+    for backend, data in results.items():
+        for method, stats in data["methods"].items():
+            if "error" in stats:
+                print("{0:<9} {1:<20} {2}".format(backend, method, stats["error"]))
+                continue
+            print("{0:<9} {1:<20} {2:11.0f} {3:9.2f} {4:8.2f} {5:9.1f} {6:9.0f} {7:9.1f}".format(
+                backend, method, stats["ops_per_sec"], stats["us_per_op"], stats["transactions_per_op"],
+                stats["bus_us_per_op"], stats["alloc_bytes_per_op"], stats["retained_bytes_per_op"]))
+
+
+def print_comparison(results, baseline):
+    print()
+    print("Compared with {0} ({1}):".format(baseline.get("label") or "baseline", baseline.get("date")))
+    print("{0:<9} {1:<20} {2:>10} {3:>10} {4:>12}".format("backend", "method", "ops/s", "trans/op", "alloc B/op"))
+    for backend, data in results.items():
+        old_methods = baseline["results"].get(backend, {}).get("methods", {})
+        for method, stats in data["methods"].items():
+            old = old_methods.get(method)
+            if old is None or "error" in stats or "error" in old:
+                continue
+            print("{0:<9} {1:<20} {2:>+9.1f}% {3:>+10.2f} {4:>+12.0f}".format(
+                backend, method, (stats["ops_per_sec"] / old["ops_per_sec"] - 1) * 100,
+                stats["transactions_per_op"] - old["transactions_per_op"],
+                stats["alloc_bytes_per_op"] - old["alloc_bytes_per_op"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--json", help="save the results to this file")
+    parser.add_argument("--compare", help="compare with the results saved in this file")
+    parser.add_argument("--label", help="name of this run in the JSON file, e.g. the release")
+    parser.add_argument("--duration", type=float, default=0.2, help="seconds per method (default 0.2)")
+    parser.add_argument("--i2c-frequency", type=int, help="modeled I2C bus frequency in Hz")
+    parser.add_argument("--i2c-overhead", type=float, default=0.0, help="modeled seconds per I2C transaction")
+    parser.add_argument("--parport-access", type=float, default=0.0,
+                        help="modeled seconds per parallel port register access")
+    parser.add_argument("--gpio-access", type=float, default=0.0, help="modeled seconds per RPi.GPIO call")
+    parser.add_argument("--backend", action="append", help="only run this backend (can be repeated)")
+    parser.add_argument("--method", action="append", help="only run this method (can be repeated)")
+    args = parser.parse_args()
+
+    # Pin modes can't be set on the parallel port
+    warnings.simplefilter("ignore", RuntimeWarning)
+    timing = {
+        "i2c_frequency": args.i2c_frequency,
+        "i2c_overhead": args.i2c_overhead,
+        "parport_access": args.parport_access,
+        "gpio_access": args.gpio_access,
+    }
+    results = {}
+    with Simulation(args.i2c_frequency, args.i2c_overhead, args.parport_access, args.gpio_access) as sim:
+        for name, factory, outputs, inputs in make_backends(sim):
+            if args.backend and name not in args.backend:
+                continue
+            results[name] = run_backend(sim, name, factory, outputs, inputs, args.duration, args.method)
+
+    print_results(results)
+    report = {
+        "label": args.label,
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timing": timing,
+        "duration": args.duration,
+        "results": results,
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(results, json.load(f))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Runs the same workload on a simulated PCF8574, parallel port and
+Raspberry Pi directly, while recording a trace, and replaying the trace, and reports
+the time per hardware call, the size of the trace and the calls it holds.
+"""
+
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pywiring.i2c import PCF8574IO
+from pywiring.parport import ParallelIO
+from pywiring.raspi import RasPiIO
+from pywiring.sim import Simulation, SimPCF8574
+from pywiring.trace import Recorder, Replayer, counts
+
+N = 2000
+
+
+def workload():
+    ios = [PCF8574IO(1, 0x20), ParallelIO(0), RasPiIO()]
+    for io in ios:
+        io.pin_mode_bulk({pin: (False,) for pin in range(4)})
+    for i in range(N):
+        for io in ios:
+            io.digital_write(i & 3, i & 1)
+            io.digital_read(i & 3)
+    for io in ios:
+        io.close()
+
+
+def timed(label, calls):
+    start = time.perf_counter()
+    workload()
+    seconds = time.perf_counter() - start
+    print("{0:<9} {1:7.2f} ms  {2:5.2f} us/call".format(label, seconds * 1e3, seconds / calls * 1e6))
+
+
+def main():
+    # Pin modes can't be set on the parallel port
+    warnings.simplefilter("ignore", RuntimeWarning)
+    path = os.path.join(tempfile.mkdtemp(), "bench.trace")
+    with Simulation() as sim:
+        sim.bus(1).attach(0x20, SimPCF8574())
+        with Recorder(path) as recorder:
+            start = time.perf_counter()
+            workload()
+            seconds = time.perf_counter() - start
+        calls = recorder.records
+        print("{0} records, {1} bytes ({2:.1f} bytes/record)".format(
+            calls, os.path.getsize(path), os.path.getsize(path) / float(calls)))
+
+        timed("direct", calls)
+    # The replay doesn't need the hardware
+    print("{0:<9} {1:7.2f} ms  {2:5.2f} us/call".format("recording", seconds * 1e3, seconds / calls * 1e6))
+    with Replayer(path) as replayer:
+        timed("replay", calls)
+        assert not replayer.remaining
+
+    for (library, name), count in sorted(counts(path).items()):
+        print("  {0}.{1}: {2}".format(library, name, count))
+    os.remove(path)
+    os.rmdir(os.path.dirname(path))
+
+
+if __name__ == "__main__":
+    main()
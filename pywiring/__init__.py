@@ -6,7 +6,181 @@ It tries to implement most Wiring functions using different
 ports (parallel, PCF8574 through I2C, GPIO).
 """
 
-__all__ = ("IOBase", "i2c")
+__all__ = ("IOBase", "i2c", "parport", "raspi", "open", "register_backend",
+           "get_backend", "override_hardware_module")
+
+import functools
+import importlib
+import threading
+import time
+from contextlib import contextmanager
+
+_submodules = ("i2c", "parport", "raspi", "aio", "events", "capture", "lcd", "gpiomem", "gpiochip", "pwm", "instrument", "remote", "shared", "composite", "trace", "bitbang", "adc", "counter", "sim")
+
+_backends = {
+    "pcf8574": ("pywiring.i2c", "PCF8574IO"),
+    "pcf8575": ("pywiring.i2c", "PCF8575IO"),
+    "mcp23017": ("pywiring.i2c", "MCP23017IO"),
+    "lcdbackpack": ("pywiring.i2c", "LCDBackpack"),
+    "parport": ("pywiring.parport", "ParallelIO"),
+    "raspi": ("pywiring.raspi", "RasPiIO"),
+    "gpiochip": ("pywiring.gpiochip", "GPIOChipIO"),
+    "remote": ("pywiring.remote", "RemoteIO"),
+    "ads1115": ("pywiring.adc", "ADS1115IO"),
+    "ads7830": ("pywiring.adc", "ADS7830IO"),
+}
+
+_uri_aliases = {
+    "addr": "address",
+}
+
+_hardware_modules = {}
+
+
+def __getattr__(name):
+    # Submodules are only imported when first accessed, so that importing
+    # the package doesn't pull in any hardware library.
+    if name in _submodules:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+
+
+def override_hardware_module(name, module=None):
+    """
+    Makes the backends use :py:data:`module` instead of importing the
+    hardware library called :py:data:`name` (e.g. "smbus", "parallel" or
+    "RPi.GPIO"). Pass None to restore the real library.
+
+    It only affects backends instantiated afterwards.
+    """
+    if module is None:
+        _hardware_modules.pop(name, None)
+    else:
+        _hardware_modules[name] = module
+
+
+def hardware_module(name):
+    """
+    Returns the hardware library called :py:data:`name`, importing it only
+    when first needed.
+    """
+    module = _hardware_modules.get(name)
+    if module is None:
+        module = importlib.import_module(name)
+    return module
+
+
+def register_backend(name, module, classname):
+    """
+    Registers a backend for :py:func:`open`. :py:data:`module` is the
+    full name of the module containing the class called
+    :py:data:`classname`. The module is only imported when the backend is
+    opened.
+    """
+    _backends[name.lower()] = (module, classname)
+
+
+def get_backend(name):
+    """
+    Returns the class of the backend registered as :py:data:`name`,
+    importing its module if needed.
+    """
+    try:
+        module, classname = _backends[name.lower()]
+    except KeyError:
+        raise ValueError("Unknown backend: {0}".format(name))
+    return getattr(importlib.import_module(module), classname)
+
+
+def _parse_uri_value(value):
+    if value.lower() in ("true", "yes", "on"):
+        return True
+    if value.lower() in ("false", "no", "off"):
+        return False
+    try:
+        return int(value, 0)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def open(uri):
+    """
+    Opens a backend from a URI in the form "name:key=value,key=value".
+    The keys are passed as keyword arguments to the backend's constructor
+    and the values are converted to ints, floats or bools when possible.
+    For example::
+
+        io = pywiring.open("pcf8574:bus=1,addr=0x20")
+        io = pywiring.open("parport:port=0")
+        io = pywiring.open("raspi")
+    """
+    name, _, args = uri.partition(":")
+    kwargs = {}
+    for arg in args.split(","):
+        if not arg.strip():
+            continue
+        key, sep, value = arg.partition("=")
+        if not sep:
+            raise ValueError("Invalid argument in URI {0!r}: {1!r}".format(uri, arg))
+        key = key.strip()
+        kwargs[_uri_aliases.get(key, key)] = _parse_uri_value(value.strip())
+    return get_backend(name.strip())(**kwargs)
+
+
+def _pins2masks(pins, number_of_pins):
+    """
+    Converts a {pin: level} dict, as accepted by the bulk methods, into a
+    (set_mask, clear_mask) tuple suitable for :py:meth:`IOBase.modify_port`.
+    Pins out of range are ignored.
+    """
+    set_mask = 0
+    clear_mask = 0
+    for pin in pins:
+        if 0 <= pin < number_of_pins:
+            if pins[pin]:
+                set_mask |= 1 << pin
+            else:
+                clear_mask |= 1 << pin
+    return set_mask, clear_mask
+
+
+def _paced(states, rate, write):
+    """
+    Calls :py:data:`write` for each state, :py:data:`rate` times per second.
+    """
+    period = 1.0 / rate
+    deadline = time.perf_counter()
+    for state in states:
+        delay = deadline - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        write(state)
+        deadline += period
+
+
+def _mask2pins(value, pins, number_of_pins):
+    """
+    Converts a port bitmask into the {pin: level} dict returned by the bulk
+    methods. Pins out of range are mapped to None.
+    """
+    return {pin: bool((value >> pin) & 1) if 0 <= pin < number_of_pins else None
+            for pin in pins}
+
+
+class _BatchState(threading.local):
+    """
+    Batch in progress on an interface, in the current thread: nesting
+    depth, pending pin levels and pending calls.
+    """
+
+    depth = 0
+    set_mask = 0
+    clear_mask = 0
+    calls = ()
 
 
 class IOBase(object):
@@ -56,9 +230,57 @@ class IOBase(object):
     """
     Average time of a read/write operation in milliseconds.
 
-    Note: this is a preset value. It's not updated at runtime.
+    Note: this is a preset value, unless the interface is instrumented with
+    :py:func:`pywiring.instrument.instrument`: it's then the measured
+    average of the hardware calls, updated after each one.
+    :py:func:`~pywiring.instrument.uninstrument` restores the preset value.
+    """
+
+    pwm_frequency = 100
+    """
+    Frequency, in Hz, of the PWM waves sent by
+    :py:meth:`~IOBase.analog_write` on interfaces with software PWM.
     """
 
+    @property
+    def bus_id(self):
+        """
+        Hashable value identifying the physical bus or port used by the
+        interface. Interfaces sharing the same bus have the same
+        :py:attr:`bus_id`, so operations on them can be serialized.
+        """
+        return ("io", id(self))
+
+    _batch_state = None
+    _pwm_scheduler = None
+
+    # The state of the batches is kept per thread: writes issued by other
+    # threads (e.g. the PWM scheduler or the event poller) while a batch is
+    # open go straight to the hardware instead of joining it.
+
+    @property
+    def _batch_depth(self):
+        state = self._batch_state
+        return state.depth if state is not None else 0
+
+    @property
+    def _pending_set(self):
+        state = self._batch_state
+        return state.set_mask if state is not None else 0
+
+    @_pending_set.setter
+    def _pending_set(self, value):
+        self._batch_state.set_mask = value
+
+    @property
+    def _pending_clear(self):
+        state = self._batch_state
+        return state.clear_mask if state is not None else 0
+
+    @_pending_clear.setter
+    def _pending_clear(self, value):
+        self._batch_state.clear_mask = value
+
     def pin_mode(self, pin, input, pullup=False, pulldown=False):
         """
         Sets :py:const:`pin` in a specified direction. If :py:const:`input` is
@@ -73,8 +295,8 @@ class IOBase(object):
         Same as :py:meth:`~IOBase.pin_mode`, but sets the direction of
         all the pins at once.
         """
-        for i in xrange(self.number_of_pins):
-            self.pin_mode(input, pullup, pulldown)
+        for i in range(self.number_of_pins):
+            self.pin_mode(i, input, pullup, pulldown)
 
     def pin_mode_bulk(self, pins):
         """
@@ -96,6 +318,15 @@ class IOBase(object):
         """
         raise NotImplementedError
 
+    def _pin_reader(self, pin):
+        """
+        Returns a function taking no arguments that returns the level of
+        :py:data:`pin` as an int, for callers that read the same pin very
+        often (e.g. :py:mod:`pywiring.counter`, on every edge). Backends
+        can return something cheaper than :py:meth:`digital_read`.
+        """
+        return functools.partial(self.digital_read, pin)
+
     def digital_read_bulk(self, *pins):
         """
         Reads the level of multiple pins in only one operation, if possible.
@@ -133,6 +364,184 @@ class IOBase(object):
             if pin >= 0 and pin < self.number_of_pins:
                 self.digital_write(pin, pins[pin])
 
+    def read_port(self):
+        """
+        Reads the logic level of all the pins at once and returns them as an
+        integer bitmask, where bit ``n`` is the level of pin ``n``.
+
+        Implementations should override this with a single hardware read
+        whenever possible, as it's the fastest way to read multiple pins.
+        """
+        value = 0
+        for pin in range(self.number_of_pins):
+            if self.digital_read(pin):
+                value |= 1 << pin
+        return value
+
+    def write_port(self, mask):
+        """
+        Writes the logic level of all the output pins at once. :py:data:`mask`
+        is an integer bitmask, where bit ``n`` is the level of pin ``n``.
+        """
+        if self._queue_write(mask, ~mask & ((1 << self.number_of_pins) - 1)):
+            return
+        for pin in range(self.number_of_pins):
+            self.digital_write(pin, (mask >> pin) & 1)
+
+    def modify_port(self, set_mask, clear_mask):
+        """
+        Pulls high all the pins in :py:data:`set_mask` and pulls low all the
+        pins in :py:data:`clear_mask`, leaving the other pins untouched. If a
+        pin is in both masks, it will be pulled high.
+
+        Implementations should override this with a single read-modify-write
+        operation whenever possible.
+        """
+        if self._queue_write(set_mask, clear_mask):
+            return
+        for pin in range(self.number_of_pins):
+            bpin = 1 << pin
+            if set_mask & bpin:
+                self.digital_write(pin, True)
+            elif clear_mask & bpin:
+                self.digital_write(pin, False)
+
+    def play(self, states, mask=None, rate=None):
+        """
+        Writes a sequence of port states (bitmasks, as accepted by
+        :py:meth:`write_port`), e.g. a precompiled list or NumPy array, one
+        after the other. If :py:data:`mask` is provided, only the pins in it
+        are driven and the others keep their level.
+
+        If :py:data:`rate` is None the states are written as fast as
+        possible, using the fastest multi-state write the interface
+        supports, otherwise :py:data:`rate` states per second are written.
+        """
+        if hasattr(states, "tolist"):
+            states = states.tolist()
+        if mask is None:
+            mask = (1 << self.number_of_pins) - 1
+        if rate is None:
+            for state in states:
+                self.modify_port(state & mask, ~state & mask)
+            return
+        _paced(states, rate, lambda state: self.modify_port(state & mask, ~state & mask))
+
+    @contextmanager
+    def batch(self):
+        """
+        Context manager that buffers all the writes issued inside it and
+        sends them to the hardware, with as little operations as possible,
+        when the block exits::
+
+            with io.batch():
+                for pin, level in enumerate(segments):
+                    io.digital_write(pin, level)
+
+        Reads issued inside the block observe the pending writes. If the
+        block raises an exception, the pending writes are discarded.
+        Batches can be nested: the writes are sent when the outermost one
+        exits. A batch only buffers the writes of the thread that opened it.
+        """
+        state = self._batch_state
+        if state is None:
+            state = self.__dict__.setdefault("_batch_state", _BatchState())
+        if not state.depth:
+            state.calls = []
+        state.depth += 1
+        completed = False
+        try:
+            yield self
+            completed = True
+        finally:
+            state.depth -= 1
+            if not state.depth:
+                set_mask, clear_mask, calls = state.set_mask, state.clear_mask, state.calls
+                state.set_mask = state.clear_mask = 0
+                state.calls = ()
+                if completed:
+                    self._flush_batch(set_mask, clear_mask, calls)
+
+    def _queue_write(self, set_mask, clear_mask):
+        """
+        If a batch is in progress, merges the write into the pending ones
+        and returns True. Otherwise returns False, and the caller must write
+        to the hardware.
+        """
+        if not self._batch_depth:
+            return False
+        self._pending_clear = (self._pending_clear | clear_mask) & ~set_mask
+        self._pending_set = (self._pending_set & ~clear_mask) | set_mask
+        return True
+
+    def _queue_call(self, func, *args):
+        """
+        Same as :py:meth:`_queue_write`, for writes that can't be expressed
+        as a bitmask. They're run in order after the pending pin levels
+        have been written.
+        """
+        if not self._batch_depth:
+            return False
+        self._batch_state.calls.append((func, args))
+        return True
+
+    def _apply_pending(self, value, mask=-1):
+        """
+        Overlays the pending writes of the current batch on :py:data:`value`,
+        limited to the pins in :py:data:`mask`.
+        """
+        return (value & ~(self._pending_clear & mask)) | (self._pending_set & mask)
+
+    def _flush_batch(self, set_mask, clear_mask, calls):
+        """
+        Writes the result of a batch to the hardware. Backends whose
+        :py:meth:`modify_port` isn't already a single operation should
+        override this.
+        """
+        if set_mask or clear_mask:
+            self.modify_port(set_mask, clear_mask)
+        for func, args in calls:
+            func(*args)
+
+    def capture(self, pins=None, rate=1000, duration=1.0):
+        """
+        Samples the pins in :py:data:`pins` (all of them if None)
+        :py:data:`rate` times per second for :py:data:`duration` seconds.
+        Returns a (timestamps, samples, dropped) named tuple whose
+        samples are port bitmasks stored in a NumPy array.
+
+        Requires NumPy. See :py:mod:`pywiring.capture`.
+        """
+        from .capture import capture
+        return capture(self, pins, rate, duration)
+
+    def capture_stream(self, pins=None, rate=1000, chunk_size=1024, chunks=16):
+        """
+        Same as :py:meth:`capture`, but samples continuously and returns an
+        iterator of (timestamps, samples) chunks. Sampling stops when the
+        iterator is closed.
+
+        Requires NumPy. See :py:mod:`pywiring.capture`.
+        """
+        from .capture import stream
+        return stream(self, pins, rate, chunk_size, chunks)
+
+    def _software_pwm(self, pin, frequency, duty):
+        """
+        Sends a PWM wave to :py:data:`pin` with the shared software PWM
+        scheduler (see :py:mod:`pywiring.pwm`). :py:data:`duty` goes from 0
+        to 1. Backends using it must call :py:meth:`_stop_software_pwm` when
+        closed.
+        """
+        if self._pwm_scheduler is None:
+            from .pwm import get_scheduler
+            self._pwm_scheduler = get_scheduler()
+        self._pwm_scheduler.set(self, pin, frequency, duty)
+
+    def _stop_software_pwm(self):
+        if self._pwm_scheduler is not None:
+            self._pwm_scheduler.remove_io(self)
+
     def analog_read(self, pin):
         """
         If :py:data:`pin` has an analog-digital converter, returns the voltage
@@ -0,0 +1,456 @@
+# -*- coding: utf-8 -*-
+
+"""
+I2C analog-digital converters.
+
+Besides :py:meth:`~IOBase.analog_read`, which runs one conversion per
+call, the converters can sample a sequence of channels continuously:
+:py:meth:`I2CADCBase.start_continuous` starts a background reader that
+stores the samples in a preallocated NumPy ring buffer
+(:py:class:`ContinuousReader`), reading them with as few bus transactions
+as the device allows.
+"""
+
+__all__ = ("I2CADCBase", "ADS1115IO", "ADS7830IO", "ContinuousReader")
+
+import threading
+import time
+
+from .i2c import I2CIOBase
+
+_SPIN_THRESHOLD = 0.0005
+# Rates with a shorter period busy-wait, sleeping isn't accurate enough
+_SPIN_PERIOD = 0.001
+
+
+class ContinuousReader(object):
+    """
+    Background reader storing frames of samples, one sample per channel in
+    :py:data:`channels`, in a ring buffer of :py:data:`size` frames:
+    :py:attr:`samples` is a (size, len(channels)) NumPy array of raw
+    conversion results and :py:attr:`timestamps` holds the time of each
+    frame, in seconds from the start.
+
+    If :py:data:`rate` is a number, a frame is read :py:data:`rate` times
+    per second and the frames missed because the reader fell behind are
+    counted in :py:attr:`dropped`; rates above 1 kHz are kept by
+    busy-waiting. If it's None, frames are read as fast as the device
+    allows, in blocks when it supports it; the timestamps of the frames of
+    a block are spread over the transaction that read it.
+
+    :py:meth:`read` returns the frames taken since the last call. Frames
+    overwritten before being read are counted in :py:attr:`overruns`.
+
+    Use :py:meth:`I2CADCBase.start_continuous` to create one. Requires
+    NumPy.
+    """
+
+    def __init__(self, adc, channels, rate, size):
+        import numpy
+        self._numpy = numpy
+        self.adc = adc
+        self.channels = tuple(channels)
+        self.rate = rate
+        self.size = size
+        self.samples = numpy.zeros((size, len(self.channels)), dtype=adc.sample_dtype)
+        self.timestamps = numpy.zeros(size, dtype=numpy.float64)
+        self.count = 0
+        self.dropped = 0
+        self.overruns = 0
+        self.start_time = None
+        self._consumed = 0
+        self._running = False
+        self._thread = None
+        self._cond = threading.Condition()
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="pywiring-adc")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._running
+
+    def wait(self, count, timeout=None):
+        """
+        Waits until at least :py:data:`count` frames have been taken, or
+        the reader has stopped. Returns the number of frames taken.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self.count >= count or not self._running, timeout)
+            return self.count
+
+    def read(self):
+        """
+        Returns the (timestamps, samples) frames taken since the last call,
+        as copies.
+        """
+        size = self.size
+        count = self.count
+        consumed = self._consumed
+        if count - consumed > size:
+            self.overruns += count - size - consumed
+            consumed = count - size
+        indices = self._numpy.arange(consumed, count) % size
+        timestamps = self.timestamps[indices]
+        samples = self.samples[indices]
+        if self.count - size > consumed:
+            # Some frames were overwritten while being copied
+            lost = self.count - size - consumed
+            self.overruns += lost
+            timestamps = timestamps[lost:]
+            samples = samples[lost:]
+        self._consumed = count
+        return timestamps, samples
+
+    def _run(self):
+        adc = self.adc
+        channels = self.channels
+        read_frames = adc._read_frames
+        samples = self.samples
+        timestamps = self.timestamps
+        size = self.size
+        clock = time.perf_counter
+        sleep = time.sleep
+        period = 1.0 / self.rate if self.rate else None
+        block = 1 if period else adc.max_block
+        spin = _SPIN_THRESHOLD if period and period < _SPIN_PERIOD else 0
+        notify_every = max(1, min(size // 16, 256))
+        next_notify = notify_every
+
+        adc._start_continuous(channels)
+        start = self.start_time = clock()
+        deadline = start
+        count = 0
+        try:
+            while self._running:
+                now = clock()
+                if period:
+                    while now < deadline:
+                        if deadline - now > spin:
+                            sleep(deadline - now - spin)
+                        now = clock()
+
+                index = count % size
+                wanted = min(block, size - index)
+                taken = read_frames(channels, samples[index:index + wanted], wanted)
+                end = clock() - start
+                if taken == 1:
+                    timestamps[index] = end
+                else:
+                    begin = now - start
+                    step = (end - begin) / taken
+                    timestamps[index:index + taken] = self._numpy.arange(1, taken + 1) * step + begin
+                count += taken
+                self.count = count
+
+                if count >= next_notify:
+                    next_notify = count + notify_every
+                    with self._cond:
+                        self._cond.notify_all()
+
+                if period:
+                    deadline += period
+                    late = int((clock() - deadline) / period)
+                    if late > 0:
+                        self.dropped += late
+                        deadline += late * period
+        finally:
+            self._running = False
+            adc._stop_continuous()
+            with self._cond:
+                self._cond.notify_all()
+
+    def close(self):
+        self.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class I2CADCBase(I2CIOBase):
+    """
+    Base class for I2C analog-digital converters. Every pin is an analog
+    input; :py:meth:`digital_read` reports whether it's above half the
+    full scale.
+
+    Subclasses implement :py:meth:`read_raw`, :py:meth:`_read_frames` and
+    optionally :py:meth:`_start_continuous` and :py:meth:`_stop_continuous`.
+    """
+
+    has_adc = True
+    has_pwm = False
+    has_input = True
+    pullup_resistors = False
+    pulldown_resistors = False
+
+    resolution = 0
+    """
+    Number of bits of the raw samples returned by :py:meth:`read_raw`.
+    """
+    sample_dtype = "int16"
+    """
+    NumPy data type of the raw samples.
+    """
+    max_block = 1
+    """
+    Maximum number of frames read with a single transaction.
+    """
+
+    def __init__(self, bus, address):
+        super(I2CADCBase, self).__init__(bus, address)
+        self._reader = None
+
+    def read_raw(self, channel):
+        """
+        Runs one conversion on :py:data:`channel` and returns the raw
+        result. Raises :py:class:`RuntimeError` while continuous conversion
+        is running.
+        """
+        raise NotImplementedError
+
+    def _read_frames(self, channels, out, count):
+        """
+        Reads up to :py:data:`count` frames, one sample of each channel in
+        :py:data:`channels`, into the rows of the NumPy array :py:data:`out`
+        while continuous conversion is running. Returns the number of
+        frames read.
+        """
+        raise NotImplementedError
+
+    def _start_continuous(self, channels):
+        pass
+
+    def _stop_continuous(self):
+        pass
+
+    def _check_channel(self, channel):
+        if not 0 <= channel < self.number_of_pins:
+            raise ValueError("Invalid channel: {0}".format(channel))
+
+    def _check_idle(self):
+        if self._reader is not None and self._reader.running:
+            raise RuntimeError("Continuous conversion is running")
+
+    def start_continuous(self, channels=None, rate=None, size=65536):
+        """
+        Starts sampling the channels in :py:data:`channels` (all of them if
+        None), in that order, and returns the :py:class:`ContinuousReader`
+        storing the samples. If :py:data:`rate` (frames per second) is None
+        the device's natural rate is used. Single conversions can't be run
+        until :py:meth:`stop_continuous` is called.
+        """
+        self._check_idle()
+        if channels is None:
+            channels = range(self.number_of_pins)
+        channels = tuple(channels)
+        if not channels:
+            raise ValueError("No channels to sample")
+        for channel in channels:
+            self._check_channel(channel)
+        self._reader = ContinuousReader(self, channels, self._continuous_rate(channels, rate), size)
+        self._reader.start()
+        return self._reader
+
+    def _continuous_rate(self, channels, rate):
+        return rate
+
+    def stop_continuous(self):
+        if self._reader is not None:
+            self._reader.stop()
+            self._reader = None
+
+    def get_pin_modes(self):
+        return [{"INPUT": 1, "ANALOG": self.resolution}] * self.number_of_pins
+
+    def pin_mode(self, pin, input, pullup=False, pulldown=False):
+        if not input:
+            raise IOError("The pins of an ADC can only be inputs")
+
+    def port_mode(self, input, pullup=False, pulldown=False):
+        self.pin_mode(0, input)
+
+    def analog_read(self, pin):
+        """
+        Returns the result of a conversion on :py:data:`pin`, scaled to the
+        0-1023 range. Negative results are read as 0.
+        """
+        self._check_channel(pin)
+        self._check_idle()
+        raw = self.read_raw(pin)
+        return max(0, raw) * 1023 // ((1 << self.resolution) - 1)
+
+    def digital_read(self, pin):
+        if not 0 <= pin < self.number_of_pins:
+            return None
+        return self.analog_read(pin) >= 512
+
+    def digital_write(self, pin, high):
+        raise IOError("The pins of an ADC can only be inputs")
+
+    def write_port(self, mask):
+        raise IOError("The pins of an ADC can only be inputs")
+
+    def modify_port(self, set_mask, clear_mask):
+        raise IOError("The pins of an ADC can only be inputs")
+
+    def analog_write(self, pin, value):
+        raise IOError("The pins of an ADC can only be inputs")
+
+    def close(self):
+        self.stop_continuous()
+        super(I2CADCBase, self).close()
+
+
+# ADS1115 registers
+_CONVERSION = 0x00
+_CONFIG = 0x01
+
+_OS = 0x8000
+_MODE_SINGLE = 0x0100
+_COMP_DISABLE = 0x0003
+
+
+class ADS1115IO(I2CADCBase):
+    """
+    Texas Instruments ADS1115 16-bit ADC, with four single-ended inputs,
+    at :py:data:`address` (0x48 to 0x4B) on I2C bus :py:data:`bus`.
+
+    :py:data:`full_scale` is the full-scale voltage of the programmable
+    gain amplifier, one of :py:attr:`FULL_SCALES`, and
+    :py:data:`data_rate` the conversion rate in samples per second, one of
+    :py:attr:`DATA_RATES`. :py:meth:`read_voltage` converts to volts.
+
+    In continuous mode, a single channel is converted continuously by the
+    device and each sample costs one 2-byte read of the conversion
+    register, at :py:data:`data_rate` frames per second by default. A
+    sequence of channels is sampled with one single-shot conversion per
+    channel, i.e. a configuration write and a read per sample, as fast as
+    the conversions allow by default.
+    """
+
+    number_of_pins = 4
+    resolution = 15
+    sample_dtype = "int16"
+
+    FULL_SCALES = (6.144, 4.096, 2.048, 1.024, 0.512, 0.256)
+    DATA_RATES = (8, 16, 32, 64, 128, 250, 475, 860)
+
+    def __init__(self, bus, address=0x48, full_scale=4.096, data_rate=860):
+        if full_scale not in self.FULL_SCALES:
+            raise ValueError("Invalid full scale: {0}".format(full_scale))
+        if data_rate not in self.DATA_RATES:
+            raise ValueError("Invalid data rate: {0}".format(data_rate))
+        super(ADS1115IO, self).__init__(bus, address)
+        self.full_scale = full_scale
+        self.data_rate = data_rate
+        # The internal oscillator is accurate to 10%
+        self.conversion_time = 1.1 / data_rate
+        self.avg_exec_time = self.conversion_time * 1000
+        self._config = ((self.FULL_SCALES.index(full_scale) << 9) |
+                        (self.DATA_RATES.index(data_rate) << 5) | _COMP_DISABLE)
+        self._write_config(self._config | _MODE_SINGLE)
+
+    def _write_config(self, config):
+        self._bus.write_i2c_block_data(self.address, _CONFIG, [config >> 8, config & 0xFF])
+
+    def _read_register(self, register):
+        high, low = self._bus.read_i2c_block_data(self.address, register, 2)
+        value = high << 8 | low
+        return value - 0x10000 if value & 0x8000 else value
+
+    def _convert(self, channel):
+        # Single-ended input: MUX = 0b1xx. The conversion is over after
+        # conversion_time, there is no need to poll the OS bit.
+        self._write_config(self._config | _OS | _MODE_SINGLE | (4 | channel) << 12)
+        time.sleep(self.conversion_time)
+        return self._read_register(_CONVERSION)
+
+    def read_raw(self, channel):
+        self._check_channel(channel)
+        self._check_idle()
+        return self._convert(channel)
+
+    def read_voltage(self, channel):
+        """
+        Returns the voltage on :py:data:`channel`, in volts.
+        """
+        return self.read_raw(channel) * self.full_scale / 32768.0
+
+    def _continuous_rate(self, channels, rate):
+        if rate is None and len(channels) == 1:
+            return self.data_rate
+        return rate
+
+    def _start_continuous(self, channels):
+        if len(channels) == 1:
+            self._write_config(self._config | (4 | channels[0]) << 12)
+            time.sleep(self.conversion_time)
+
+    def _stop_continuous(self):
+        # Back to single-shot mode, which powers the converter down
+        self._write_config(self._config | _MODE_SINGLE)
+
+    def _read_frames(self, channels, out, count):
+        if len(channels) == 1:
+            out[0, 0] = self._read_register(_CONVERSION)
+        else:
+            for i, channel in enumerate(channels):
+                out[0, i] = self._convert(channel)
+        return 1
+
+
+def _ads7830_command(channel, reference):
+    # Single-ended channels are selected by C2-C0 = (channel & 1, channel >> 1)
+    return 0x80 | (channel & 1) << 6 | (channel >> 1) << 4 | (0x0C if reference else 0x04)
+
+
+class ADS7830IO(I2CADCBase):
+    """
+    Texas Instruments ADS7830 8-bit ADC, with eight single-ended inputs, at
+    :py:data:`address` (0x48 to 0x4B) on I2C bus :py:data:`bus`. If
+    :py:data:`internal_reference` is True the internal 2.5 V reference is
+    used, otherwise the one on the REF pin.
+
+    Each read of the device returns a new conversion, so in continuous mode
+    a single channel is read up to 32 samples per block read as fast as
+    possible (at the default rate of None); a sequence of channels costs
+    one transaction per sample.
+    """
+
+    number_of_pins = 8
+    resolution = 8
+    sample_dtype = "uint8"
+    max_block = 32
+    avg_exec_time = 0.2
+
+    def __init__(self, bus, address=0x48, internal_reference=False):
+        super(ADS7830IO, self).__init__(bus, address)
+        self.internal_reference = internal_reference
+        self._commands = [_ads7830_command(channel, internal_reference) for channel in range(8)]
+
+    def read_raw(self, channel):
+        self._check_channel(channel)
+        self._check_idle()
+        return self._bus.read_byte_data(self.address, self._commands[channel])
+
+    def _read_frames(self, channels, out, count):
+        commands = self._commands
+        if len(channels) == 1 and count > 1:
+            data = self._bus.read_i2c_block_data(self.address, commands[channels[0]], count)
+            out[:len(data), 0] = data
+            return len(data)
+        for i, channel in enumerate(channels):
+            out[0, i] = self._bus.read_byte_data(self.address, commands[channel])
+        return 1
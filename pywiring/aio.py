@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+"""
+Asyncio front-end for PyWiring interfaces.
+
+Every physical bus or port (see :py:attr:`IOBase.bus_id`) gets a single
+worker thread, shared by all the interfaces on it. Operations are run on
+that thread, so they don't block the event loop and are executed in the
+order they were issued, without any locking.
+"""
+
+__all__ = ("AsyncIO",)
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def _acquire_executor(bus_id):
+    with _executors_lock:
+        entry = _executors.get(bus_id)
+        if entry is None:
+            executor = ThreadPoolExecutor(max_workers=1,
+                                          thread_name_prefix="pywiring-{0}".format(bus_id))
+            entry = _executors[bus_id] = [executor, 0]
+        entry[1] += 1
+        return entry[0]
+
+
+def _release_executor(bus_id):
+    with _executors_lock:
+        entry = _executors[bus_id]
+        entry[1] -= 1
+        if not entry[1]:
+            del _executors[bus_id]
+            entry[0].shutdown(wait=False)
+
+
+def _async_method(name):
+    def method(self, *args, **kwargs):
+        return self.run(getattr(self.io, name), *args, **kwargs)
+
+    method.__name__ = name
+    method.__doc__ = "Coroutine version of :py:meth:`IOBase.{0}`.".format(name)
+    return method
+
+
+class AsyncIO(object):
+    """
+    Wraps an :py:class:`~pywiring.IOBase` instance so that its methods can
+    be awaited from asyncio code::
+
+        aio = AsyncIO(PCF8574IO(1, 0x20))
+        level = await aio.digital_read(3)
+        await aio.digital_write_bulk({0: True, 1: False})
+        async for port in aio:
+            print(bin(port))
+
+    All the :py:class:`~pywiring.IOBase` methods are available as
+    coroutines. Attributes such as :py:attr:`number_of_pins` are read from
+    the wrapped interface. Event callbacks may be coroutine functions: they
+    will be scheduled on the event loop that registered them.
+    """
+
+    def __init__(self, io):
+        self.io = io
+        self._bus_id = io.bus_id
+        self._executor = _acquire_executor(self._bus_id)
+
+    def __getattr__(self, name):
+        if name == "io":
+            raise AttributeError(name)
+        return getattr(self.io, name)
+
+    def run(self, func, *args, **kwargs):
+        """
+        Runs :py:data:`func` on the bus worker thread and returns an
+        awaitable for its result. Use this to run several operations, e.g.
+        a :py:meth:`IOBase.batch`, as a single unit.
+        """
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    pin_mode = _async_method("pin_mode")
+    port_mode = _async_method("port_mode")
+    pin_mode_bulk = _async_method("pin_mode_bulk")
+    digital_read = _async_method("digital_read")
+    digital_read_bulk = _async_method("digital_read_bulk")
+    digital_write = _async_method("digital_write")
+    digital_write_bulk = _async_method("digital_write_bulk")
+    read_port = _async_method("read_port")
+    write_port = _async_method("write_port")
+    modify_port = _async_method("modify_port")
+    analog_read = _async_method("analog_read")
+    analog_write = _async_method("analog_write")
+    get_pin_modes = _async_method("get_pin_modes")
+    disable_event_detect = _async_method("disable_event_detect")
+    event_detected = _async_method("event_detected")
+
+    def _wrap_callback(self, callback):
+        if callback is None or not asyncio.iscoroutinefunction(callback):
+            return callback
+        loop = asyncio.get_running_loop()
+
+        def wrapper(*args):
+            asyncio.run_coroutine_threadsafe(callback(*args), loop)
+
+        return wrapper
+
+    def enable_event_detect(self, pin, edge, callback=None, bounce=0):
+        """
+        Coroutine version of :py:meth:`IOBase.enable_event_detect`.
+        """
+        return self.run(self.io.enable_event_detect, pin, edge, self._wrap_callback(callback), bounce)
+
+    def add_event_callback(self, pin, callback):
+        """
+        Coroutine version of :py:meth:`IOBase.add_event_callback`.
+        """
+        return self.run(self.io.add_event_callback, pin, self._wrap_callback(callback))
+
+    async def watch(self, interval=0.01, mask=-1):
+        """
+        Asynchronous generator that polls the port every
+        :py:data:`interval` seconds and yields its state, as returned by
+        :py:meth:`IOBase.read_port`, every time the pins in
+        :py:data:`mask` change. The first state is always yielded.
+        """
+        previous = None
+        while True:
+            value = await self.read_port() & mask
+            if value != previous:
+                previous = value
+                yield value
+            await asyncio.sleep(interval)
+
+    def __aiter__(self):
+        return self.watch()
+
+    async def close(self):
+        """
+        Closes the wrapped interface and releases the bus worker thread.
+        """
+        if self._executor is None:
+            return
+        try:
+            await self.run(self.io.close)
+        finally:
+            self._executor = None
+            _release_executor(self._bus_id)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
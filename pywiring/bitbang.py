@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+"""
+Bit-banged serial protocols (SPI, 74HC595 and 74HC165 shift registers)
+driven through the pins of any interface.
+
+Outgoing data is compiled into the sequence of whole-port states that
+clocks it out, and written with :py:meth:`IOBase.play`, i.e. as multi-byte
+I2C writes on a PCF8574 and back-to-back data register writes on the
+parallel port, instead of one write per pin change. The states of every
+byte value are compiled once, and the sequences of recently sent payloads
+are cached.
+"""
+
+__all__ = ("MSBFIRST", "LSBFIRST", "SPI", "ShiftOut", "ShiftIn")
+
+from collections import OrderedDict
+
+MSBFIRST = 1
+LSBFIRST = 0
+
+
+class SPI(object):
+    """
+    Bit-banged SPI master on the pins :py:data:`sck`, :py:data:`mosi`,
+    :py:data:`miso` and :py:data:`cs` (active low) of :py:data:`io`.
+    :py:data:`miso` and :py:data:`cs` are optional. :py:data:`mode` is
+    the SPI mode (0 to 3) and :py:data:`bit_order` is :py:const:`MSBFIRST`
+    or :py:const:`LSBFIRST`.
+
+    :py:meth:`write` only drives output pins, so it's compiled and played.
+    :py:meth:`transfer` has to read :py:data:`miso` for every bit, so it
+    costs one port write and one port read per bit.
+
+    The sequences of the last :py:data:`cache_size` payloads written are
+    kept, so that writing the same data again doesn't compile it again.
+    """
+
+    def __init__(self, io, sck, mosi, miso=None, cs=None, mode=0, bit_order=MSBFIRST, cache_size=64):
+        if not 0 <= mode <= 3:
+            raise ValueError("Invalid SPI mode: {0}".format(mode))
+        self.io = io
+        self.mode = mode
+        self.bit_order = bit_order
+        self.cache_size = cache_size
+        self._sck = 1 << sck
+        self._mosi = 1 << mosi
+        self._miso = miso
+        self._cs = 1 << cs if cs is not None else 0
+        self.mask = self._sck | self._mosi | self._cs
+        # Clock level when idle, and when active
+        self._idle = self._sck if mode & 2 else 0
+        self._active = self._idle ^ self._sck
+        self._table = None
+        self._cache = OrderedDict()
+
+        pins = {pin: (False,) for pin in (sck, mosi, cs) if pin is not None}
+        if miso is not None:
+            pins[miso] = (True,)
+        io.pin_mode_bulk(pins)
+        io.play([self._deselected()], self.mask)
+
+    def _deselected(self):
+        return self._idle | self._cs
+
+    def _bits(self, byte):
+        if self.bit_order == MSBFIRST:
+            return [(byte >> (7 - i)) & 1 for i in range(8)]
+        return [(byte >> i) & 1 for i in range(8)]
+
+    def _byte_states(self, byte):
+        # Two states per bit. In modes 0 and 2 the data is set with the
+        # clock idle and sampled on the leading edge; in modes 1 and 3 it's
+        # set on the leading edge and sampled on the trailing one.
+        states = []
+        leading_sample = not self.mode & 1
+        for bit in self._bits(byte):
+            data = self._mosi if bit else 0
+            if leading_sample:
+                states += (data | self._idle, data | self._active)
+            else:
+                states += (data | self._active, data | self._idle)
+        return states
+
+    def _byte_table(self):
+        if self._table is None:
+            self._table = [self._byte_states(byte) for byte in range(256)]
+        return self._table
+
+    def compile(self, data):
+        """
+        Returns the list of port states that selects the device, clocks
+        out the bytes in :py:data:`data` and deselects it.
+        """
+        key = bytes(data)
+        states = self._cache.get(key)
+        if states is not None:
+            self._cache.move_to_end(key)
+            return states
+
+        table = self._byte_table()
+        states = [self._idle]
+        for byte in key:
+            states += table[byte]
+        # Back to idle before deselecting
+        idle = states[-1] & self._mosi | self._idle
+        if idle != states[-1]:
+            states.append(idle)
+        states.append(self._deselected())
+        if self.cache_size:
+            self._cache[key] = states
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return states
+
+    def write(self, data):
+        """
+        Sends the bytes in :py:data:`data`, ignoring what the device sends
+        back.
+        """
+        self.io.play(self.compile(data), self.mask)
+
+    def transfer(self, data):
+        """
+        Sends the bytes in :py:data:`data` and returns the bytes received
+        at the same time, as a :py:class:`bytearray`.
+        """
+        if self._miso is None:
+            raise RuntimeError("No MISO pin")
+        io = self.io
+        mask = self.mask
+        miso = self._miso
+        table = self._byte_table()
+        received = bytearray()
+
+        # Each write carries the second state of a bit and the first of the
+        # next one; MISO is read in between, when the data is stable
+        pending = [self._idle]
+        for byte in bytes(data):
+            value = 0
+            states = table[byte]
+            for i in range(8):
+                pending.append(states[2 * i])
+                io.play(pending, mask)
+                bit = (io.read_port() >> miso) & 1
+                value = value << 1 | bit if self.bit_order == MSBFIRST else value | bit << i
+                pending = [states[2 * i + 1]]
+            received.append(value)
+        io.play(pending + [self._idle, self._deselected()], mask)
+        return received
+
+
+class ShiftOut(SPI):
+    """
+    Chain of 74HC595 (or compatible) serial-in, parallel-out shift
+    registers on :py:data:`io`: :py:data:`data` goes to SER, :py:data:`clock`
+    to SRCLK and :py:data:`latch` to RCLK. :py:meth:`write` shifts bytes
+    in, the first byte ending up in the last register of the chain, and
+    pulses the latch to update the outputs.
+    """
+
+    def __init__(self, io, data, clock, latch, bit_order=MSBFIRST, cache_size=64):
+        # The latch is clocked by the rising edge at the end of a transfer
+        super(ShiftOut, self).__init__(io, clock, data, cs=latch, mode=0, bit_order=bit_order,
+                                       cache_size=cache_size)
+
+
+class ShiftIn(object):
+    """
+    Chain of 74HC165 (or compatible) parallel-in, serial-out shift
+    registers on :py:data:`io`: :py:data:`load` goes to /PL,
+    :py:data:`clock` to CP and :py:data:`data` to Q7 of the last register.
+    """
+
+    def __init__(self, io, data, clock, load, bit_order=MSBFIRST):
+        self.io = io
+        self.bit_order = bit_order
+        self._data = data
+        self._clock = 1 << clock
+        self._load = 1 << load
+        self.mask = self._clock | self._load
+        io.pin_mode_bulk({data: (True,), clock: (False,), load: (False,)})
+        io.play([self._load], self.mask)
+
+    def read(self, count=1):
+        """
+        Latches the inputs and shifts :py:data:`count` bytes out, the first
+        one coming from the register closest to the interface. Returns them
+        as a :py:class:`bytearray`.
+        """
+        io = self.io
+        mask = self.mask
+        load = self._load
+        # Pulse /PL low to load the inputs
+        io.play([0, load], mask)
+        received = bytearray()
+        for _ in range(count):
+            value = 0
+            for i in range(8):
+                bit = (io.read_port() >> self._data) & 1
+                value = value << 1 | bit if self.bit_order == MSBFIRST else value | bit << i
+                io.play([load | self._clock, load], mask)
+            received.append(value)
+        return received
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+
+"""
+High-rate sampling of whole ports into NumPy arrays, for logic-analyzer
+style monitoring.
+
+The port is sampled by a dedicated thread with the interface's native
+whole-port read (:py:meth:`IOBase.read_port`) and stored, together with a
+timestamp, in preallocated arrays.
+"""
+
+__all__ = ("Sampler", "Stream", "CaptureResult", "capture", "stream")
+
+import threading
+import time
+from collections import namedtuple
+
+import numpy
+
+CaptureResult = namedtuple("CaptureResult", ("timestamps", "samples", "dropped"))
+"""
+Result of :py:func:`capture`. :py:attr:`timestamps` are in seconds from the
+start of the capture, :py:attr:`samples` are port bitmasks, and
+:py:attr:`dropped` is the number of samples that were missed because the
+sampling thread couldn't keep up with the requested rate.
+"""
+
+_SPIN_THRESHOLD = 0.0005
+
+
+def _dtype(io):
+    pins = abs(io.number_of_pins)
+    if 0 < pins <= 8:
+        return numpy.uint8
+    if 0 < pins <= 16:
+        return numpy.uint16
+    if 0 < pins <= 32:
+        return numpy.uint32
+    if pins <= 64:
+        # Interfaces with an unknown number of pins included
+        return numpy.uint64
+    # Wider than any NumPy integer: the samples are Python ints
+    return object
+
+
+def _pins2mask(pins, number_of_pins):
+    if pins is None:
+        number_of_pins = abs(number_of_pins)
+        return (1 << number_of_pins) - 1 if number_of_pins else (1 << 64) - 1
+    mask = 0
+    for pin in pins:
+        mask |= 1 << pin
+    return mask
+
+
+class Sampler(object):
+    """
+    Samples the port of :py:data:`io` :py:data:`rate` times per second into
+    a ring buffer of :py:data:`size` samples. Only the pins in
+    :py:data:`pins` are kept (all of them if None).
+
+    If :py:data:`stop_when_full` is True, sampling stops when the buffer is
+    full instead of wrapping around.
+
+    :py:attr:`dropped` counts the samples missed because the thread fell
+    behind schedule; :py:attr:`count` is the total number of samples taken.
+    """
+
+    def __init__(self, io, pins=None, rate=1000, size=65536, stop_when_full=False):
+        self.io = io
+        self.rate = rate
+        self.size = size
+        self.mask = _pins2mask(pins, io.number_of_pins)
+        self.stop_when_full = stop_when_full
+        self.samples = numpy.zeros(size, dtype=_dtype(io))
+        self.timestamps = numpy.zeros(size, dtype=numpy.float64)
+        self.count = 0
+        self.dropped = 0
+        self.start_time = None
+        self._running = False
+        self._thread = None
+        self._cond = threading.Condition()
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="pywiring-sampler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def wait(self, count, timeout=None):
+        """
+        Waits until at least :py:data:`count` samples have been taken, or
+        sampling has stopped. Returns the number of samples taken.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self.count >= count or not self._running, timeout)
+            return self.count
+
+    def _run(self):
+        read = self.io.read_port
+        mask = self.mask
+        samples = self.samples
+        timestamps = self.timestamps
+        size = self.size
+        period = 1.0 / self.rate
+        clock = time.perf_counter
+        sleep = time.sleep
+        notify_every = max(1, size // 16)
+
+        start = self.start_time = clock()
+        deadline = start
+        count = 0
+        try:
+            while self._running:
+                now = clock()
+                while now < deadline:
+                    if deadline - now > _SPIN_THRESHOLD:
+                        sleep(deadline - now - _SPIN_THRESHOLD)
+                    now = clock()
+
+                value = read() & mask
+                index = count % size
+                timestamps[index] = clock() - start
+                samples[index] = value
+                count += 1
+                self.count = count
+
+                if count % notify_every == 0:
+                    with self._cond:
+                        self._cond.notify_all()
+                if self.stop_when_full and count >= size:
+                    break
+
+                deadline += period
+                late = int((clock() - deadline) / period)
+                if late > 0:
+                    self.dropped += late
+                    deadline += late * period
+        finally:
+            self._running = False
+            with self._cond:
+                self._cond.notify_all()
+
+
+def capture(io, pins=None, rate=1000, duration=1.0):
+    """
+    Samples the port of :py:data:`io` :py:data:`rate` times per second for
+    :py:data:`duration` seconds and returns a :py:class:`CaptureResult`.
+    The samples are stored as uint8, uint16, uint32 or uint64 depending on
+    the number of pins of the interface, or as Python ints if it has more
+    than 64 pins.
+    """
+    sampler = Sampler(io, pins, rate, max(1, int(rate * duration)), stop_when_full=True)
+    sampler.start()
+    sampler.wait(sampler.size)
+    sampler.stop()
+    return CaptureResult(sampler.timestamps[:sampler.count], sampler.samples[:sampler.count],
+                         sampler.dropped)
+
+
+class Stream(Sampler):
+    """
+    Iterator that samples the port of :py:data:`io` continuously and
+    yields (timestamps, samples) tuples of :py:data:`chunk_size` samples::
+
+        with stream(io, rate=20000) as chunks:
+            for timestamps, samples in chunks:
+                ...
+            print(chunks.dropped, chunks.overruns)
+
+    The samples are buffered in a ring of :py:data:`chunks` chunks. If the
+    consumer falls behind by more than that, the oldest chunks are skipped
+    and counted in :py:attr:`overruns` (in samples).
+
+    Sampling starts immediately and stops when the stream is closed.
+    """
+
+    def __init__(self, io, pins=None, rate=1000, chunk_size=1024, chunks=16):
+        super(Stream, self).__init__(io, pins, rate, chunk_size * chunks)
+        self.chunk_size = chunk_size
+        self.overruns = 0
+        self._consumed = 0
+        self.start()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk_size = self.chunk_size
+        size = self.size
+        while True:
+            consumed = self._consumed
+            taken = self.wait(consumed + chunk_size)
+            if taken < consumed + chunk_size:
+                raise StopIteration
+            if taken - consumed > size:
+                self._skip(taken - size)
+                continue
+
+            start = consumed % size
+            chunk = (self.timestamps[start:start + chunk_size].copy(),
+                     self.samples[start:start + chunk_size].copy())
+            if self.count - consumed > size:
+                # Overwritten while copying
+                self._skip(self.count - size)
+                continue
+            self._consumed = consumed + chunk_size
+            return chunk
+
+    def _skip(self, oldest):
+        # Moves to the first whole chunk that hasn't been overwritten yet
+        chunk_size = self.chunk_size
+        target = -(-oldest // chunk_size) * chunk_size
+        self.overruns += target - self._consumed
+        self._consumed = target
+
+    def close(self):
+        self.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def stream(io, pins=None, rate=1000, chunk_size=1024, chunks=16):
+    """
+    Returns a :py:class:`Stream` sampling the port of :py:data:`io`
+    continuously.
+    """
+    return Stream(io, pins, rate, chunk_size, chunks)
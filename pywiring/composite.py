@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+"""
+Several interfaces seen as one.
+
+:py:class:`CompositeIO` maps a contiguous pin range onto a list of
+interfaces: pin 0 is pin 0 of the first interface, and the pins of each
+following interface come after the ones of the previous. Port and bulk
+operations are split into one native port operation per interface, and the
+interfaces on different buses are driven at the same time, from one thread
+per bus.
+"""
+
+__all__ = ("CompositeIO",)
+
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+
+from . import IOBase, _pins2masks, _mask2pins
+
+
+class CompositeIO(IOBase):
+    """
+    Interface whose pins are the pins of all the interfaces in
+    :py:data:`ios`, in order. Every interface must have a known number of
+    pins.
+
+    The interfaces are grouped by :py:attr:`~IOBase.bus_id`. The
+    interfaces on the same bus are accessed one after the other, while
+    different buses are accessed concurrently: the first bus involved in
+    an operation from the calling thread, the others from one worker
+    thread per bus.
+
+    :py:meth:`play` plays each interface's part of the states on its own;
+    the interfaces are not synchronized with each other.
+
+    Closing the composite interface closes all the interfaces in it.
+    """
+
+    def __init__(self, ios):
+        super(CompositeIO, self).__init__()
+        self.devices = []
+        self._offsets = []
+        offset = 0
+        groups = {}
+        for io in ios:
+            if io.number_of_pins <= 0:
+                raise ValueError("The number of pins of {0!r} is not known".format(io))
+            device = (io, offset, (1 << io.number_of_pins) - 1)
+            self.devices.append(device)
+            self._offsets.append(offset)
+            groups.setdefault(io.bus_id, []).append(device)
+            offset += io.number_of_pins
+        self.number_of_pins = offset
+        self._groups = list(groups.values())
+        self._executors = [ThreadPoolExecutor(max_workers=1, thread_name_prefix="pywiring-composite")
+                           for _ in self._groups]
+        self._events = {}
+
+        ios = [device[0] for device in self.devices]
+        self.has_adc = any(io.has_adc for io in ios)
+        self.has_pwm = any(io.has_pwm for io in ios)
+        self.has_input = any(io.has_input for io in ios)
+        self.pullup_resistors = any(io.pullup_resistors for io in ios)
+        self.pulldown_resistors = any(io.pulldown_resistors for io in ios)
+        self.avg_exec_time = max(io.avg_exec_time for io in ios) if ios else 0
+
+    def _locate(self, pin):
+        """
+        Returns the interface :py:data:`pin` belongs to and the number of
+        the pin on it.
+        """
+        if not 0 <= pin < self.number_of_pins:
+            raise ValueError("Pin {0} out of range".format(pin))
+        io, offset, _ = self.devices[bisect_right(self._offsets, pin) - 1]
+        return io, pin - offset
+
+    def _each(self, func, devices=None):
+        """
+        Calls :py:data:`func` with every (io, offset, mask) device, or only
+        the ones in :py:data:`devices`, concurrently across buses. Returns
+        the results as a list of (device, result) tuples.
+        """
+        if devices is None:
+            groups = self._groups
+        else:
+            devices = set(devices)
+            groups = [[device for device in group if device in devices] for group in self._groups]
+        work = [(executor, group) for executor, group in zip(self._executors, groups) if group]
+        if not work:
+            return []
+
+        def run(group):
+            return [(device, func(*device)) for device in group]
+
+        # The first bus is driven by the calling thread
+        futures = [executor.submit(run, group) for executor, group in work[1:]]
+        results = run(work[0][1])
+        for future in futures:
+            results += future.result()
+        return results
+
+    def _devices_for(self, mask):
+        return [device for device in self.devices if (mask >> device[1]) & device[2]]
+
+    def get_pin_modes(self):
+        modes = []
+        for io, _, _ in self.devices:
+            modes += io.get_pin_modes()
+        return modes
+
+    def pin_mode(self, pin, input, pullup=False, pulldown=False):
+        io, local = self._locate(pin)
+        io.pin_mode(local, input, pullup, pulldown)
+
+    def pin_mode_bulk(self, pins):
+        split = {}
+        for pin, mode in pins.items():
+            io, local = self._locate(pin)
+            split.setdefault(io, {})[local] = mode
+        self._each(lambda io, offset, mask: io.pin_mode_bulk(split[io]),
+                   [device for device in self.devices if device[0] in split])
+
+    def port_mode(self, input, pullup=False, pulldown=False):
+        self._each(lambda io, offset, mask: io.port_mode(input, pullup, pulldown))
+
+    def read_port(self):
+        value = 0
+        for (_, offset, mask), port in self._each(lambda io, offset, mask: io.read_port()):
+            value |= (port & mask) << offset
+        if self._batch_depth:
+            value = self._apply_pending(value)
+        return value
+
+    def digital_read(self, pin):
+        if not 0 <= pin < self.number_of_pins:
+            return None
+        if self._batch_depth and (self._pending_set | self._pending_clear) >> pin & 1:
+            return bool(self._pending_set >> pin & 1)
+        io, local = self._locate(pin)
+        return io.digital_read(local)
+
+    def digital_read_bulk(self, *pins):
+        wanted = _pins2masks({pin: True for pin in pins}, self.number_of_pins)[0]
+        value = 0
+        for (_, offset, mask), port in self._each(lambda io, offset, mask: io.read_port(),
+                                                  self._devices_for(wanted)):
+            value |= (port & mask) << offset
+        if self._batch_depth:
+            value = self._apply_pending(value)
+        return _mask2pins(value, pins, self.number_of_pins)
+
+    def write_port(self, mask):
+        if not self._queue_write(mask, ~mask & ((1 << self.number_of_pins) - 1)):
+            self._each(lambda io, offset, pins: io.write_port((mask >> offset) & pins))
+
+    def modify_port(self, set_mask, clear_mask):
+        if self._queue_write(set_mask, clear_mask):
+            return
+
+        def modify(io, offset, pins):
+            io.modify_port((set_mask >> offset) & pins, (clear_mask >> offset) & pins)
+
+        self._each(modify, self._devices_for(set_mask | clear_mask))
+
+    def digital_write(self, pin, high):
+        if high:
+            self.modify_port(1 << pin, 0)
+        else:
+            self.modify_port(0, 1 << pin)
+
+    def digital_write_bulk(self, pins):
+        self.modify_port(*_pins2masks(pins, self.number_of_pins))
+
+    def play(self, states, mask=None, rate=None):
+        if hasattr(states, "tolist"):
+            states = states.tolist()
+        if mask is None:
+            mask = (1 << self.number_of_pins) - 1
+
+        def play(io, offset, pins):
+            io.play([(state >> offset) & pins for state in states], (mask >> offset) & pins, rate)
+
+        self._each(play, self._devices_for(mask))
+
+    def analog_read(self, pin):
+        io, local = self._locate(pin)
+        return io.analog_read(local)
+
+    def analog_write(self, pin, value):
+        if not self._queue_call(self.analog_write, pin, value):
+            io, local = self._locate(pin)
+            io.analog_write(local, value)
+
+    def _event_callback(self, pin):
+        def callback(local):
+            for func in list(self._events.get(pin, ())):
+                func(pin)
+
+        return callback
+
+    def enable_event_detect(self, pin, edge, callback=None, bounce=0):
+        io, local = self._locate(pin)
+        self._events[pin] = [callback] if callback else []
+        io.enable_event_detect(local, edge, self._event_callback(pin), bounce)
+
+    def add_event_callback(self, pin, callback):
+        try:
+            self._events[pin].append(callback)
+        except KeyError:
+            raise RuntimeError("Event detection is not enabled on pin {0}".format(pin))
+
+    def disable_event_detect(self, pin):
+        io, local = self._locate(pin)
+        self._events.pop(pin, None)
+        io.disable_event_detect(local)
+
+    def event_detected(self, pin):
+        io, local = self._locate(pin)
+        return io.event_detected(local)
+
+    def close(self):
+        for executor in self._executors:
+            executor.shutdown()
+        for io, _, _ in self.devices:
+            io.close()
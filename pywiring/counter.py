@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+
+"""
+Quadrature decoders and pulse counters fed by edge events.
+
+Calling Python code that decodes every edge doesn't keep up with encoders
+and flow meters above a few kHz. Instead, the counters register a minimal
+callback with :py:meth:`IOBase.enable_event_detect` that only stores the
+time (and, for quadrature, the level) of each edge in a preallocated
+ring buffer (:py:class:`EdgeRing`). The edges are decoded in batches, with
+NumPy, when the position, rate or missed-edge counters are read or
+:py:meth:`~EdgeCounter.update` is called; no user code runs per edge.
+"""
+
+__all__ = ("EdgeRing", "EdgeCounter", "QuadratureCounter", "PulseCounter")
+
+import threading
+import time
+import weakref
+from array import array
+
+_claimed = weakref.WeakKeyDictionary()
+_claimed_lock = threading.Lock()
+
+
+class EdgeRing(object):
+    """
+    Single-producer, single-consumer ring buffer of :py:data:`size` edges
+    (rounded up to a power of two): :py:attr:`timestamps` holds the time of
+    each edge (:py:func:`time.perf_counter`) and :py:attr:`codes` a byte
+    describing it. They are an :py:class:`array.array` and a
+    :py:class:`bytearray`, which take single items faster than NumPy
+    arrays, and are decoded through NumPy views of their memory.
+
+    The producer (the event thread of the interface) stores the edge and
+    then publishes it by advancing :py:attr:`head`; the consumer only
+    advances its own tail, so neither side takes a lock. Edges overwritten
+    before being consumed are reported by :py:meth:`drain`.
+
+    Requires NumPy.
+    """
+
+    def __init__(self, size=65536):
+        import numpy
+        self._numpy = numpy
+        size = 1 << max(size - 1, 1).bit_length()
+        self.size = size
+        self._index_mask = size - 1
+        self.timestamps = array("d", bytes(8 * size))
+        self.codes = bytearray(size)
+        self._timestamps = numpy.frombuffer(self.timestamps, dtype=numpy.float64)
+        self._codes = numpy.frombuffer(self.codes, dtype=numpy.uint8)
+        self.head = 0
+        self.tail = 0
+
+    def push(self, code):
+        """
+        Stores an edge described by :py:data:`code`, timestamped now. Must
+        only be called from one thread at a time.
+        """
+        head = self.head
+        index = head & self._index_mask
+        self.timestamps[index] = time.perf_counter()
+        self.codes[index] = code
+        self.head = head + 1
+
+    def drain(self):
+        """
+        Returns the (timestamps, codes, lost) edges stored since the last
+        call, as copies; :py:data:`lost` is the number of edges before them
+        that were overwritten before being read.
+        """
+        numpy = self._numpy
+        size = self.size
+        head = self.head
+        tail = self.tail
+        lost = 0
+        if head - tail > size:
+            lost = head - tail - size
+            tail = head - size
+        if head == tail:
+            self.tail = head
+            return numpy.empty(0, numpy.float64), numpy.empty(0, numpy.uint8), lost
+
+        start = tail & self._index_mask
+        end = head & self._index_mask
+        if start < end:
+            timestamps = self._timestamps[start:end].copy()
+            codes = self._codes[start:end].copy()
+        else:
+            timestamps = numpy.concatenate((self._timestamps[start:], self._timestamps[:end]))
+            codes = numpy.concatenate((self._codes[start:], self._codes[:end]))
+        overwritten = self.head - size - tail
+        if overwritten > 0:
+            # The producer lapped us while copying
+            lost += overwritten
+            timestamps = timestamps[overwritten:]
+            codes = codes[overwritten:]
+        self.tail = head
+        return timestamps, codes, lost
+
+
+class EdgeCounter(object):
+    """
+    Base class of the counters. Claims the pins in :py:data:`pins` of
+    :py:data:`io`, sets them as inputs and detects :py:data:`edge` edges
+    on them, ignoring edges closer than :py:data:`bounce` milliseconds
+    where the interface supports it. A pin can only be claimed by one
+    counter at a time.
+
+    :py:attr:`rate` is the average number of counts per second over the
+    last :py:data:`window` seconds, updated when at least that much time
+    has passed since the last update.
+
+    Subclasses implement :py:meth:`_callback` and :py:meth:`_decode`.
+    """
+
+    def __init__(self, io, pins, edge, size=65536, bounce=0, window=0.1, pullup=False):
+        self.io = io
+        self.pins = tuple(pins)
+        self.window = window
+        self.ring = EdgeRing(size)
+        self._position = 0
+        self._missed = 0
+        self._rate = 0.0
+        self._edges = 0
+        self._last_edge = None
+        self._lock = threading.Lock()
+        self._snapshot = (time.perf_counter(), 0)
+
+        with _claimed_lock:
+            claimed = _claimed.setdefault(io, set())
+            taken = claimed.intersection(self.pins)
+            if taken:
+                raise ValueError("Pins {0} are already claimed by another counter".format(sorted(taken)))
+            claimed.update(self.pins)
+
+        try:
+            io.pin_mode_bulk({pin: (True, pullup) for pin in self.pins})
+            self._reset_state()
+            self._enabled = []
+            for channel, pin in enumerate(self.pins):
+                io.enable_event_detect(pin, edge, self._callback(channel, pin), bounce)
+                self._enabled.append(pin)
+        except Exception:
+            self.close()
+            raise
+
+    def _reset_state(self):
+        pass
+
+    def _callback(self, channel, pin):
+        """
+        Returns the function called by the interface on edges of
+        :py:data:`pin`, the :py:data:`channel`-th pin of the counter. It
+        must do as little as possible.
+        """
+        raise NotImplementedError
+
+    def _decode(self, timestamps, codes, lost):
+        """
+        Decodes a batch of edges and returns the (counts, missed) it adds
+        to the position and the missed edges.
+        """
+        raise NotImplementedError
+
+    def update(self):
+        """
+        Decodes the edges recorded since the last update.
+        """
+        with self._lock:
+            timestamps, codes, lost = self.ring.drain()
+            if len(codes) or lost:
+                counts, missed = self._decode(timestamps, codes, lost)
+                self._position += counts
+                self._missed += missed
+                self._edges += len(codes)
+                if len(timestamps):
+                    self._last_edge = float(timestamps[-1])
+
+            now = time.perf_counter()
+            since, position = self._snapshot
+            if now - since >= self.window:
+                self._rate = (self._position - position) / (now - since)
+                self._snapshot = (now, self._position)
+
+    @property
+    def position(self):
+        """
+        Counts accumulated since the counter was created or reset.
+        """
+        self.update()
+        return self._position
+
+    @property
+    def rate(self):
+        """
+        Counts per second over the last :py:attr:`window`.
+        """
+        self.update()
+        return self._rate
+
+    @property
+    def missed(self):
+        """
+        Edges known to be lost: overwritten in the ring buffer before being
+        decoded, or, for quadrature, detected from an impossible sequence
+        of levels.
+        """
+        self.update()
+        return self._missed
+
+    @property
+    def edges(self):
+        """
+        Number of edges decoded.
+        """
+        self.update()
+        return self._edges
+
+    @property
+    def last_edge(self):
+        """
+        :py:func:`time.perf_counter` time of the last edge decoded, or None.
+        """
+        self.update()
+        return self._last_edge
+
+    def reset(self, position=0):
+        """
+        Sets the position to :py:data:`position` and clears the missed-edge
+        counter, after decoding the pending edges.
+        """
+        self.update()
+        with self._lock:
+            self._position = position
+            self._missed = 0
+            self._snapshot = (time.perf_counter(), position)
+
+    def close(self):
+        """
+        Disables event detection on the pins and releases them.
+        """
+        for pin in getattr(self, "_enabled", ()):
+            self.io.disable_event_detect(pin)
+        self._enabled = []
+        with _claimed_lock:
+            claimed = _claimed.get(self.io)
+            if claimed is not None:
+                claimed.difference_update(self.pins)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class QuadratureCounter(EdgeCounter):
+    """
+    Decoder of the A and B outputs of a quadrature encoder, connected to
+    pins :py:data:`a` and :py:data:`b` of :py:data:`io`. Every edge is a
+    count (4x decoding); the position increases when A leads B.
+
+    Each edge is recorded with the levels of both pins, read right after
+    it. When both levels changed since the previous edge, the edge in
+    between was lost: it's counted in :py:attr:`missed`, and the position
+    moves by two counts in the direction of the last valid step. Edges
+    lost to ring buffer overruns are counted too.
+    """
+
+    # Indexed by the previous state << 2 | the new state, a state being
+    # the level of A << 1 | the level of B
+    _TRANSITIONS = (0, -1, 1, 0,
+                    1, 0, 0, -1,
+                    -1, 0, 0, 1,
+                    0, 1, -1, 0)
+
+    def __init__(self, io, a, b, size=65536, bounce=0, window=0.1, pullup=False):
+        import numpy
+        self._numpy = numpy
+        self._table = numpy.array(self._TRANSITIONS, dtype=numpy.int64)
+        self._direction = 0
+        super(QuadratureCounter, self).__init__(io, (a, b), "BOTH", size, bounce, window, pullup)
+
+    def _reset_state(self):
+        levels = self.io.digital_read_bulk(*self.pins)
+        self._state = int(levels[self.pins[0]]) << 1 | int(levels[self.pins[1]])
+
+    def _callback(self, channel, pin):
+        ring = self.ring
+        read_a = self.io._pin_reader(self.pins[0])
+        read_b = self.io._pin_reader(self.pins[1])
+        timestamps = ring.timestamps
+        codes = ring.codes
+        index_mask = ring._index_mask
+        clock = time.perf_counter
+
+        def edge(_pin):
+            head = ring.head
+            index = head & index_mask
+            timestamps[index] = clock()
+            codes[index] = read_a() << 1 | read_b()
+            ring.head = head + 1
+
+        return edge
+
+    def _decode(self, timestamps, codes, lost):
+        numpy = self._numpy
+        count = len(codes)
+        if not count:
+            return 0, lost
+        state = codes.astype(numpy.int64)
+        previous = numpy.empty_like(state)
+        previous[0] = self._state
+        previous[1:] = state[:-1]
+        if lost:
+            # The state before the first edge is unknown
+            previous[0] = state[0]
+        self._state = int(state[-1])
+
+        steps = self._table[previous << 2 | state]
+        # The last valid step before each edge gives the direction of the
+        # ones that skipped a state
+        indices = numpy.where(steps != 0, numpy.arange(count), -1)
+        numpy.maximum.accumulate(indices, out=indices)
+        invalid = (previous ^ state) == 3
+        skipped = int(numpy.count_nonzero(invalid))
+        if skipped:
+            directions = numpy.where(indices >= 0, steps[indices], self._direction)
+            steps[invalid] = 2 * directions[invalid]
+        if indices[-1] >= 0:
+            self._direction = int(steps[indices[-1]])
+        return int(steps.sum()), skipped + lost
+
+
+class PulseCounter(EdgeCounter):
+    """
+    Counter of the :py:data:`edge` edges ("RISING", "FALLING" or "BOTH")
+    on :py:data:`pin` of :py:data:`io`, e.g. the pulses of a flow meter.
+    Only the time of each edge is recorded. Edges lost to ring buffer
+    overruns are counted in :py:attr:`missed` and in the position.
+    """
+
+    def __init__(self, io, pin, edge="RISING", size=65536, bounce=0, window=0.1, pullup=False):
+        super(PulseCounter, self).__init__(io, (pin,), edge, size, bounce, window, pullup)
+
+    def _callback(self, channel, pin):
+        ring = self.ring
+        timestamps = ring.timestamps
+        index_mask = ring._index_mask
+        clock = time.perf_counter
+
+        def edge(_pin):
+            head = ring.head
+            timestamps[head & index_mask] = clock()
+            ring.head = head + 1
+
+        return edge
+
+    def _decode(self, timestamps, codes, lost):
+        return len(codes) + lost, lost
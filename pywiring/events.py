@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+
+"""
+Software edge detection for interfaces that have no native event support.
+
+Each interface's port is read once per tick with its whole-port read,
+compared with the previous state, and the edges are dispatched to the
+callbacks registered with :py:meth:`IOBase.enable_event_detect`.
+"""
+
+__all__ = ("PortWatch", "Poller", "InterruptLine", "PolledEvents", "get_poller")
+
+import logging
+import threading
+import time
+
+EDGES = ("RISING", "FALLING", "BOTH")
+
+_log = logging.getLogger(__name__)
+
+
+def _dispatch(callbacks, pin):
+    """
+    Calls every function in :py:data:`callbacks` with :py:data:`pin`. An
+    exception raised by a callback is logged, and doesn't keep the other
+    ones, nor the thread dispatching the events, from running.
+    """
+    for callback in callbacks:
+        try:
+            callback(pin)
+        except Exception:
+            _log.exception("Exception in the event callback %r of pin %s", callback, pin)
+
+
+class PortWatch(object):
+    """
+    Keeps track of the state of a port and of the pins being watched on
+    it. :py:meth:`update` dispatches the edges between the previous state
+    and a new one.
+
+    :py:data:`read` is the function used to read the port; by default it's
+    the interface's :py:meth:`~IOBase.read_port`.
+    """
+
+    def __init__(self, io, read=None):
+        self.io = io
+        self.read = read or io.read_port
+        self.previous = None
+        self._pins = {}
+        self._lock = threading.Lock()
+
+    @property
+    def mask(self):
+        """
+        Bitmask of the pins being watched.
+        """
+        mask = 0
+        for pin in self._pins:
+            mask |= 1 << pin
+        return mask
+
+    def enable(self, pin, edge, callback=None, bounce=0):
+        if edge not in EDGES:
+            raise ValueError("Invalid edge: {0}".format(edge))
+        with self._lock:
+            # [edge, callbacks, bounce (s), detected, last event time]
+            self._pins[pin] = [edge, [callback] if callback else [], bounce / 1000.0, False, None]
+
+    def add_callback(self, pin, callback):
+        try:
+            self._pins[pin][1].append(callback)
+        except KeyError:
+            raise RuntimeError("Event detection is not enabled on pin {0}".format(pin))
+
+    def disable(self, pin):
+        with self._lock:
+            self._pins.pop(pin, None)
+
+    def detected(self, pin):
+        """
+        Returns whether an event has been detected on :py:data:`pin` since
+        the last call, and clears the flag.
+        """
+        state = self._pins.get(pin)
+        if state is None or not state[3]:
+            return False
+        state[3] = False
+        return True
+
+    def update(self, value, now=None):
+        """
+        Compares :py:data:`value` with the previous state of the port and
+        dispatches the edges on the watched pins. Returns the bitmask of the
+        pins that changed.
+        """
+        with self._lock:
+            previous = self.previous
+            self.previous = value
+            if previous is None:
+                return 0
+            changed = value ^ previous
+            if not changed:
+                return 0
+            if now is None:
+                now = time.monotonic()
+
+            fired = []
+            for pin, state in self._pins.items():
+                if not (changed >> pin) & 1:
+                    continue
+                high = (value >> pin) & 1
+                edge = state[0]
+                if edge != "BOTH" and (edge == "RISING") != bool(high):
+                    continue
+                if state[4] is not None and now - state[4] < state[2]:
+                    continue
+                state[3] = True
+                state[4] = now
+                fired.append((pin, list(state[1])))
+
+        for pin, callbacks in fired:
+            _dispatch(callbacks, pin)
+        return changed
+
+    def poll(self):
+        """
+        Reads the port and dispatches the edges. Returns the bitmask of the
+        pins that changed.
+        """
+        return self.update(self.read())
+
+
+class Poller(object):
+    """
+    Background thread that polls a set of :py:class:`PortWatch` objects.
+
+    The polling interval adapts between :py:data:`min_interval` and
+    :py:data:`max_interval` seconds: it drops to the minimum as soon as a
+    change is detected and doubles on every idle tick. The thread runs only
+    while there is something to watch.
+    """
+
+    def __init__(self, min_interval=0.001, max_interval=0.05):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self._watches = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._ticks = 0
+        self._tick_cpu = 0.0
+        self._tick_time = 0.0
+        self._last_tick_cpu = 0.0
+
+    def add(self, watch):
+        with self._cond:
+            if watch not in self._watches:
+                self._watches.append(watch)
+            self.interval = self.min_interval
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="pywiring-poller")
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify()
+
+    def remove(self, watch):
+        with self._cond:
+            if watch in self._watches:
+                self._watches.remove(watch)
+            self._cond.notify()
+
+    def stats(self):
+        """
+        Returns a dict with the number of ticks, the current interval and
+        the average CPU time and wall time spent per tick, in seconds.
+        """
+        ticks = self._ticks
+        return {
+            "ticks": ticks,
+            "interval": self.interval,
+            "watches": len(self._watches),
+            "last_tick_cpu": self._last_tick_cpu,
+            "avg_tick_cpu": self._tick_cpu / ticks if ticks else 0.0,
+            "avg_tick_time": self._tick_time / ticks if ticks else 0.0,
+        }
+
+    def _run(self):
+        try:
+            self._loop()
+        finally:
+            # Whatever happens, let the next add() start a new thread
+            with self._cond:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                if not self._watches:
+                    self._thread = None
+                    return
+                watches = list(self._watches)
+
+            start_cpu = time.thread_time()
+            start = time.perf_counter()
+            changed = False
+            for watch in watches:
+                try:
+                    changed |= bool(watch.poll())
+                except (IOError, OSError):
+                    pass
+                except Exception:
+                    _log.exception("Exception while polling %r", watch)
+            cpu = time.thread_time() - start_cpu
+            self._ticks += 1
+            self._last_tick_cpu = cpu
+            self._tick_cpu += cpu
+            self._tick_time += time.perf_counter() - start
+
+            with self._cond:
+                if changed:
+                    self.interval = self.min_interval
+                else:
+                    self.interval = min(self.interval * 2, self.max_interval)
+                self._cond.wait(self.interval)
+
+
+_poller = None
+_poller_lock = threading.Lock()
+
+
+def get_poller():
+    """
+    Returns the poller shared by all the interfaces, creating it if needed.
+    """
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            _poller = Poller()
+        return _poller
+
+
+class InterruptLine(object):
+    """
+    An interrupt line, such as the open-drain /INT output of one or more
+    PCF8574 expanders, connected to pin :py:data:`pin` of the interface
+    :py:data:`host`, which must support event detection (e.g.
+    :py:class:`~pywiring.raspi.RasPiIO`).
+
+    The ports attached to the line are read only when it's asserted (pulled
+    low), instead of being polled. If several devices share the line, all
+    of them are read on every interrupt, which also releases the line.
+
+    Use :py:meth:`PolledEvents.use_interrupt` to attach an interface.
+    """
+
+    max_rounds = 4
+    """
+    Maximum number of times the attached ports are read on a single
+    interrupt if the line is still asserted after reading them.
+    """
+
+    def __init__(self, host, pin, pullup=True):
+        self.host = host
+        self.pin = pin
+        self._watches = []
+        self._lock = threading.Lock()
+        host.pin_mode(pin, True, pullup=pullup)
+        host.enable_event_detect(pin, "FALLING", self._on_interrupt)
+
+    def attach(self, watch):
+        with self._lock:
+            if watch not in self._watches:
+                if watch.previous is None:
+                    # Reading the port also releases the line
+                    watch.previous = watch.read()
+                self._watches.append(watch)
+
+    def detach(self, watch):
+        with self._lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+
+    def service(self):
+        """
+        Reads all the attached ports and dispatches their edges, until the
+        line is released.
+        """
+        with self._lock:
+            watches = list(self._watches)
+        for _ in range(self.max_rounds):
+            for watch in watches:
+                try:
+                    watch.poll()
+                except (IOError, OSError):
+                    pass
+            if self.host.digital_read(self.pin):
+                break
+
+    def _on_interrupt(self, pin):
+        self.service()
+
+    def close(self):
+        """
+        Disables event detection on the host pin.
+        """
+        self.host.disable_event_detect(self.pin)
+
+
+class PolledEvents(object):
+    """
+    Mixin implementing the :py:class:`IOBase` event API by polling the
+    port with a :py:class:`Poller`. By default the shared poller returned
+    by :py:func:`get_poller` is used; set :py:attr:`poller` to use another
+    one.
+
+    Alternatively, if the device has an interrupt output, it can be read
+    only when the interrupt fires by attaching it to an
+    :py:class:`InterruptLine` with :py:meth:`use_interrupt`.
+
+    Callbacks are called from the poller thread, or from the thread
+    dispatching the host's events when an interrupt line is used.
+    """
+
+    poller = None
+    interrupt = None
+    _watch = None
+
+    def _event_port_read(self):
+        return self.read_port()
+
+    def _event_watch(self):
+        if self._watch is None:
+            self._watch = PortWatch(self, self._event_port_read)
+        return self._watch
+
+    def _event_poller(self):
+        return self.poller or get_poller()
+
+    def _start_events(self, watch):
+        if self.interrupt is not None:
+            self.interrupt.attach(watch)
+        else:
+            self._event_poller().add(watch)
+
+    def _stop_events(self, watch):
+        if self.interrupt is not None:
+            self.interrupt.detach(watch)
+        else:
+            self._event_poller().remove(watch)
+        watch.previous = None
+
+    def use_interrupt(self, line):
+        """
+        Reads the port only when the :py:class:`InterruptLine`
+        :py:data:`line` is asserted, instead of polling it. Pass None to go
+        back to polling.
+        """
+        watch = self._event_watch()
+        if watch.mask:
+            self._stop_events(watch)
+        self.interrupt = line
+        if watch.mask:
+            self._start_events(watch)
+
+    def enable_event_detect(self, pin, edge, callback=None, bounce=0):
+        watch = self._event_watch()
+        watch.enable(pin, edge, callback, bounce)
+        self._start_events(watch)
+
+    def add_event_callback(self, pin, callback):
+        self._event_watch().add_callback(pin, callback)
+
+    def disable_event_detect(self, pin):
+        watch = self._event_watch()
+        watch.disable(pin)
+        if not watch.mask:
+            self._stop_events(watch)
+
+    def event_detected(self, pin):
+        return self._event_watch().detected(pin)
+
+    def close(self):
+        if self._watch is not None:
+            self._stop_events(self._watch)
+        super(PolledEvents, self).close()
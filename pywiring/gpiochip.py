@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+
+"""
+Backend for the Linux GPIO character device (/dev/gpiochipN), using the
+v2 uAPI. It works on any board whose GPIOs are exposed by the kernel,
+including the Raspberry Pi.
+
+All the lines are requested at once, so any number of pins is read or
+written with a single ioctl, and multi-line writes are atomic. Edge
+detection uses the kernel's timestamped edge events instead of polling.
+
+The ioctl layer is a separate object (:py:class:`LinuxGPIOChip`), which
+can be replaced by any object with the same interface, e.g. an in-process
+fake chip.
+"""
+
+__all__ = ("GPIOChipIO", "LinuxGPIOChip")
+
+import ctypes
+import fcntl
+import os
+import select
+import threading
+
+from . import IOBase, _pins2masks, _mask2pins
+from .events import EDGES, _dispatch
+
+GPIO_V2_LINES_MAX = 64
+GPIO_MAX_NAME_SIZE = 32
+GPIO_V2_LINE_NUM_ATTRS_MAX = 10
+
+# Line flags
+GPIO_V2_LINE_FLAG_USED = 1 << 0
+GPIO_V2_LINE_FLAG_ACTIVE_LOW = 1 << 1
+GPIO_V2_LINE_FLAG_INPUT = 1 << 2
+GPIO_V2_LINE_FLAG_OUTPUT = 1 << 3
+GPIO_V2_LINE_FLAG_EDGE_RISING = 1 << 4
+GPIO_V2_LINE_FLAG_EDGE_FALLING = 1 << 5
+GPIO_V2_LINE_FLAG_OPEN_DRAIN = 1 << 6
+GPIO_V2_LINE_FLAG_OPEN_SOURCE = 1 << 7
+GPIO_V2_LINE_FLAG_BIAS_PULL_UP = 1 << 8
+GPIO_V2_LINE_FLAG_BIAS_PULL_DOWN = 1 << 9
+GPIO_V2_LINE_FLAG_BIAS_DISABLED = 1 << 10
+
+# Line attribute ids
+GPIO_V2_LINE_ATTR_ID_FLAGS = 1
+GPIO_V2_LINE_ATTR_ID_OUTPUT_VALUES = 2
+GPIO_V2_LINE_ATTR_ID_DEBOUNCE = 3
+
+# Edge event ids
+GPIO_V2_LINE_EVENT_RISING_EDGE = 1
+GPIO_V2_LINE_EVENT_FALLING_EDGE = 2
+
+
+class gpiochip_info(ctypes.Structure):
+    _fields_ = [("name", ctypes.c_char * GPIO_MAX_NAME_SIZE),
+                ("label", ctypes.c_char * GPIO_MAX_NAME_SIZE),
+                ("lines", ctypes.c_uint32)]
+
+
+class _gpio_v2_line_attribute_value(ctypes.Union):
+    _fields_ = [("flags", ctypes.c_uint64),
+                ("values", ctypes.c_uint64),
+                ("debounce_period_us", ctypes.c_uint32)]
+
+
+class gpio_v2_line_attribute(ctypes.Structure):
+    _anonymous_ = ("value",)
+    _fields_ = [("id", ctypes.c_uint32),
+                ("padding", ctypes.c_uint32),
+                ("value", _gpio_v2_line_attribute_value)]
+
+
+class gpio_v2_line_config_attribute(ctypes.Structure):
+    _fields_ = [("attr", gpio_v2_line_attribute),
+                ("mask", ctypes.c_uint64)]
+
+
+class gpio_v2_line_config(ctypes.Structure):
+    _fields_ = [("flags", ctypes.c_uint64),
+                ("num_attrs", ctypes.c_uint32),
+                ("padding", ctypes.c_uint32 * 5),
+                ("attrs", gpio_v2_line_config_attribute * GPIO_V2_LINE_NUM_ATTRS_MAX)]
+
+
+class gpio_v2_line_request(ctypes.Structure):
+    _fields_ = [("offsets", ctypes.c_uint32 * GPIO_V2_LINES_MAX),
+                ("consumer", ctypes.c_char * GPIO_MAX_NAME_SIZE),
+                ("config", gpio_v2_line_config),
+                ("num_lines", ctypes.c_uint32),
+                ("event_buffer_size", ctypes.c_uint32),
+                ("padding", ctypes.c_uint32 * 5),
+                ("fd", ctypes.c_int32)]
+
+
+class gpio_v2_line_values(ctypes.Structure):
+    _fields_ = [("bits", ctypes.c_uint64),
+                ("mask", ctypes.c_uint64)]
+
+
+class gpio_v2_line_event(ctypes.Structure):
+    _fields_ = [("timestamp_ns", ctypes.c_uint64),
+                ("id", ctypes.c_uint32),
+                ("offset", ctypes.c_uint32),
+                ("seqno", ctypes.c_uint32),
+                ("line_seqno", ctypes.c_uint32),
+                ("padding", ctypes.c_uint32 * 6)]
+
+
+def _IOR(nr, struct):
+    return (2 << 30) | (ctypes.sizeof(struct) << 16) | (0xB4 << 8) | nr
+
+
+def _IOWR(nr, struct):
+    return (3 << 30) | (ctypes.sizeof(struct) << 16) | (0xB4 << 8) | nr
+
+
+GPIO_GET_CHIPINFO_IOCTL = _IOR(0x01, gpiochip_info)
+GPIO_V2_GET_LINE_IOCTL = _IOWR(0x07, gpio_v2_line_request)
+GPIO_V2_LINE_SET_CONFIG_IOCTL = _IOWR(0x0D, gpio_v2_line_config)
+GPIO_V2_LINE_GET_VALUES_IOCTL = _IOWR(0x0E, gpio_v2_line_values)
+GPIO_V2_LINE_SET_VALUES_IOCTL = _IOWR(0x0F, gpio_v2_line_values)
+
+
+def _build_config(lines, values):
+    """
+    Builds a :py:class:`gpio_v2_line_config` from a list of
+    (flags, debounce_us) tuples, one per requested line, and the bitmask of
+    the output values.
+    """
+    config = gpio_v2_line_config()
+    groups = {}
+    debounce = {}
+    outputs = 0
+    for index, (flags, debounce_us) in enumerate(lines):
+        groups[flags] = groups.get(flags, 0) | (1 << index)
+        if debounce_us:
+            debounce[debounce_us] = debounce.get(debounce_us, 0) | (1 << index)
+        if flags & GPIO_V2_LINE_FLAG_OUTPUT:
+            outputs |= 1 << index
+
+    # The most common flags are the default; the other ones become attributes
+    default = max(groups, key=lambda flags: bin(groups[flags]).count("1")) if groups else 0
+    config.flags = default
+    attrs = []
+    for flags, mask in groups.items():
+        if flags != default:
+            attrs.append((GPIO_V2_LINE_ATTR_ID_FLAGS, "flags", flags, mask))
+    for debounce_us, mask in debounce.items():
+        attrs.append((GPIO_V2_LINE_ATTR_ID_DEBOUNCE, "debounce_period_us", debounce_us, mask))
+    if outputs:
+        attrs.append((GPIO_V2_LINE_ATTR_ID_OUTPUT_VALUES, "values", values & outputs, outputs))
+    if len(attrs) > GPIO_V2_LINE_NUM_ATTRS_MAX:
+        raise ValueError("Too many different line configurations")
+
+    config.num_attrs = len(attrs)
+    for i, (attr_id, field, value, mask) in enumerate(attrs):
+        config.attrs[i].attr.id = attr_id
+        setattr(config.attrs[i].attr, field, value)
+        config.attrs[i].mask = mask
+    return config
+
+
+class LinuxLineRequest(object):
+    """
+    A set of lines requested from a :py:class:`LinuxGPIOChip`. Line
+    values are bitmasks indexed by the position of the line in the
+    request, not by its offset on the chip.
+    """
+
+    def __init__(self, chip, fd, offsets):
+        self.chip = chip
+        self.fd = fd
+        self.offsets = offsets
+
+    def get_values(self, mask):
+        values = gpio_v2_line_values(0, mask)
+        self.chip._ioctl(self.fd, GPIO_V2_LINE_GET_VALUES_IOCTL, values)
+        return values.bits
+
+    def set_values(self, bits, mask):
+        self.chip._ioctl(self.fd, GPIO_V2_LINE_SET_VALUES_IOCTL, gpio_v2_line_values(bits, mask))
+
+    def set_config(self, lines, values):
+        self.chip._ioctl(self.fd, GPIO_V2_LINE_SET_CONFIG_IOCTL, _build_config(lines, values))
+
+    def wait_events(self, timeout):
+        """
+        Waits up to :py:data:`timeout` seconds for edge events and returns
+        them as a list of (timestamp_ns, rising, offset) tuples.
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        size = ctypes.sizeof(gpio_v2_line_event)
+        data = os.read(self.fd, size * 16)
+        events = []
+        for start in range(0, len(data) - size + 1, size):
+            event = gpio_v2_line_event.from_buffer_copy(data, start)
+            events.append((event.timestamp_ns, event.id == GPIO_V2_LINE_EVENT_RISING_EDGE, event.offset))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class LinuxGPIOChip(object):
+    """
+    The ioctl layer used by :py:class:`GPIOChipIO`, operating on the GPIO
+    character device at :py:data:`path`.
+
+    All the ioctls, on the chip and on the line requests, go through
+    :py:meth:`_ioctl`, and the device is opened by :py:meth:`_open`, so
+    that a subclass can stand in for the kernel, e.g. to test the
+    backend with a fake chip.
+    """
+
+    def __init__(self, path="/dev/gpiochip0"):
+        self.path = path
+        self.fd = self._open(path)
+
+    def _open(self, path):
+        return os.open(path, os.O_RDWR | os.O_CLOEXEC)
+
+    def _ioctl(self, fd, request, arg):
+        return fcntl.ioctl(fd, request, arg)
+
+    def num_lines(self):
+        info = gpiochip_info()
+        self._ioctl(self.fd, GPIO_GET_CHIPINFO_IOCTL, info)
+        return info.lines
+
+    def request_lines(self, offsets, lines, values, consumer="pywiring"):
+        """
+        Requests the lines at :py:data:`offsets`, configured as described
+        by :py:data:`lines`, a list of (flags, debounce_us) tuples, and
+        :py:data:`values`, the bitmask of the initial output values.
+        Returns a :py:class:`LinuxLineRequest`.
+        """
+        request = gpio_v2_line_request()
+        for i, offset in enumerate(offsets):
+            request.offsets[i] = offset
+        request.num_lines = len(offsets)
+        request.consumer = consumer.encode()[:GPIO_MAX_NAME_SIZE - 1]
+        request.config = _build_config(lines, values)
+        self._ioctl(self.fd, GPIO_V2_GET_LINE_IOCTL, request)
+        return LinuxLineRequest(self, request.fd, list(offsets))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class GPIOChipIO(IOBase):
+    """
+    I/O through the Linux GPIO character device.
+
+    :py:data:`chip` is the path of the device (default /dev/gpiochip0) or
+    an object implementing the :py:class:`LinuxGPIOChip` interface.
+    :py:data:`lines` is the list of line offsets to use: pin ``n`` of the
+    interface is line ``lines[n]`` of the chip. By default all the lines of
+    the chip are used, up to 64. All the lines are requested as inputs
+    when the interface is created.
+
+    Event callbacks are called from a background thread reading the
+    kernel's edge events. The kernel timestamp (in nanoseconds, from
+    CLOCK_MONOTONIC) of the last event on a pin is returned by
+    :py:meth:`event_timestamp`.
+    """
+
+    number_of_pins = 0
+    has_adc = False
+    has_pwm = False
+    has_input = True
+    pullup_resistors = True
+    pulldown_resistors = True
+
+    def __init__(self, chip="/dev/gpiochip0", lines=None, consumer="pywiring"):
+        super(GPIOChipIO, self).__init__()
+        self._chip = LinuxGPIOChip(chip) if isinstance(chip, str) else chip
+        if lines is None:
+            lines = range(min(self._chip.num_lines(), GPIO_V2_LINES_MAX))
+        self.lines = list(lines)
+        self.number_of_pins = len(self.lines)
+        self._offsets = {offset: pin for pin, offset in enumerate(self.lines)}
+        self._config = [(GPIO_V2_LINE_FLAG_INPUT, 0)] * self.number_of_pins
+        self._outputs = 0
+        self._values = 0
+        self._events = {}
+        self._thread = None
+        self._running = False
+        self._request = self._chip.request_lines(self.lines, self._config, 0, consumer)
+
+    @property
+    def bus_id(self):
+        return ("gpiochip", getattr(self._chip, "path", id(self._chip)))
+
+    def get_pin_modes(self):
+        return [["INPUT", "OUTPUT", "EDGE"]] * self.number_of_pins
+
+    def _configure(self, pin, flags, debounce_us=0):
+        self._config[pin] = (flags, debounce_us)
+        if flags & GPIO_V2_LINE_FLAG_OUTPUT:
+            self._outputs |= 1 << pin
+        else:
+            self._outputs &= ~(1 << pin)
+
+    def pin_mode(self, pin, input, pullup=False, pulldown=False):
+        if pullup and pulldown:
+            raise ValueError("Pin {0} can't have both a pull-up and a pull-down resistor attached to it.".format(pin))
+        self._configure(pin, self._mode_flags(input, pullup, pulldown))
+        self._request.set_config(self._config, self._values)
+
+    def pin_mode_bulk(self, pins):
+        for pin in pins:
+            self._configure(pin, self._mode_flags(*pins[pin]))
+        self._request.set_config(self._config, self._values)
+
+    def port_mode(self, input, pullup=False, pulldown=False):
+        self.pin_mode_bulk({pin: (input, pullup, pulldown) for pin in range(self.number_of_pins)})
+
+    @staticmethod
+    def _mode_flags(input, pullup=False, pulldown=False):
+        flags = GPIO_V2_LINE_FLAG_INPUT if input else GPIO_V2_LINE_FLAG_OUTPUT
+        if pullup:
+            flags |= GPIO_V2_LINE_FLAG_BIAS_PULL_UP
+        elif pulldown:
+            flags |= GPIO_V2_LINE_FLAG_BIAS_PULL_DOWN
+        else:
+            flags |= GPIO_V2_LINE_FLAG_BIAS_DISABLED
+        return flags
+
+    def read_port(self):
+        value = self._request.get_values((1 << self.number_of_pins) - 1)
+        if self._batch_depth:
+            value = self._apply_pending(value, self._outputs)
+        return value
+
+    def digital_read(self, pin):
+        if 0 <= pin < self.number_of_pins:
+            return bool((self.read_port() >> pin) & 1)
+        return None
+
+    def digital_read_bulk(self, *pins):
+        return _mask2pins(self.read_port(), pins, self.number_of_pins)
+
+    def write_port(self, mask):
+        self.modify_port(mask & self._outputs, ~mask & self._outputs)
+
+    def modify_port(self, set_mask, clear_mask):
+        if self._queue_write(set_mask, clear_mask):
+            return
+        mask = (set_mask | clear_mask) & self._outputs
+        if mask:
+            self._request.set_values(set_mask & mask, mask)
+            self._values = (self._values & ~mask) | (set_mask & mask)
+
+    def digital_write(self, pin, high):
+        if high:
+            self.modify_port(1 << pin, 0)
+        else:
+            self.modify_port(0, 1 << pin)
+
+    def digital_write_bulk(self, pins):
+        self.modify_port(*_pins2masks(pins, self.number_of_pins))
+
+    def analog_read(self, pin):
+        return 255 if self.digital_read(pin) else 0
+
+    def analog_write(self, pin, value):
+        self.digital_write(pin, value > 0)
+
+    def enable_event_detect(self, pin, edge, callback=None, bounce=0):
+        if edge not in EDGES:
+            raise ValueError("Invalid edge: {0}".format(edge))
+        flags = self._config[pin][0] & ~(GPIO_V2_LINE_FLAG_EDGE_RISING | GPIO_V2_LINE_FLAG_EDGE_FALLING)
+        if edge in ("RISING", "BOTH"):
+            flags |= GPIO_V2_LINE_FLAG_EDGE_RISING
+        if edge in ("FALLING", "BOTH"):
+            flags |= GPIO_V2_LINE_FLAG_EDGE_FALLING
+        # [callbacks, detected, last timestamp]
+        self._events[pin] = [[callback] if callback else [], False, None]
+        self._configure(pin, flags, int(bounce * 1000))
+        self._request.set_config(self._config, self._values)
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._read_events, name="pywiring-gpiochip")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def add_event_callback(self, pin, callback):
+        try:
+            self._events[pin][0].append(callback)
+        except KeyError:
+            raise RuntimeError("Event detection is not enabled on pin {0}".format(pin))
+
+    def disable_event_detect(self, pin):
+        if self._events.pop(pin, None) is None:
+            return
+        flags = self._config[pin][0] & ~(GPIO_V2_LINE_FLAG_EDGE_RISING | GPIO_V2_LINE_FLAG_EDGE_FALLING)
+        self._configure(pin, flags)
+        self._request.set_config(self._config, self._values)
+
+    def event_detected(self, pin):
+        state = self._events.get(pin)
+        if state is None or not state[1]:
+            return False
+        state[1] = False
+        return True
+
+    def event_timestamp(self, pin):
+        """
+        Returns the kernel timestamp, in nanoseconds, of the last event
+        detected on :py:data:`pin`, or None.
+        """
+        state = self._events.get(pin)
+        return state[2] if state is not None else None
+
+    def _read_events(self):
+        while self._running:
+            for timestamp, rising, offset in self._request.wait_events(0.1):
+                pin = self._offsets.get(offset)
+                state = self._events.get(pin)
+                if state is None:
+                    continue
+                state[1] = True
+                state[2] = timestamp
+                _dispatch(list(state[0]), pin)
+
+    def close(self):
+        self._events.clear()
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._request.close()
+        self._chip.close()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+"""
+Register-level access to the BCM283x GPIO block through /dev/gpiomem.
+
+The level of all the GPIOs in bank 0 (BCM 0 to 31) is read with a single
+load from GPLEV0, and any set of pins is pulled high or low with a single
+store to GPSET0 or GPCLR0. Pin setup is left to RPi.GPIO; the function
+selected for each pin can be read back from the GPFSEL registers.
+"""
+
+__all__ = ("GPIOMem",)
+
+import mmap
+import os
+
+BLOCK_SIZE = 4096
+
+# Register offsets, in bytes
+GPFSEL0 = 0x00
+GPSET0 = 0x1C
+GPCLR0 = 0x28
+GPLEV0 = 0x34
+
+
+class GPIOMem(object):
+    """
+    Maps the GPIO registers from :py:data:`path` (by default
+    /dev/gpiomem, which unprivileged users in the gpio group can open).
+    Any file at least :py:const:`BLOCK_SIZE` bytes long can be used in its
+    place, e.g. to check the register logic on a machine without GPIOs.
+    """
+
+    def __init__(self, path="/dev/gpiomem"):
+        fd = os.open(path, os.O_RDWR | os.O_SYNC)
+        try:
+            self._mmap = mmap.mmap(fd, BLOCK_SIZE, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+        self._regs = memoryview(self._mmap).cast("I")
+
+    def read_levels(self):
+        """
+        Returns the level of BCM pins 0 to 31 as a bitmask.
+        """
+        return self._regs[GPLEV0 // 4]
+
+    def read_function(self, pin):
+        """
+        Returns the function selected for BCM pin :py:data:`pin`: 0 for an
+        input, 1 for an output, 2 to 7 for the alternate functions. Each
+        GPFSEL register holds the 3-bit fields of ten pins.
+        """
+        return (self._regs[GPFSEL0 // 4 + pin // 10] >> (pin % 10 * 3)) & 7
+
+    def set(self, mask):
+        """
+        Pulls high the output pins in :py:data:`mask`.
+        """
+        if mask:
+            self._regs[GPSET0 // 4] = mask & 0xFFFFFFFF
+
+    def clear(self, mask):
+        """
+        Pulls low the output pins in :py:data:`mask`.
+        """
+        if mask:
+            self._regs[GPCLR0 // 4] = mask & 0xFFFFFFFF
+
+    def close(self):
+        self._regs.release()
+        self._mmap.close()
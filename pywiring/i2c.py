@@ -1,13 +1,16 @@
 # -*- coding: utf-8 -*-
 
-__all__ = ("I2CIOBase", "PCF8574IO", "LCDBackpack")
+__all__ = ("SharedBus", "open_bus", "I2CIOBase", "PCF8574IO", "PCF8575IO", "MCP23017IO", "LCDBackpack")
 
+import errno
+import os
+import threading
 from abc import ABC
+from collections import deque
+from time import monotonic
 
-import smbus
-from numpy import uint8
-
-from . import IOBase
+from . import IOBase, _pins2masks, _mask2pins, _paced, hardware_module
+from .events import PolledEvents
 
 
 def num2boolgen(num):
@@ -15,25 +18,227 @@ def num2boolgen(num):
         yield bit == "1"
 
 
+_buses = {}
+_buses_lock = threading.Lock()
+_get_ident = threading.get_ident
+
+I2C_BLOCK_MAX = 32
+"""
+Maximum number of data bytes in an SMBus block transaction.
+"""
+
+
+def _bus_method(name):
+    def method(self, *args):
+        return self._call(getattr(self._smbus, name), args)
+
+    method.__name__ = name
+    method.__doc__ = "Thread-safe version of :py:meth:`smbus.SMBus.{0}`.".format(name)
+    return method
+
+
+class _BusLock(object):
+    """
+    Reentrant lock that records the thread holding it in :py:attr:`owner`.
+    """
+
+    __slots__ = ("_lock", "_depth", "owner")
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._depth = 0
+        self.owner = None
+
+    def acquire(self, blocking=True, timeout=-1):
+        if not self._lock.acquire(blocking, timeout):
+            return False
+        self.owner = _get_ident()
+        self._depth += 1
+        return True
+
+    __enter__ = acquire
+
+    def release(self):
+        self._depth -= 1
+        if not self._depth:
+            self.owner = None
+        self._lock.release()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class SharedBus(object):
+    """
+    An SMBus handle shared by all the devices on the same I2C bus in the
+    process. Use :py:func:`open_bus` to get one.
+
+    All the transactions are serialized. Requests issued concurrently by
+    several threads are queued, and whichever thread acquires the bus
+    issues all the queued transactions back-to-back, instead of handing
+    the bus over after each one.
+
+    :py:attr:`lock` can be held to issue several transactions (e.g. a
+    read-modify-write) without other threads interleaving: while a thread
+    holds it, only that thread's transactions are issued, and the ones
+    queued by other threads wait until it's released.
+    """
+
+    def __init__(self, number):
+        self.number = number
+        self.lock = _BusLock()
+        self._queue = deque()
+        self._refcount = 0
+        module = hardware_module("smbus")
+        self._smbus = module.SMBus()
+        self._smbus.open(number)
+        # Handle issuing plain I2C transactions, and its i2c_msg class:
+        # smbus2's. Opened on first use if the smbus module isn't smbus2.
+        self._rdwr = None
+        self._i2c_msg = None
+        if hasattr(module, "i2c_msg") and hasattr(self._smbus, "i2c_rdwr"):
+            self._i2c_msg = module.i2c_msg
+            self._rdwr = self._smbus
+
+    def _call(self, func, args):
+        if self.lock.owner == _get_ident():
+            # Held by an outer caller of this thread: the transactions
+            # queued by other threads must not run in the middle of its
+            # sequence
+            return func(*args)
+        # [function, args, done, result, exception]
+        request = [func, args, False, None, None]
+        self._queue.append(request)
+        # The queued functions don't use the lock: it's taken without
+        # recording the owner
+        with self.lock._lock:
+            queue = self._queue
+            while not request[2]:
+                queued = queue.popleft()
+                try:
+                    queued[3] = queued[0](*queued[1])
+                except Exception as e:
+                    queued[4] = e
+                except BaseException:
+                    # e.g. KeyboardInterrupt: the request it interrupted
+                    # fails, and this thread's own request is withdrawn
+                    queued[4] = IOError(errno.EINTR, os.strerror(errno.EINTR))
+                    queued[2] = True
+                    if not request[2]:
+                        queue.remove(request)
+                    raise
+                queued[2] = True
+        if request[4] is not None:
+            raise request[4]
+        return request[3]
+
+    read_byte = _bus_method("read_byte")
+    write_byte = _bus_method("write_byte")
+    read_byte_data = _bus_method("read_byte_data")
+    write_byte_data = _bus_method("write_byte_data")
+    read_word_data = _bus_method("read_word_data")
+    write_word_data = _bus_method("write_word_data")
+    read_i2c_block_data = _bus_method("read_i2c_block_data")
+    write_i2c_block_data = _bus_method("write_i2c_block_data")
+
+    def write_bytes(self, address, data, step=I2C_BLOCK_MAX + 1):
+        """
+        Writes the raw bytes in :py:data:`data` to the device at
+        :py:data:`address`, using as few transactions as possible. The bytes
+        are sent as I2C block writes whose command byte is the first byte of
+        each chunk, so each transaction carries up to :py:data:`step`
+        (at most :py:const:`I2C_BLOCK_MAX` + 1) bytes.
+        """
+        smbus = self._smbus
+        with self.lock:
+            for i in range(0, len(data), step):
+                chunk = data[i:i + step]
+                if len(chunk) == 1:
+                    self._call(smbus.write_byte, (address, chunk[0]))
+                else:
+                    self._call(smbus.write_i2c_block_data, (address, chunk[0], chunk[1:]))
+
+    def read_bytes(self, address, count):
+        """
+        Reads :py:data:`count` raw bytes from the device at
+        :py:data:`address` in a single plain I2C read, without the command
+        byte SMBus reads write first. It uses smbus2's ``i2c_rdwr``: if the
+        smbus module isn't smbus2, the bus is also opened with the smbus2
+        module, which raises :py:exc:`IOError` if it isn't installed.
+        """
+        if self._rdwr is None:
+            self._open_rdwr()
+        msg = self._i2c_msg.read(address, count)
+        self._call(self._rdwr.i2c_rdwr, (msg,))
+        return list(msg)
+
+    def _open_rdwr(self):
+        with self.lock:
+            if self._rdwr is not None:
+                return
+            try:
+                module = hardware_module("smbus2")
+                self._i2c_msg = module.i2c_msg
+                self._rdwr = module.SMBus(self.number)
+            except ImportError:
+                raise IOError("Plain I2C reads on bus {0} need smbus2, which isn't installed".format(self.number))
+
+    def close(self):
+        """
+        Releases the bus. The underlying handle is closed when all the
+        devices using it have released it.
+        """
+        with _buses_lock:
+            self._refcount -= 1
+            if self._refcount:
+                return
+            del _buses[self.number]
+        with self.lock:
+            self._smbus.close()
+            if self._rdwr is not None and self._rdwr is not self._smbus:
+                self._rdwr.close()
+            self._rdwr = None
+
+
+def open_bus(number):
+    """
+    Returns the :py:class:`SharedBus` for I2C bus :py:data:`number`,
+    opening it if no other device is using it. Each call must be matched
+    by a call to :py:meth:`SharedBus.close`.
+    """
+    with _buses_lock:
+        bus = _buses.get(number)
+        if bus is None:
+            bus = _buses[number] = SharedBus(number)
+        bus._refcount += 1
+        return bus
+
+
 class I2CIOBase(IOBase, ABC):
     """
     Base class for I2C-based I/O ports.
+
+    Devices on the same bus share a single :py:class:`SharedBus`.
     """
 
     def __init__(self, bus, address):
         super(I2CIOBase, self).__init__()
-        self._bus = smbus.SMBus()
-        self._bus.open(bus)
+        self._bus = open_bus(bus)
+        self.bus = bus
         self.address = address
 
+    @property
+    def bus_id(self):
+        return ("i2c", self.bus)
+
     def close(self):
         """
-        Closes the I2C bus.
+        Releases the I2C bus.
         """
         self._bus.close()
 
 
-class PCF8574IO(I2CIOBase, ABC):
+class PCF8574IO(PolledEvents, I2CIOBase, ABC):
     """
     Class that provides basic I2C communication methods,
     adapted for the PCF8574 integrated circuit.
@@ -42,86 +247,453 @@ class PCF8574IO(I2CIOBase, ABC):
     the I2C bus you want to use. :py:const:`address` is the I2C
     address of the device.
 
-    The port has 8 pins. It has no ADC or PWM pins.
+    The port has 8 pins. It has no ADC. :py:meth:`analog_write` sends a
+    software PWM wave of :py:attr:`pwm_frequency` Hz, generated by the
+    shared scheduler in :py:mod:`pywiring.pwm`.
+
+    If :py:const:`read_cache_ttl` is greater than 0, the state of the port
+    is cached for that many seconds, and reads within that time window are
+    served without touching the bus. The cache is invalidated by every
+    write, including pin mode changes, and by :py:meth:`refresh`. The
+    number of reads served from the cache and from the bus is available in
+    :py:attr:`cache_hits` and :py:attr:`cache_misses`.
+
+    Event detection is implemented by polling the port in the background
+    (see :py:mod:`pywiring.events`).
+
+    If :py:const:`shared` is True, the output state and the pin directions
+    are kept in shared memory (see :py:mod:`pywiring.shared`) instead of in
+    the object, so that several processes can drive different pins of the
+    same device: every write is a read-modify-write of the shared state,
+    under a lock held across processes, and costs a single bus transaction.
+    :py:meth:`read_outputs` returns the state of the output pins, as written
+    by any process, without touching the bus.
     """
 
     number_of_pins = 8
     had_adc = False
-    has_pwm = False
+    has_pwm = True
     has_input = True
     avg_exec_time = 0.005
     pullup_resistors = False
     pulldown_resistors = False
 
-    def __init__(self, bus, address):
+    _port_mask = 0xFF
+    _shared_format = "BB"
+
+    def __init__(self, bus, address, read_cache_ttl=0, shared=False):
         super(PCF8574IO, self).__init__(bus, address)
-        self._dirmask = uint8(0xFF)  # All inputs
-        self._shadow = self._bus.read_byte(self.address)
+        self.read_cache_ttl = read_cache_ttl
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache = 0
+        self._cache_time = None
+        self._dirmask = self._port_mask  # All inputs
+        self._shadow = self._read_raw()
+        self._shared = None
+        self._lock = self._bus.lock
+        if shared:
+            from .shared import SharedState
+            self._shared = self._lock = SharedState("pywiring-i2c{0}-{1:02x}".format(bus, address), self,
+                                                    ("_shadow", "_dirmask"), self._shared_format,
+                                                    self._bus.lock)
+
+    def _read_raw(self):
+        return self._bus.read_byte(self.address)
+
+    def _write_raw(self, value):
+        self._bus.write_byte(self.address, value)
+
+    def _write_states(self, states):
+        # The device latches every byte of a write transaction
+        self._bus.write_bytes(self.address, states)
 
     def get_pin_modes(self):
-        return [["OUTPUT", "INPUT"]] * 8
+        return [["OUTPUT", "INPUT", "PWM", "SWPWM", "EDGE"]] * self.number_of_pins
 
     def pin_mode(self, pin, input, pullup=False, pulldown=False, localonly=False):
-        if input:
-            self._dirmask |= uint8(1 << pin)
-        else:
-            self._dirmask &= ~uint8(1 << pin)
-        if not localonly:
-            self._poweroff_inputs()
+        with self._lock:
+            if input:
+                self._dirmask |= 1 << pin
+            else:
+                self._dirmask &= ~(1 << pin) & self._port_mask
+            if not localonly:
+                self._poweroff_inputs()
 
     def port_mode(self, input, pullup=False, pulldown=False):
-        self._dirmask = uint8(0xFF) if input else uint8(0x00)
-        self._poweroff_inputs()
+        with self._lock:
+            self._dirmask = self._port_mask if input else 0
+            self._poweroff_inputs()
 
     def pin_mode_bulk(self, pins):
-        for pin in pins:
-            self.pin_mode(pin, pins[pin][0], localonly=True)
-        self._poweroff_inputs()
+        with self._lock:
+            for pin in pins:
+                self.pin_mode(pin, pins[pin][0], localonly=True)
+            self._poweroff_inputs()
 
     def _poweroff_inputs(self):
         self.write(self._shadow)
 
     def read(self):
-        return self._dirmask & uint8(self._bus.read_byte(self.address))
+        # In shared mode, the state is loaded into locals: another thread
+        # may be about to store the instance's
+        if self._shared is not None:
+            dirmask = self._shared.load()[1]
+        else:
+            dirmask = self._dirmask
+        if not self.read_cache_ttl:
+            value = dirmask & self._read_raw()
+        else:
+            now = monotonic()
+            if self._cache_time is not None and now - self._cache_time <= self.read_cache_ttl:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+                self._cache = self._read_raw()
+                self._cache_time = now
+            value = dirmask & self._cache
+        if self._batch_depth:
+            value = self._apply_pending(value, ~dirmask & self._port_mask)
+        return value
+
+    def refresh(self):
+        """
+        Invalidates the read cache and reads the port again from the bus.
+        Returns the new state of the input pins.
+        """
+        self._cache_time = None
+        return self.read()
 
     def write(self, value):
-        self._shadow = value & ~uint8(self._dirmask)
-        self._bus.write_byte(self.address, int(self._shadow))
+        with self._lock:
+            self._cache_time = None
+            self._shadow = value & ~self._dirmask & self._port_mask
+            self._write_raw(self._shadow)
+
+    def read_outputs(self):
+        """
+        Returns the level written to the output pins, as a bitmask, without
+        touching the bus. In shared mode, it includes the writes of the
+        other processes.
+        """
+        if self._shared is not None:
+            shadow, dirmask = self._shared.load()
+        else:
+            shadow, dirmask = self._shadow, self._dirmask
+        return shadow & ~dirmask & self._port_mask
+
+    def read_port(self):
+        return self.read()
+
+    def play(self, states, mask=None, rate=None):
+        """
+        Writes a sequence of port states. The PCF8574 latches every byte of
+        a write transaction, so if :py:data:`rate` is None the states are
+        streamed as multi-byte I2C writes, up to 33 states per transaction.
+        See :py:meth:`IOBase.play`.
+        """
+        if hasattr(states, "tolist"):
+            states = states.tolist()
+        if mask is None:
+            mask = self._port_mask
+        if rate is not None:
+            _paced(states, rate, lambda state: self.modify_port(state & mask, ~state & mask))
+            return
+        with self._lock:
+            keep = self._shadow & ~mask
+            drive = mask & ~self._dirmask & self._port_mask
+            data = [keep | (state & drive) for state in states]
+            if data:
+                self._cache_time = None
+                self._write_states(data)
+                self._shadow = data[-1]
+
+    def write_port(self, mask):
+        if not self._queue_write(mask & self._port_mask, ~mask & self._port_mask):
+            self.write(mask)
+
+    def modify_port(self, set_mask, clear_mask):
+        if not self._queue_write(set_mask, clear_mask):
+            with self._lock:
+                self.write((self._shadow & ~clear_mask) | set_mask)
 
     def digital_read(self, pin):
-        return self.digital_read_bulk(pin)[pin]
+        if 0 <= pin < self.number_of_pins:
+            return bool((self.read() >> pin) & 1)
+        return None
 
     def digital_read_bulk(self, *pins):
-        tor = {}
-        portstate = self.read()
-        for pin in pins:
-            if 0 <= pin < self.number_of_pins:
-                pval = portstate
-                tor[pin] = bool((pval >> pin) & 0x01)
-            else:
-                tor[pin] = None
-        return tor
+        return _mask2pins(self.read(), pins, self.number_of_pins)
 
     def digital_write(self, pin, high):
-        self.digital_write_bulk({pin: high})
+        if 0 <= pin < self.number_of_pins:
+            if high:
+                self.modify_port(1 << pin, 0)
+            else:
+                self.modify_port(0, 1 << pin)
 
     def digital_write_bulk(self, pins):
-        shadow = self._shadow
+        self.modify_port(*_pins2masks(pins, self.number_of_pins))
 
-        for pin in pins:
-            if 0 <= pin < self.number_of_pins:
-                bpin = 1 << pin
-                if pins[pin]:
-                    shadow |= bpin
-                else:
-                    shadow &= ~uint8(bpin)
-        self.write(shadow)
+    def analog_read(self, pin):
+        return 255 if self.digital_read(pin) else 0
+
+    def analog_write(self, pin, value):
+        duty = value / 255.0
+        if not self._queue_call(self._software_pwm, pin, self.pwm_frequency, duty):
+            self._software_pwm(pin, self.pwm_frequency, duty)
+
+    def close(self):
+        self._stop_software_pwm()
+        super(PCF8574IO, self).close()
+        if self._shared is not None:
+            self._shared.close()
+
+
+
+class PCF8575IO(PCF8574IO):
+    """
+    Same as :py:class:`PCF8574IO`, for the 16-bit PCF8575: P00-P07 are pins
+    0 to 7 and P10-P17 are pins 8 to 15. All the pins are read or written
+    with a single 2-byte transaction. Reads are plain I2C reads (see
+    :py:meth:`SharedBus.read_bytes`), since an SMBus read would first write
+    its command byte to the port.
+
+    The input pins are written high, which lets the pins be pulled low by
+    the outside, as the quasi-bidirectional port requires to read them.
+    Pin mode changes are only written to the device when they change the
+    state of the port.
+
+    :py:meth:`play` streams up to 16 states per transaction.
+    """
+
+    number_of_pins = 16
+    _port_mask = 0xFFFF
+    _shared_format = "HH"
+    _written = None
+
+    def _read_raw(self):
+        low, high = self._bus.read_bytes(self.address, 2)
+        return low | high << 8
+
+    def _write_raw(self, value):
+        value |= self._dirmask
+        self._bus.write_byte_data(self.address, value & 0xFF, value >> 8)
+        self._written = value
+
+    def _poweroff_inputs(self):
+        # Mode changes that don't change what's on the port aren't sent
+        if (self._shadow & ~self._dirmask | self._dirmask) & 0xFFFF != self._written:
+            self.write(self._shadow)
+
+    def _write_states(self, states):
+        # The device latches every pair of bytes; transactions must not
+        # split a pair
+        inputs = self._dirmask
+        data = []
+        for state in states:
+            state |= inputs
+            data += (state & 0xFF, state >> 8)
+        self._bus.write_bytes(self.address, data, I2C_BLOCK_MAX)
+        self._written = state
+
+
+# MCP23017 registers, with IOCON.BANK = 0: the A and B registers of each
+# pair are adjacent, so a word transaction accesses both
+_IODIR = 0x00
+_GPINTEN = 0x04
+_IOCON = 0x0A
+_GPPU = 0x0C
+_INTF = 0x0E
+_GPIO = 0x12
+_OLAT = 0x14
+
+_IOCON_MIRROR = 0x40
+_IOCON_SEQOP = 0x20
+
+
+class MCP23017IO(PolledEvents, I2CIOBase, ABC):
+    """
+    Microchip MCP23017 16-bit expander at :py:data:`address` on I2C bus
+    :py:data:`bus`. GPA0-GPA7 are pins 0 to 7 and GPB0-GPB7 are pins 8 to
+    15.
+
+    The whole port is read or written with a single word transaction. The
+    direction, pull-up, output and interrupt registers are shadowed, so
+    mode changes that don't change anything are not sent to the device.
+    Only the inputs are read by :py:meth:`read_port`, like on the PCF8574.
+    Pull-up resistors are available on all the pins.
+
+    Event detection enables the interrupt-on-change of the watched pins.
+    The poller then reads the interrupt flag and capture registers (INTF and
+    INTCAP) with one block read, and only reads the port when a pin
+    changed; the captured state makes changes shorter than the polling
+    interval visible. The INTA and INTB outputs are mirrored, so either can
+    be connected to an :py:class:`~pywiring.events.InterruptLine` (see
+    :py:meth:`~pywiring.events.PolledEvents.use_interrupt`).
+
+    :py:meth:`analog_write` sends a software PWM wave, like on the PCF8574.
+    """
+
+    number_of_pins = 16
+    has_pwm = True
+    has_input = True
+    avg_exec_time = 0.005
+    pullup_resistors = True
+    pulldown_resistors = False
+
+    def __init__(self, bus, address=0x20):
+        super(MCP23017IO, self).__init__(bus, address)
+        self._lock = self._bus.lock
+        with self._lock:
+            self._bus.write_byte_data(address, _IOCON, _IOCON_MIRROR)
+            registers = self._bus.read_i2c_block_data(address, _IODIR, _OLAT + 2)
+        # Shadows of the register pairs, as words
+        self._registers = {register: registers[register] | registers[register + 1] << 8
+                           for register in (_IODIR, _GPINTEN, _GPPU, _OLAT)}
+
+    def _write_register(self, register, value):
+        # Must be called with the lock held
+        if self._registers[register] != value:
+            self._bus.write_word_data(self.address, register, value)
+            self._registers[register] = value
+
+    def get_pin_modes(self):
+        return [["OUTPUT", "INPUT", "PULLUP", "PWM", "SWPWM", "EDGE"]] * 16
+
+    def pin_mode(self, pin, input, pullup=False, pulldown=False):
+        self.pin_mode_bulk({pin: (input, pullup, pulldown)})
+
+    def port_mode(self, input, pullup=False, pulldown=False):
+        self.pin_mode_bulk({pin: (input, pullup, pulldown) for pin in range(16)})
+
+    def pin_mode_bulk(self, pins):
+        with self._lock:
+            iodir = self._registers[_IODIR]
+            gppu = self._registers[_GPPU]
+            for pin, mode in pins.items():
+                bit = 1 << pin
+                input = mode[0]
+                pullup = len(mode) > 1 and mode[1]
+                iodir = iodir | bit if input else iodir & ~bit
+                gppu = gppu | bit if input and pullup else gppu & ~bit
+            self._write_register(_GPPU, gppu)
+            self._write_register(_IODIR, iodir)
+
+    def _read_inputs(self):
+        return self._bus.read_word_data(self.address, _GPIO) & self._registers[_IODIR]
+
+    def read_port(self):
+        value = self._read_inputs()
+        if self._batch_depth:
+            value = self._apply_pending(value, ~self._registers[_IODIR] & 0xFFFF)
+        return value
+
+    def read_outputs(self):
+        """
+        Returns the level written to the output pins, as a bitmask, without
+        touching the bus.
+        """
+        return self._registers[_OLAT] & ~self._registers[_IODIR] & 0xFFFF
+
+    def write_port(self, mask):
+        if not self._queue_write(mask & 0xFFFF, ~mask & 0xFFFF):
+            with self._lock:
+                self._write_register(_OLAT, mask & 0xFFFF)
+
+    def modify_port(self, set_mask, clear_mask):
+        if not self._queue_write(set_mask, clear_mask):
+            with self._lock:
+                self._write_register(_OLAT, (self._registers[_OLAT] & ~clear_mask | set_mask) & 0xFFFF)
+
+    def play(self, states, mask=None, rate=None):
+        """
+        Writes a sequence of port states. If :py:data:`rate` is None, the
+        register pointer is set to toggle between OLATA and OLATB for the
+        duration of the sequence, so that the states are streamed as block
+        writes, up to 16 states per transaction. See :py:meth:`IOBase.play`.
+        """
+        if hasattr(states, "tolist"):
+            states = states.tolist()
+        if mask is None:
+            mask = 0xFFFF
+        if rate is not None:
+            _paced(states, rate, lambda state: self.modify_port(state & mask, ~state & mask))
+            return
+        if not states:
+            return
+        with self._lock:
+            keep = self._registers[_OLAT] & ~mask
+            data = []
+            for state in states:
+                state = keep | (state & mask)
+                data += (state & 0xFF, state >> 8)
+            bus = self._bus
+            bus.write_byte_data(self.address, _IOCON, _IOCON_MIRROR | _IOCON_SEQOP)
+            try:
+                for i in range(0, len(data), I2C_BLOCK_MAX):
+                    bus.write_i2c_block_data(self.address, _OLAT, data[i:i + I2C_BLOCK_MAX])
+            finally:
+                bus.write_byte_data(self.address, _IOCON, _IOCON_MIRROR)
+            self._registers[_OLAT] = data[-2] | data[-1] << 8
+
+    def digital_read(self, pin):
+        if 0 <= pin < self.number_of_pins:
+            return bool((self.read_port() >> pin) & 1)
+        return None
+
+    def digital_read_bulk(self, *pins):
+        return _mask2pins(self.read_port(), pins, self.number_of_pins)
+
+    def digital_write(self, pin, high):
+        if 0 <= pin < self.number_of_pins:
+            if high:
+                self.modify_port(1 << pin, 0)
+            else:
+                self.modify_port(0, 1 << pin)
+
+    def digital_write_bulk(self, pins):
+        self.modify_port(*_pins2masks(pins, self.number_of_pins))
 
     def analog_read(self, pin):
         return 255 if self.digital_read(pin) else 0
 
     def analog_write(self, pin, value):
-        self.digital_write(pin, value > 0)
+        duty = value / 255.0
+        if not self._queue_call(self._software_pwm, pin, self.pwm_frequency, duty):
+            self._software_pwm(pin, self.pwm_frequency, duty)
+
+    def _event_port_read(self):
+        watch = self._watch
+        if watch.previous is not None:
+            # INTFA, INTFB, INTCAPA, INTCAPB. Reading INTCAP clears the
+            # interrupt.
+            flag_a, flag_b, cap_a, cap_b = self._bus.read_i2c_block_data(self.address, _INTF, 4)
+            changed = flag_a | flag_b << 8
+            if not changed:
+                return watch.previous
+            # Dispatch the state of the port at the time of the first change
+            # before the current one, in case the pins changed back since
+            watch.update(watch.previous & ~changed | (cap_a | cap_b << 8) & changed)
+        return self._read_inputs()
+
+    def _update_interrupts(self):
+        with self._lock:
+            self._write_register(_GPINTEN, self._event_watch().mask)
+
+    def enable_event_detect(self, pin, edge, callback=None, bounce=0):
+        super(MCP23017IO, self).enable_event_detect(pin, edge, callback, bounce)
+        self._update_interrupts()
+
+    def disable_event_detect(self, pin):
+        super(MCP23017IO, self).disable_event_detect(pin)
+        self._update_interrupts()
+
+    def close(self):
+        self._stop_software_pwm()
+        with self._lock:
+            self._write_register(_GPINTEN, 0)
+        super(MCP23017IO, self).close()
 
 
 # Simple alias for easier usage
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+
+"""
+Opt-in runtime instrumentation of the hardware calls issued by the
+interfaces.
+
+:py:func:`instrument` replaces the hardware handles of an interface (the
+I2C bus, the parallel port, the RPi.GPIO module, ...) with proxies that
+count every call, classify it as a read, a write or another transaction,
+and record its latency in a histogram. Interfaces that aren't
+instrumented are not affected in any way: the proxies are only installed
+on request, and :py:func:`uninstrument` puts the original handles back.
+"""
+
+__all__ = ("Histogram", "DeviceStats", "instrument", "uninstrument", "snapshot",
+           "add_exporter", "remove_exporter", "export", "start_export", "stop_export")
+
+import threading
+import time
+
+_clock = time.perf_counter_ns
+
+# Attributes holding the hardware handles of the backends
+_HANDLES = ("_bus", "_lpt", "_gpio", "_mem", "_request")
+
+_READ_PREFIXES = ("read", "get", "input", "PPR")
+_WRITE_PREFIXES = ("write", "set", "output", "PPW", "clear")
+# Setup and teardown calls, counted as transactions only
+_OTHER = frozenset(("open", "close", "setmode", "setup", "cleanup", "set_config",
+                    "PPRELEASE", "wait_events"))
+
+
+def _kind(name):
+    if name in _OTHER:
+        return None
+    if name.startswith(_READ_PREFIXES):
+        return "read"
+    if name.startswith(_WRITE_PREFIXES):
+        return "write"
+    return None
+
+
+class Histogram(object):
+    """
+    Latency histogram with logarithmic buckets, each split into
+    2 ** :py:data:`sub_bits` linear sub-buckets, like HdrHistogram: the
+    relative error of the recorded values is at most 2 ** -sub_bits, at
+    any magnitude. Values are integers (nanoseconds).
+    """
+
+    def __init__(self, sub_bits=5):
+        self.sub_bits = sub_bits
+        self._sub = 1 << sub_bits
+        self.counts = []
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        shift = value.bit_length() - self.sub_bits - 1
+        if shift <= 0:
+            return value
+        return shift * self._sub + (value >> shift)
+
+    def _upper(self, index):
+        # Highest value that falls in the bucket
+        if index < 2 * self._sub:
+            return index
+        shift = index // self._sub - 1
+        return ((index - shift * self._sub + 1) << shift) - 1
+
+    def record(self, value):
+        index = self._index(value)
+        counts = self.counts
+        if index >= len(counts):
+            counts.extend([0] * (index + 1 - len(counts)))
+        counts[index] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """
+        Returns the value below which :py:data:`percent` percent of the
+        recorded values fall, or 0 if nothing has been recorded.
+        """
+        if not self.count:
+            return 0
+        target = max(1, self.count * percent / 100.0)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self._upper(index), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class DeviceStats(object):
+    """
+    Counters and latency histogram of the hardware calls issued by one
+    instrumented interface. Read them with :py:meth:`snapshot`.
+    """
+
+    def __init__(self, io, label):
+        self.io = io
+        self.label = label
+        self.reads = 0
+        self.writes = 0
+        self.transactions = 0
+        self.calls = {}
+        self.latency = Histogram()
+        self._lock = threading.Lock()
+
+    def _record(self, name, kind, elapsed):
+        with self._lock:
+            self.transactions += 1
+            if kind == "read":
+                self.reads += 1
+            elif kind == "write":
+                self.writes += 1
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self.latency.record(elapsed)
+            # Live value of the interface's preset, in milliseconds
+            self.io.avg_exec_time = self.latency.mean / 1e6
+
+    def _wrap(self, name, func):
+        record = self._record
+        kind = _kind(name)
+        clock = _clock
+
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, kind, clock() - start)
+
+        return wrapper
+
+    def snapshot(self):
+        """
+        Returns the counters as a dict. The latencies are in seconds and
+        ``avg_exec_time`` is in milliseconds.
+        """
+        with self._lock:
+            latency = self.latency
+            return {
+                "reads": self.reads,
+                "writes": self.writes,
+                "transactions": self.transactions,
+                "calls": dict(self.calls),
+                "avg_exec_time": latency.mean / 1e6,
+                "latency": {
+                    "count": latency.count,
+                    "min": (latency.min or 0) / 1e9,
+                    "mean": latency.mean / 1e9,
+                    "p50": latency.percentile(50) / 1e9,
+                    "p90": latency.percentile(90) / 1e9,
+                    "p99": latency.percentile(99) / 1e9,
+                    "p999": latency.percentile(99.9) / 1e9,
+                    "max": (latency.max or 0) / 1e9,
+                },
+            }
+
+
+class _Proxy(object):
+    # Forwards everything to the hardware handle, timing the calls
+
+    def __init__(self, target, stats):
+        self.__dict__["_target"] = target
+        self.__dict__["_stats"] = stats
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if callable(value) and not isinstance(value, type):
+            value = self._stats._wrap(name, value)
+            self.__dict__[name] = value
+        return value
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+
+class _BusProxy(_Proxy):
+    # Proxy of a SharedBus. The methods issuing several transactions run
+    # against the proxy, so that they go through its _call() and each
+    # underlying smbus call is counted, not the method as a whole.
+
+    def __getattr__(self, name):
+        if name in ("write_bytes", "read_bytes"):
+            value = getattr(type(self._target), name).__get__(self)
+            self.__dict__[name] = value
+            return value
+        if name.startswith("_"):
+            return getattr(self._target, name)
+        return super(_BusProxy, self).__getattr__(name)
+
+    def _call(self, func, args):
+        start = _clock()
+        try:
+            return self._target._call(func, args)
+        finally:
+            name = func.__name__
+            # Plain I2C transfers are only issued by read_bytes()
+            kind = "read" if name == "i2c_rdwr" else _kind(name)
+            self._stats._record(name, kind, _clock() - start)
+
+
+_devices = {}
+_exporters = []
+_export_thread = None
+_export_stop = threading.Event()
+
+
+def _default_label(io):
+    label = "{0}:{1}".format(type(io).__name__, ":".join(str(part) for part in io.bus_id))
+    address = getattr(io, "address", None)
+    if isinstance(address, int):
+        label += ":0x{0:02x}".format(address)
+    return label
+
+
+def instrument(io, label=None):
+    """
+    Starts instrumenting :py:data:`io` and returns its
+    :py:class:`DeviceStats`. While instrumented, the interface's
+    :py:attr:`~IOBase.avg_exec_time` is updated after every hardware call
+    with the measured average.
+    """
+    stats = _devices.get(io)
+    if stats is not None:
+        return stats
+    stats = DeviceStats(io, label or _default_label(io))
+    # Instance dicts are left alone (not accessed through __dict__), so that
+    # attribute access stays as fast once the interface is uninstrumented
+    for name in _HANDLES:
+        handle = getattr(io, name, None)
+        if handle is not None:
+            proxy = _BusProxy if hasattr(handle, "write_bytes") else _Proxy
+            setattr(io, name, proxy(handle, stats))
+    _devices[io] = stats
+    return stats
+
+
+def uninstrument(io):
+    """
+    Stops instrumenting :py:data:`io`, restoring its original hardware
+    handles and its preset :py:attr:`~IOBase.avg_exec_time`.
+    """
+    stats = _devices.pop(io, None)
+    if stats is None:
+        return
+    for name in _HANDLES:
+        handle = getattr(io, name, None)
+        if isinstance(handle, _Proxy):
+            setattr(io, name, handle._target)
+    try:
+        del io.avg_exec_time
+    except AttributeError:
+        pass
+
+
+def snapshot():
+    """
+    Returns a dict mapping the label of every instrumented interface to
+    its :py:meth:`DeviceStats.snapshot`.
+    """
+    return {stats.label: stats.snapshot() for stats in list(_devices.values())}
+
+
+def add_exporter(exporter):
+    """
+    Registers :py:data:`exporter`, a function called with the result of
+    :py:func:`snapshot` by :py:func:`export`, e.g. to push the counters to
+    a monitoring system.
+    """
+    _exporters.append(exporter)
+
+
+def remove_exporter(exporter):
+    _exporters.remove(exporter)
+
+
+def export():
+    """
+    Takes a snapshot and passes it to all the registered exporters.
+    """
+    data = snapshot()
+    for exporter in list(_exporters):
+        exporter(data)
+    return data
+
+
+def start_export(interval=10.0):
+    """
+    Calls :py:func:`export` every :py:data:`interval` seconds from a
+    background thread, until :py:func:`stop_export` is called.
+    """
+    global _export_thread
+    if _export_thread is not None:
+        return
+    _export_stop.clear()
+
+    def run():
+        while not _export_stop.wait(interval):
+            export()
+
+    _export_thread = threading.Thread(target=run, name="pywiring-export")
+    _export_thread.daemon = True
+    _export_thread.start()
+
+
+def stop_export():
+    global _export_thread
+    if _export_thread is not None:
+        _export_stop.set()
+        _export_thread.join()
+        _export_thread = None
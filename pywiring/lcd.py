@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+"""
+Driver for HD44780-compatible character LCDs connected in 4-bit mode to
+an I/O port, typically a PCF8574 I2C backpack
+(:py:class:`~pywiring.i2c.LCDBackpack`).
+
+Every command and character is compiled into the sequence of port states
+that clocks its two nibbles in, and whole updates are written with
+:py:meth:`IOBase.play`, i.e. as multi-byte I2C writes on a backpack.
+"""
+
+__all__ = ("HD44780",)
+
+import time
+
+# Commands
+CLEAR_DISPLAY = 0x01
+RETURN_HOME = 0x02
+ENTRY_MODE_SET = 0x04
+DISPLAY_CONTROL = 0x08
+FUNCTION_SET = 0x20
+SET_DDRAM_ADDR = 0x80
+
+# Flags
+ENTRY_LEFT = 0x02
+DISPLAY_ON = 0x04
+CURSOR_ON = 0x02
+BLINK_ON = 0x01
+TWO_LINES = 0x08
+
+CLEAR_DELAY = 0.002
+
+
+class HD44780(object):
+    """
+    HD44780 LCD with :py:data:`cols` columns and :py:data:`rows` rows
+    connected to :py:data:`io`. The default pin mapping is the one used
+    by the common PCF8574 backpacks: RS on P0, E on P2, the backlight on
+    P3 and D4-D7 on P4-P7. RW (P1 on the backpacks) is kept low.
+
+    Text is written to a framebuffer with :py:meth:`write` and sent to the
+    display by :py:meth:`refresh`, which only sends the cells that changed
+    since the last refresh, moving the cursor only when needed.
+    """
+
+    def __init__(self, io, cols=16, rows=2, rs=0, en=2, backlight=3, data=(4, 5, 6, 7)):
+        self.io = io
+        self.cols = cols
+        self.rows = rows
+        self._rs = 1 << rs
+        self._en = 1 << en
+        self._backlight_bit = 1 << backlight if backlight is not None else 0
+        self._data = [1 << pin for pin in data]
+        self._backlight = self._backlight_bit
+        self._row_offsets = (0x00, 0x40, cols, 0x40 + cols)
+        self._tables = {}
+
+        self.framebuffer = [[" "] * cols for _ in range(rows)]
+        self._shown = [[" "] * cols for _ in range(rows)]
+        self._address = 0
+        self._col = 0
+        self._row = 0
+
+        io.port_mode(False)
+        self._init_display()
+
+    def _nibble(self, nibble, rs):
+        base = self._backlight | (self._rs if rs else 0)
+        for i, bit in enumerate(self._data):
+            if (nibble >> i) & 1:
+                base |= bit
+        # Data is latched on the falling edge of E
+        return [base | self._en, base]
+
+    def _table(self, rs):
+        # Port states for every byte value, compiled once per backlight state
+        key = (rs, self._backlight)
+        table = self._tables.get(key)
+        if table is None:
+            table = self._tables[key] = [self._nibble(value >> 4, rs) + self._nibble(value & 0x0F, rs)
+                                         for value in range(256)]
+        return table
+
+    def _send(self, states):
+        # RW is always low: the display is only written to
+        self.io.play(states)
+
+    def _init_display(self):
+        # Reset sequence: switch to 8-bit mode three times, then to 4-bit mode
+        time.sleep(0.05)
+        for nibble, delay in ((0x03, 0.0045), (0x03, 0.0045), (0x03, 0.00015), (0x02, 0)):
+            self._send(self._nibble(nibble, False))
+            time.sleep(delay)
+        self.command(FUNCTION_SET | (TWO_LINES if self.rows > 1 else 0))
+        self.command(DISPLAY_CONTROL | DISPLAY_ON)
+        self.command(ENTRY_MODE_SET | ENTRY_LEFT)
+        self.clear()
+
+    def command(self, value):
+        """
+        Sends a raw command to the display.
+        """
+        self._send(self._table(False)[value])
+        if value in (CLEAR_DISPLAY, RETURN_HOME):
+            time.sleep(CLEAR_DELAY)
+            self._address = 0
+
+    def clear(self):
+        """
+        Clears the display and the framebuffer, and moves the cursor home.
+        """
+        self.command(CLEAR_DISPLAY)
+        for row in range(self.rows):
+            self.framebuffer[row] = [" "] * self.cols
+            self._shown[row] = [" "] * self.cols
+        self._col = self._row = 0
+
+    @property
+    def backlight(self):
+        return bool(self._backlight)
+
+    @backlight.setter
+    def backlight(self, on):
+        self._backlight = self._backlight_bit if on else 0
+        self.io.play([self._backlight], self._backlight_bit)
+
+    def set_cursor(self, col, row):
+        """
+        Sets the framebuffer position used by the next :py:meth:`write`.
+        """
+        self._col = col
+        self._row = row
+
+    def write(self, text):
+        """
+        Writes :py:data:`text` to the framebuffer at the current position.
+        Newlines move to the beginning of the next row; text past the end
+        of a row is discarded. Call :py:meth:`refresh` to update the
+        display.
+        """
+        for char in text:
+            if char == "\n":
+                self._col = 0
+                self._row += 1
+                continue
+            if self._row < self.rows and self._col < self.cols:
+                self.framebuffer[self._row][self._col] = char
+            self._col += 1
+
+    def _compile_refresh(self):
+        # Returns the port states updating the display, the (row, col, char)
+        # cells they update, and the DDRAM address they leave the cursor at
+        chars = self._table(True)
+        commands = self._table(False)
+        states = []
+        cells = []
+        address = self._address
+        for row in range(self.rows):
+            offset = self._row_offsets[row]
+            wanted = self.framebuffer[row]
+            shown = self._shown[row]
+            for col in range(self.cols):
+                char = wanted[col]
+                if char == shown[col]:
+                    continue
+                target = offset + col
+                if target != address:
+                    states += commands[SET_DDRAM_ADDR | target]
+                states += chars[ord(char) & 0xFF]
+                cells.append((row, col, char))
+                address = target + 1
+        return states, cells, address
+
+    def refresh(self):
+        """
+        Sends the cells of the framebuffer that changed since the last
+        refresh to the display, in as few bus transactions as possible.
+        Returns the number of port states written. If the transfer fails,
+        the cells are sent again by the next refresh.
+        """
+        states, cells, address = self._compile_refresh()
+        if states:
+            try:
+                self._send(states)
+            except Exception:
+                # Part of the transfer may have been written: the cursor
+                # position is unknown
+                self._address = None
+                raise
+            for row, col, char in cells:
+                self._shown[row][col] = char
+            self._address = address
+        return len(states)
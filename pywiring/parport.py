@@ -1,14 +1,41 @@
 # -*- coding: utf-8 -*-
 
-__all__ = "ParallelIO"
+__all__ = ("ParallelIO",)
 
+import threading
 from abc import ABC
 from warnings import warn
 
-import parallel
-from numpy import uint8
-
-from . import IOBase
+from . import IOBase, _pins2masks, _mask2pins, hardware_module
+from .events import PolledEvents
+
+# Control register bits, and the output pin driving each one.
+# Strobe, Auto Feed and Select are inverted in hardware: like pyparallel's
+# per-line setters, a high level clears the bit.
+CONTROL_STROBE = 0x01
+CONTROL_AUTOFD = 0x02
+CONTROL_INIT = 0x04
+CONTROL_SELECT = 0x08
+CONTROL_LINES = ((0, CONTROL_STROBE, True),
+                 (9, CONTROL_AUTOFD, True),
+                 (10, CONTROL_INIT, False),
+                 (11, CONTROL_SELECT, True))
+
+# Status register bits, and the input pin reading each one.
+# Busy is inverted in hardware.
+STATUS_ERROR = 0x08
+STATUS_SELECT = 0x10
+STATUS_PAPEROUT = 0x20
+STATUS_ACK = 0x40
+STATUS_BUSY = 0x80
+STATUS_LINES = ((0, STATUS_ACK, False),
+                (1, STATUS_BUSY, True),
+                (2, STATUS_PAPEROUT, False),
+                (3, STATUS_SELECT, False),
+                (4, STATUS_ERROR, False))
+
+DATA_PINS = 0x1FE
+CONTROL_PINS = 0xE01
 
 
 def num2boolgen(num):
@@ -16,7 +43,7 @@ def num2boolgen(num):
         yield bit == "1"
 
 
-class ParallelIO(IOBase, ABC):
+class ParallelIO(PolledEvents, IOBase, ABC):
     """
     Parallel port I/O.
 
@@ -65,24 +92,48 @@ class ParallelIO(IOBase, ABC):
     (see (http://davideddu.org/blog/posts/graphics-card-i2c-port-howto/)[this]),
     or pull one pin high and use it as a voltage source. It might not be
     enough though.
+
+    Event detection on the input pins is implemented by polling the status
+    register in the background (see :py:mod:`pywiring.events`).
+
+    The state of the output pins is kept in shadow copies of the data and
+    control registers, so that any write takes at most one data register
+    write and one control register write, and registers whose value doesn't
+    change aren't written at all. All the inputs are read with a single
+    status register read. The port must not be written by other programs
+    at the same time.
+
+    :py:meth:`analog_write` sends a software PWM wave of
+    :py:attr:`pwm_frequency` Hz, generated by the shared scheduler in
+    :py:mod:`pywiring.pwm`.
     """
 
     number_of_pins = 12  # Only output pins
     had_adc = False
-    has_pwm = False
+    has_pwm = True
     has_input = True
     pullup_resistors = True
     pulldown_resistors = False
 
     def __init__(self, port=0):
         super(ParallelIO, self).__init__()
-        self._lpt = parallel.Parallel(port)
-        self._outputs = [0] * 4
+        self._lpt = hardware_module("parallel").Parallel(port)
+        self.port = port
+        # Keep the control register bits that aren't outputs (e.g. the
+        # data direction and IRQ enable bits) as they are
+        self._control_base = self._lpt.PPRCONTROL() & ~0x0F
+        self._port = 0
+        # Writes may come from the PWM thread too
+        self._lock = threading.RLock()
+
+        self._commit(0, force=True)
 
-        self.digital_write_bulk({i: False for i in range(0, 12)})
+    @property
+    def bus_id(self):
+        return ("parport", self.port)
 
     def get_pin_modes(self):
-        return [["OUTPUT", "INPUT"]] * 5 + [["OUTPUT"]] * 8
+        return [["OUTPUT", "PWM", "SWPWM", "INPUT", "EDGE"]] * 5 + [["OUTPUT", "PWM", "SWPWM"]] * 7
 
     def pin_mode(self, *a):
         warn("Pin mode can't be set on a parallel port", RuntimeWarning)
@@ -90,57 +141,95 @@ class ParallelIO(IOBase, ABC):
     def port_mode(self, *a):
         warn("Port mode can't be set on a parallel port", RuntimeWarning)
 
+    def _commit(self, port, force=False):
+        """
+        Writes the output pins bitmask :py:data:`port` to the data and
+        control registers, skipping the registers that wouldn't change.
+        """
+        changed = port ^ self._port
+        if force or changed & DATA_PINS:
+            self._lpt.setData((port >> 1) & 0xFF)
+        if force or changed & CONTROL_PINS:
+            control = self._control_base
+            for pin, bit, inverted in CONTROL_LINES:
+                if bool((port >> pin) & 1) != inverted:
+                    control |= bit
+            self._lpt.PPWCONTROL(control)
+        self._port = port
+
     def digital_read(self, pin):
-        if pin == 0:
-            return self._lpt.getInAcknowledge()
-        elif pin == 1:
-            return self._lpt.getInBusy()
-        elif pin == 2:
-            return self._lpt.getInPaperOut()
-        elif pin == 3:
-            return self._lpt.getInSelected()
-        elif pin == 4:
-            return self._lpt.getInError()
+        if 0 <= pin < 5:
+            return bool((self.read_port() >> pin) & 1)
+        return None
+
+    def digital_read_bulk(self, *pins):
+        return _mask2pins(self.read_port(), pins, 5)
+
+    def read_port(self):
+        """
+        Returns the level of the five input pins as a bitmask, reading the
+        status register once.
+        """
+        status = self._lpt.PPRSTATUS()
+        value = 0
+        for pin, bit, inverted in STATUS_LINES:
+            if bool(status & bit) != inverted:
+                value |= 1 << pin
+        return value
+
+    def write_port(self, mask):
+        if not self._queue_write(mask & 0xFFF, ~mask & 0xFFF):
+            with self._lock:
+                self._commit(mask & 0xFFF)
+
+    def modify_port(self, set_mask, clear_mask):
+        if not self._queue_write(set_mask, clear_mask):
+            with self._lock:
+                self._commit(((self._port & ~clear_mask) | set_mask) & 0xFFF)
+
+    def play(self, states, mask=None, rate=None):
+        """
+        Writes a sequence of port states. If :py:data:`rate` is None and
+        :py:data:`mask` only covers the data pins (1 to 8), the states are
+        written with back-to-back data register writes. See
+        :py:meth:`IOBase.play`.
+        """
+        if mask is None:
+            mask = 0xFFF
+        if rate is not None or mask & CONTROL_PINS:
+            super(ParallelIO, self).play(states, mask, rate)
+            return
+        if hasattr(states, "tolist"):
+            states = states.tolist()
+        mask &= DATA_PINS
+        set_data = self._lpt.setData
+        with self._lock:
+            keep = self._port & ~mask
+            port = self._port
+            for state in states:
+                port = keep | (state & mask)
+                set_data((port >> 1) & 0xFF)
+            self._port = port
 
     def digital_write(self, pin, high):
-        if 0 < pin < 9:
-            bpin = 1 << (pin - 1)
-            mask = self._lpt.getData()
+        if 0 <= pin < self.number_of_pins:
             if high:
-                mask |= bpin
+                self.modify_port(1 << pin, 0)
             else:
-                mask &= ~uint8(bpin)
-            self._lpt.setData(mask)
-        elif pin == 0:
-            self._lpt.setDataStrobe(high)
-        elif pin == 9:
-            self._lpt.setAutoFeed(high)
-        elif pin == 10:
-            self._lpt.setInitOut(high)
-        elif pin == 11:
-            self._lpt.setSelect(high)
+                self.modify_port(0, 1 << pin)
 
     def digital_write_bulk(self, pins):
-        dpins = []
-        for pin in pins:
-            if pin == 0 or pin >= 9:
-                self.digital_write(pin, pins[pin])
-            else:
-                dpins.append(pin)
-
-        mask = self._lpt.getData()
-        for i in dpins:
-            if pins[i]:
-                mask |= 1 << (i - 1)
-            else:
-                mask &= ~uint8(1 << (i - 1))
-        self._lpt.setData(mask)
+        self.modify_port(*_pins2masks(pins, self.number_of_pins))
 
     def analog_read(self, pin):
         return 255 if self.digital_read(pin) else 0
 
     def analog_write(self, pin, value):
-        self.digital_write(pin, value > 0)
+        duty = value / 255.0
+        if not self._queue_call(self._software_pwm, pin, self.pwm_frequency, duty):
+            self._software_pwm(pin, self.pwm_frequency, duty)
 
     def close(self):
+        self._stop_software_pwm()
+        super(ParallelIO, self).close()
         self._lpt.PPRELEASE()
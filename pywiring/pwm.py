@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+
+"""
+Software PWM for any number of pins and interfaces, driven by a single
+thread.
+
+The channels with the same frequency form a wave whose periods all start
+at the same instant. The edges of one period of a wave are compiled, when
+the wave changes, into a timeline of slots: the edges due at the same time
+on the same interface share a slot and are written together, with one
+:py:meth:`IOBase.modify_port` call. The thread sleeps until the next slot
+of any wave is due and writes it, so that very little Python code runs per
+edge.
+"""
+
+__all__ = ("PWMScheduler", "get_scheduler")
+
+import bisect
+import threading
+import time
+
+# Edges closer than this are written together
+_MERGE_WINDOW = 0.00005
+# Longest sleep of the thread, so that it notices new and removed channels
+_MAX_SLEEP = 0.01
+# Quantile of the sleep() latency the thread wakes up early by, and the
+# step it's estimated by
+_LEAD_QUANTILE = 0.2
+_LEAD_STEP = 0.000005
+# Longest the thread busy-waits before an edge, beyond spin
+_SPIN_THRESHOLD = 0.0005
+
+
+def _compile(duties, period):
+    """
+    Returns the timeline of one period of a wave whose channels are the
+    (io, pin): duty cycle items of :py:data:`duties`: a list of (offset,
+    writes) slots sorted by offset, :py:data:`writes` being a tuple of
+    (function, arguments, number of edges) writing the edges of each
+    interface.
+
+    Edges are merged into a slot if they're due less than
+    :py:data:`_MERGE_WINDOW` after its first edge, but a slot never holds
+    both edges of a pin: with very short high or low times, the second edge
+    gets a slot of its own, so that the pulse isn't lost.
+    """
+    edges = []
+    for (io, pin), duty in duties.items():
+        edges.append((0.0, id(io), pin, io, True))
+        edges.append((duty * period, id(io), pin, io, False))
+    edges.sort(key=lambda edge: edge[:3])
+
+    slots = []
+    offset = None
+    writes = None
+    for when, _, pin, io, level in edges:
+        bit = 1 << pin
+        write = writes.get(io) if writes is not None else None
+        if offset is None or when > offset + _MERGE_WINDOW or (write is not None and (write[0] | write[1]) & bit):
+            offset = when
+            writes = {}
+            slots.append((offset, writes))
+            write = None
+        if write is None:
+            write = writes[io] = [0, 0]
+        write[0 if level else 1] |= bit
+    return [(offset, tuple(_write_call(io, write[0], write[1]) for io, write in writes.items()))
+            for offset, writes in slots]
+
+
+def _write_call(io, set_mask, clear_mask):
+    # Returns the (function, arguments, number of edges) writing a slot's
+    # edges on io. A single edge is written with digital_write(), which is
+    # cheaper than modify_port() on most backends.
+    edges = bin(set_mask | clear_mask).count("1")
+    if edges == 1:
+        pin = (set_mask | clear_mask).bit_length() - 1
+        return io.digital_write, (pin, bool(set_mask)), 1
+    return io.modify_port, (set_mask, clear_mask), edges
+
+
+class _Wave(object):
+    """
+    The channels of one frequency. :py:attr:`slots` is the timeline of the
+    current period, which started at :py:attr:`start`; :py:attr:`index` is
+    the slot written next, at :py:attr:`due`. When it's
+    ``len(slots)``, the next period starts at :py:attr:`due`, with the
+    timeline recompiled if :py:attr:`changed` is True.
+    """
+
+    def __init__(self, frequency, start):
+        self.frequency = frequency
+        self.period = 1.0 / frequency
+        self.start = start - self.period
+        self.duties = {}
+        self.slots = []
+        self.index = 0
+        self.due = start
+        self.changed = True
+
+
+class PWMScheduler(object):
+    """
+    Background thread that generates software PWM waves. The thread runs
+    only while there is at least one channel.
+
+    The thread sleeps until each edge is due, waking up slightly early by
+    how late :py:func:`time.sleep` usually returns (at most 0.5 ms) and
+    busy-waiting for the rest. If :py:data:`spin` is greater than 0, it
+    busy-waits for the last :py:data:`spin` seconds too, which makes the
+    edges more accurate at the cost of CPU time.
+
+    :py:meth:`stats` reports the CPU time used by the thread and the
+    jitter of the edges, i.e. how late they were written compared to when
+    they were due.
+    """
+
+    def __init__(self, spin=0):
+        self.spin = spin
+        # (io, pin) -> [frequency, duty cycle (0-1)]
+        self._channels = {}
+        # frequency -> _Wave
+        self._waves = {}
+        self._epoch = time.perf_counter()
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self._edges = 0
+        self._writes = 0
+        self._skipped = 0
+        self._jitter_total = 0.0
+        self._jitter_max = 0.0
+        self._cpu = 0.0
+        self._ident = None
+        self._started = None
+
+    def set(self, io, pin, frequency, duty):
+        """
+        Sends a PWM wave of :py:data:`frequency` Hz and :py:data:`duty`
+        cycle (from 0 to 1) to :py:data:`pin` of :py:data:`io`. A duty cycle
+        of 0 or 1 stops the wave and holds the pin low or high.
+        """
+        if duty <= 0 or duty >= 1:
+            self.remove(io, pin, duty >= 1)
+            return
+        if frequency <= 0:
+            raise ValueError("Invalid PWM frequency: {0}".format(frequency))
+        key = (io, pin)
+        with self._lock:
+            channel = self._channels.get(key)
+            if channel is not None and channel[0] != frequency:
+                self._drop(key, channel[0])
+            self._channels[key] = [frequency, duty]
+            # The new duty cycle takes effect from the next period
+            wave = self._waves.get(frequency)
+            if wave is None:
+                period = 1.0 / frequency
+                # The thread may be sleeping: start after it has woken up
+                now = time.perf_counter() + _MAX_SLEEP
+                start = self._epoch + -(-(now - self._epoch) // period) * period
+                wave = self._waves[frequency] = _Wave(frequency, start)
+            wave.changed = True
+            if self._thread is None:
+                self._started = time.perf_counter()
+                self._thread = threading.Thread(target=self._run, name="pywiring-pwm")
+                self._thread.daemon = True
+                self._thread.start()
+
+    def remove(self, io, pin, level=False):
+        """
+        Stops the wave on :py:data:`pin` of :py:data:`io` and leaves the
+        pin at :py:data:`level`.
+        """
+        with self._lock:
+            channel = self._channels.pop((io, pin), None)
+            if channel is not None:
+                self._drop((io, pin), channel[0])
+        io.digital_write(pin, level)
+
+    def remove_io(self, io):
+        """
+        Stops all the waves on :py:data:`io`, without touching the pins.
+        """
+        with self._lock:
+            for key in [key for key in self._channels if key[0] is io]:
+                self._drop(key, self._channels.pop(key)[0])
+
+    def _drop(self, key, frequency):
+        # Takes a channel out of the current period of its wave right away,
+        # so that the thread doesn't write to the pin anymore. Called with
+        # the lock held.
+        wave = self._waves[frequency]
+        wave.changed = True
+        if wave.duties.pop(key, None) is None:
+            return
+        following = wave.slots[wave.index][0] if wave.index < len(wave.slots) else wave.period
+        slots = wave.slots = _compile(wave.duties, wave.period)
+        wave.index = bisect.bisect_left([slot[0] for slot in slots], following)
+        wave.due = wave.start + (slots[wave.index][0] if wave.index < len(slots) else wave.period)
+
+    def channels(self):
+        """
+        Returns a dict mapping (io, pin) to (frequency, duty cycle).
+        """
+        with self._lock:
+            return {key: tuple(channel) for key, channel in self._channels.items()}
+
+    def stats(self):
+        """
+        Returns a dict with the number of edges generated and of port writes
+        used for them, the number of periods skipped because the thread fell
+        behind, the average and maximum edge jitter in seconds, and
+        the CPU usage of the thread as a fraction of one core.
+        """
+        edges = self._edges
+        elapsed = time.perf_counter() - self._started if self._started is not None else 0.0
+        cpu = self._cpu
+        ident = self._ident
+        if ident is not None and hasattr(time, "pthread_getcpuclockid"):
+            # Read from here, so that the thread doesn't pay for it
+            try:
+                cpu += time.clock_gettime(time.pthread_getcpuclockid(ident))
+            except (OSError, ValueError):
+                pass
+        return {
+            "channels": len(self._channels),
+            "edges": edges,
+            "writes": self._writes,
+            "skipped_periods": self._skipped,
+            "avg_jitter": self._jitter_total / edges if edges else 0.0,
+            "max_jitter": self._jitter_max,
+            "cpu_usage": cpu / elapsed if elapsed else 0.0,
+        }
+
+    def _new_period(self, wave, now):
+        # Moves a wave to its next period, skipping the periods the thread
+        # fell behind by, and takes the changes of its channels into
+        # account. Returns False if the wave has no channels left.
+        period = wave.period
+        start = wave.start + period
+        if start + period <= now:
+            skipped = int((now - start) // period)
+            self._skipped += skipped
+            start += skipped * period
+        wave.start = start
+        wave.index = 0
+        if wave.changed:
+            wave.changed = False
+            frequency = wave.frequency
+            wave.duties = {key: channel[1] for key, channel in self._channels.items()
+                           if channel[0] == frequency}
+            if not wave.duties:
+                del self._waves[frequency]
+                return False
+            wave.slots = _compile(wave.duties, period)
+        return True
+
+    def _due(self, now):
+        # Takes the slots that are due and moves their waves forward.
+        # Returns the list of (due time, writes) slots, and the due time of
+        # the next slot (None if there are no channels left).
+        limit = now + _MERGE_WINDOW
+        due = []
+        following = None
+        for wave in list(self._waves.values()):
+            if wave.due <= limit:
+                if wave.index == len(wave.slots) and not self._new_period(wave, now):
+                    continue
+                offset, writes = wave.slots[wave.index]
+                due.append((wave.start + offset, writes))
+                wave.index += 1
+                slots = wave.slots
+                wave.due = wave.start + (slots[wave.index][0] if wave.index < len(slots) else wave.period)
+            if following is None or wave.due < following:
+                following = wave.due
+        return due, following
+
+    def _run(self):
+        clock = time.perf_counter
+        sleep = time.sleep
+        lock = self._lock
+        start_cpu = time.thread_time()
+        self._ident = threading.get_ident()
+        # The thread wakes up this long before each slot and busy-waits for
+        # the rest: it tracks a low quantile of how late sleep() returns,
+        # so that the busy-waits stay short
+        lead = 0.0
+        try:
+            while True:
+                with lock:
+                    due, following = self._due(clock())
+                    if following is None:
+                        self._thread = None
+                for when, writes in due:
+                    for write, args, edges in writes:
+                        try:
+                            write(*args)
+                        except (IOError, OSError):
+                            pass
+                        jitter = clock() - when
+                        self._edges += edges
+                        self._writes += 1
+                        self._jitter_total += jitter * edges
+                        if jitter > self._jitter_max:
+                            self._jitter_max = jitter
+                if following is None:
+                    return
+
+                # Sleeps until close to the edge, and only busy-waits for
+                # the last stretch
+                threshold = lead + self.spin
+                now = clock()
+                if following - now > _MAX_SLEEP + threshold:
+                    sleep(_MAX_SLEEP)
+                    continue
+                while now < following:
+                    if following - now > threshold:
+                        wake = following - threshold
+                        sleep(wake - now)
+                        if clock() - wake > lead:
+                            if lead < _SPIN_THRESHOLD:
+                                lead += _LEAD_STEP * _LEAD_QUANTILE
+                        elif lead >= _LEAD_STEP:
+                            lead -= _LEAD_STEP * (1 - _LEAD_QUANTILE)
+                    now = clock()
+        finally:
+            self._ident = None
+            self._cpu += time.thread_time() - start_cpu
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """
+    Returns the PWM scheduler shared by all the interfaces, creating it if
+    needed.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = PWMScheduler()
+        return _scheduler
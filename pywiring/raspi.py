@@ -1,12 +1,11 @@
 # -*- coding: utf-8 -*-
 
-__all__ = "RasPiIO"
+__all__ = ("RasPiIO",)
 
+import functools
 from abc import ABC
 
-from RPi import GPIO
-
-from . import IOBase
+from . import IOBase, _pins2masks, _mask2pins, hardware_module
 
 # BOARD2BCM = [None, None    # 3.3v   5v
 #              2,    None,   #        5v
@@ -62,6 +61,17 @@ map = lambda x, in_min, in_max, out_min, out_max: \
     (x - in_min) * (out_max - out_min) / (in_max - in_min) + out_min
 
 
+def _mask2list(mask):
+    pins = []
+    pin = 0
+    while mask:
+        if mask & 1:
+            pins.append(pin)
+        mask >>= 1
+        pin += 1
+    return pins
+
+
 class RasPiIO(IOBase, ABC):
     """
     A wrapper for RPi.GPIO that allows programs written for PyWiring
@@ -77,9 +87,17 @@ class RasPiIO(IOBase, ABC):
     a better one.
 
     In the pin modes table, "HWPWM" is used to specify that the pulse width
-    modulation is hardware-backed; "SWPWM" if it's software-backed. Make
-    sure you don't use too many software PWM pins at the same time, as
-    they're not very accurate and consume a lot of CPU.
+    modulation is hardware-backed; "SWPWM" if it's software-backed. PWM
+    waves are generated by the software PWM scheduler shared by all the
+    interfaces (see :py:mod:`pywiring.pwm`), which drives all the pins from
+    one thread and writes the edges that fall at the same time with a
+    single call.
+
+    If :py:data:`gpiomem` is True (or the path of the device), reads and
+    writes bypass RPi.GPIO and access the GPIO registers directly through
+    /dev/gpiomem (see :py:mod:`pywiring.gpiomem`): any number of pins is
+    read with one register load and written with at most two register
+    stores. RPi.GPIO is still used for pin setup, PWM and events.
     """
 
     number_of_pins = 28
@@ -90,11 +108,21 @@ class RasPiIO(IOBase, ABC):
     pullup_resistors = True
     pulldown_resistors = True
 
-    _pwm = {}
-
-    def __init__(self):
+    def __init__(self, gpiomem=False):
         super(RasPiIO, self).__init__()
-        GPIO.setmode(GPIO.BCM)
+        self._pwm = {}
+        self._gpio = hardware_module("RPi.GPIO")
+        self._gpio.setmode(self._gpio.BCM)
+        self._inputs = 0
+        self._outputs = 0
+        self._mem = None
+        if gpiomem:
+            from .gpiomem import GPIOMem
+            self._mem = GPIOMem() if gpiomem is True else GPIOMem(gpiomem)
+
+    @property
+    def bus_id(self):
+        return ("raspi",)
 
     def get_pin_modes(self):
         return PINMODES
@@ -103,20 +131,100 @@ class RasPiIO(IOBase, ABC):
         if pullup and pulldown:
             raise ValueError("Pin {0} can't have both a pull-up and a pull-down resistor attached to it.".format(pin))
         if not pullup and not pulldown:
-            pud = GPIO.PUD_OFF
+            pud = self._gpio.PUD_OFF
         else:
-            pud = GPIO.PUD_UP if pullup else GPIO.PUD_DOWN
+            pud = self._gpio.PUD_UP if pullup else self._gpio.PUD_DOWN
+
+        self._gpio.setup(pin, self._gpio.IN if input else self._gpio.OUT, pull_up_down=pud, initial=self._gpio.LOW)
 
-        GPIO.setup(pin, GPIO.IN if input else GPIO.OUT, pull_up_down=pud, initial=GPIO.LOW)
+        bpin = 1 << pin
+        if input:
+            self._inputs |= bpin
+            self._outputs &= ~bpin
+        else:
+            self._outputs |= bpin
+            self._inputs &= ~bpin
 
     def digital_read(self, pin):
-        return bool(GPIO.input(pin))
+        if self._batch_depth and (self._pending_set | self._pending_clear) >> pin & 1:
+            return bool(self._pending_set >> pin & 1)
+        if self._mem is not None:
+            return bool((self._mem.read_levels() >> pin) & 1)
+        return bool(self._gpio.input(pin))
+
+    def _pin_reader(self, pin):
+        if self._mem is not None:
+            read_levels = self._mem.read_levels
+            return lambda: read_levels() >> pin & 1
+        # A C function when RPi.GPIO is the real one
+        return functools.partial(self._gpio.input, pin)
+
+    def _read_mask(self, mask):
+        if self._mem is not None:
+            value = self._mem.read_levels() & mask
+        else:
+            gpio = self._gpio
+            value = 0
+            for pin in _mask2list(mask):
+                if gpio.input(pin):
+                    value |= 1 << pin
+        if self._batch_depth:
+            value = self._apply_pending(value, mask & self._outputs)
+        return value
+
+    def digital_read_bulk(self, *pins):
+        mask = 0
+        for pin in pins:
+            if 0 <= pin < self.number_of_pins:
+                mask |= 1 << pin
+        return _mask2pins(self._read_mask(mask), pins, self.number_of_pins)
+
+    def read_port(self):
+        """
+        Reads all the pins previously configured with
+        :py:meth:`~RasPiIO.pin_mode`. Unconfigured pins are reported as low.
+        """
+        return self._read_mask(self._inputs | self._outputs)
 
     def digital_write(self, pin, high):
-        GPIO.output(pin, GPIO.HIGH if high else GPIO.LOW)
+        if self._batch_depth:
+            if high:
+                self._queue_write(1 << pin, 0)
+            else:
+                self._queue_write(0, 1 << pin)
+            return
+        if self._mem is not None:
+            if high:
+                self._mem.set(1 << pin)
+            else:
+                self._mem.clear(1 << pin)
+            return
+        self._gpio.output(pin, self._gpio.HIGH if high else self._gpio.LOW)
+
+    def digital_write_bulk(self, pins):
+        self.modify_port(*_pins2masks(pins, self.number_of_pins))
+
+    def write_port(self, mask):
+        self.modify_port(mask & self._outputs, ~mask & self._outputs)
+
+    def modify_port(self, set_mask, clear_mask):
+        if self._queue_write(set_mask, clear_mask):
+            return
+        allpins = (1 << self.number_of_pins) - 1
+        if self._mem is not None:
+            self._mem.clear(clear_mask & ~set_mask & allpins)
+            self._mem.set(set_mask & allpins)
+            return
+        gpio = self._gpio
+        high = _mask2list(set_mask & allpins)
+        low = _mask2list(clear_mask & ~set_mask & allpins)
+        if high or low:
+            gpio.output(high + low, [gpio.HIGH] * len(high) + [gpio.LOW] * len(low))
 
     def analog_write(self, pin, value):
-        self.raspi_pwm_write(pin, 800, map(value, 0, 255, 0, 100))
+        dutycycle = map(value, 0, 255, 0, 100)
+        if not self._queue_call(self.raspi_pwm_write, pin, 800, dutycycle):
+            self.raspi_pwm_write(pin, 800, dutycycle)
 
     def raspi_pwm_write(self, pin, freq=None, dutycycle=None):
         """
@@ -128,44 +236,50 @@ class RasPiIO(IOBase, ABC):
         To disable, set them to 0.
         """
 
-        if pin not in self._pwm.keys() and None in (freq, dutycycle):
+        if pin not in self._pwm and None in (freq, dutycycle):
             raise ValueError("Both freq and dutycycle must be provided in order to enable PWM.")
-        elif pin not in self._pwm.keys():
+        elif pin not in self._pwm:
             if 0 in (freq, dutycycle):
                 return
-            pwm = GPIO.PWM(pin, freq)
-            pwm.start(dutycycle)
-            self._pwm[pin] = pwm
+            self._pwm[pin] = [freq, dutycycle]
         else:
             if 0 in (freq, dutycycle):
-                self._pwm.pop(pin).stop()
+                self._pwm.pop(pin)
+                self._pwm_scheduler.remove(self, pin)
                 return
             if freq is not None:
-                self._pwm[pin].ChangeFrequency(freq)
+                self._pwm[pin][0] = freq
             if dutycycle is not None:
-                self._pwm[pin].ChangeDutyCycle(dutycycle)
+                self._pwm[pin][1] = dutycycle
+        freq, dutycycle = self._pwm[pin]
+        self._software_pwm(pin, freq, dutycycle / 100.0)
 
     def enable_event_detect(self, pin, edge, callback=None, bounce=0):
         rpiedge = None
         if edge == "RISING":
-            rpiedge = RPi.GPIO.RISING
+            rpiedge = self._gpio.RISING
         elif edge == "FALLING":
-            rpiedge = Rpi.GPIO.FALLING
+            rpiedge = self._gpio.FALLING
         elif edge == "BOTH":
-            rpiedge = Rpi.GPIO.BOTH
+            rpiedge = self._gpio.BOTH
+        # RPi.GPIO rejects a bounce time of 0
+        kwargs = {"bouncetime": bounce} if bounce else {}
         if callback:
-            return RPi.GPIO.add_event_detect(pin, rpiedge, callback, bounce)
+            return self._gpio.add_event_detect(pin, rpiedge, callback, **kwargs)
         else:
-            return RPi.GPIO.add_event_detect(pin, rpiedge, bouncetime=bounce)
+            return self._gpio.add_event_detect(pin, rpiedge, **kwargs)
 
     def add_event_callback(self, pin, callback):
-        return RPi.GPIO.add_event_callback(pin, callback)
+        return self._gpio.add_event_callback(pin, callback)
 
     def disable_event_detect(self, pin):
-        return RPi.GPIO.remove_event_detect(pin)
+        return self._gpio.remove_event_detect(pin)
 
     def event_detected(self, pin):
-        return RPi.GPIO.event_detected(pin)
+        return self._gpio.event_detected(pin)
 
     def close(self):
-        GPIO.cleanup()
+        self._stop_software_pwm()
+        if self._mem is not None:
+            self._mem.close()
+        self._gpio.cleanup()
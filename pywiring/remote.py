@@ -0,0 +1,625 @@
+# -*- coding: utf-8 -*-
+
+"""
+Access to interfaces on another host, over TCP or a Unix socket.
+
+:py:class:`IOServer` exposes any interface; :py:class:`RemoteIO` is an
+interface whose operations are executed by the server.
+
+The protocol is binary. Every frame starts with a header holding the
+length of the payload, an opcode and a request id, and the payload is
+packed with :py:mod:`struct`. Requests are pipelined: the client can send
+many requests without waiting for the replies, which are matched to the
+requests by id. The server executes the requests in order and sends the
+replies to all the requests it has received in one go. Bulk reads and
+writes are sent as port bitmasks, so a whole
+:py:meth:`~IOBase.digital_write_bulk` or :py:meth:`~IOBase.digital_read_bulk`
+takes one round trip, and writes issued inside :py:meth:`~IOBase.batch`
+are sent as a single request.
+
+Events detected by the server are pushed to the client as soon as they
+happen.
+
+There is no authentication nor encryption: only expose servers on trusted
+networks, or on Unix sockets.
+"""
+
+__all__ = ("IOServer", "RemoteIO", "RemoteError")
+
+import json
+import os
+import queue
+import socket
+import struct
+import threading
+
+from . import IOBase, _pins2masks, _mask2pins
+from .events import EDGES, _dispatch
+
+DEFAULT_PORT = 7407
+
+# Header: payload length, opcode, request id
+_HEADER = struct.Struct("<IBI")
+
+# Requests
+OP_INFO = 0x01
+OP_PIN_MODE = 0x02
+OP_PORT_MODE = 0x03
+OP_READ_PORT = 0x04
+OP_WRITE_PORT = 0x05
+OP_MODIFY_PORT = 0x06
+OP_DIGITAL_READ = 0x07
+OP_ANALOG_READ = 0x08
+OP_ANALOG_WRITE = 0x09
+OP_PLAY = 0x0A
+OP_ENABLE_EVENT = 0x0B
+OP_DISABLE_EVENT = 0x0C
+OP_EVENT_DETECTED = 0x0D
+OP_PIN_MODE_BULK = 0x0E
+OP_SYNC = 0x0F
+
+# Server to client
+OP_REPLY = 0x80
+OP_ERROR = 0x81
+OP_EVENT = 0x82
+
+_MASK = 0xFFFFFFFFFFFFFFFF
+_U8 = struct.Struct("<B")
+_U16 = struct.Struct("<H")
+_I32 = struct.Struct("<i")
+_U64 = struct.Struct("<Q")
+_PIN_MODE = struct.Struct("<BB")
+_MODIFY = struct.Struct("<QQ")
+_ANALOG_WRITE = struct.Struct("<Bi")
+_PLAY = struct.Struct("<Qd")
+_EVENT = struct.Struct("<BBH")
+
+_INPUT = 1
+_PULLUP = 2
+_PULLDOWN = 4
+
+
+class RemoteError(IOError):
+    """
+    Raised by :py:class:`RemoteIO` when an operation failed on the server,
+    or the connection was lost.
+    """
+
+
+def _check_pin(pin):
+    # Pins travel as one byte
+    if not 0 <= pin <= 0xFF:
+        raise ValueError("Invalid pin: {0}".format(pin))
+    return pin
+
+
+def _mode_flags(input, pullup=False, pulldown=False):
+    return (_INPUT if input else 0) | (_PULLUP if pullup else 0) | (_PULLDOWN if pulldown else 0)
+
+
+def _frame(op, request_id, payload=b""):
+    return _HEADER.pack(len(payload), op, request_id) + payload
+
+
+def _frames(sock, buffer):
+    """
+    Reads from :py:data:`sock` into :py:data:`buffer` and returns the list
+    of the complete (op, request id, payload) frames received. Returns
+    None when the connection is closed.
+    """
+    data = sock.recv(65536)
+    if not data:
+        return None
+    buffer += data
+    frames = []
+    offset = 0
+    size = _HEADER.size
+    while len(buffer) - offset >= size:
+        length, op, request_id = _HEADER.unpack_from(buffer, offset)
+        if len(buffer) - offset - size < length:
+            break
+        start = offset + size
+        frames.append((op, request_id, bytes(buffer[start:start + length])))
+        offset = start + length
+    del buffer[:offset]
+    return frames
+
+
+def _listen(host, port, path):
+    if path is not None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(path)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+    sock.listen(5)
+    return sock
+
+
+def _connect(host, port, path):
+    if path is not None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(path)
+    else:
+        sock = socket.create_connection((host, port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+class _Connection(object):
+    # A client connected to an IOServer
+
+    def __init__(self, server, sock):
+        self.server = server
+        self.io = server.io
+        self.sock = sock
+        self.send_lock = threading.Lock()
+        self.events = set()
+
+    def send(self, data):
+        with self.send_lock:
+            self.sock.sendall(data)
+
+    def run(self):
+        buffer = bytearray()
+        try:
+            while True:
+                frames = _frames(self.sock, buffer)
+                if frames is None:
+                    break
+                replies = []
+                with self.server.lock:
+                    for op, request_id, payload in frames:
+                        try:
+                            replies.append(_frame(OP_REPLY, request_id, self.handle(op, payload)))
+                        except Exception as e:
+                            replies.append(_frame(OP_ERROR, request_id, str(e).encode("utf-8")))
+                self.send(b"".join(replies))
+        except (IOError, OSError):
+            pass
+        finally:
+            with self.server.lock:
+                for pin in self.events:
+                    try:
+                        self.server._unsubscribe(self, pin)
+                    except (IOError, OSError, NotImplementedError):
+                        pass
+            self.server._forget(self)
+            self.sock.close()
+
+    def push_event(self, pin):
+        try:
+            self.send(_frame(OP_EVENT, 0, _U8.pack(pin)))
+        except (IOError, OSError):
+            pass
+
+    def handle(self, op, payload):
+        io = self.io
+        if op == OP_READ_PORT:
+            return _U64.pack(io.read_port() & _MASK)
+        if op == OP_MODIFY_PORT:
+            io.modify_port(*_MODIFY.unpack(payload))
+            return b""
+        if op == OP_WRITE_PORT:
+            io.write_port(_U64.unpack(payload)[0])
+            return b""
+        if op == OP_DIGITAL_READ:
+            value = io.digital_read(_U8.unpack(payload)[0])
+            return _I32.pack(-1 if value is None else int(value))
+        if op == OP_PIN_MODE:
+            pin, flags = _PIN_MODE.unpack(payload)
+            io.pin_mode(pin, bool(flags & _INPUT), bool(flags & _PULLUP), bool(flags & _PULLDOWN))
+            return b""
+        if op == OP_PIN_MODE_BULK:
+            pins = {}
+            for offset in range(0, len(payload), _PIN_MODE.size):
+                pin, flags = _PIN_MODE.unpack_from(payload, offset)
+                pins[pin] = (bool(flags & _INPUT), bool(flags & _PULLUP), bool(flags & _PULLDOWN))
+            io.pin_mode_bulk(pins)
+            return b""
+        if op == OP_PORT_MODE:
+            flags = _U8.unpack(payload)[0]
+            io.port_mode(bool(flags & _INPUT), bool(flags & _PULLUP), bool(flags & _PULLDOWN))
+            return b""
+        if op == OP_ANALOG_READ:
+            return _I32.pack(io.analog_read(_U8.unpack(payload)[0]))
+        if op == OP_ANALOG_WRITE:
+            io.analog_write(*_ANALOG_WRITE.unpack(payload))
+            return b""
+        if op == OP_PLAY:
+            mask, rate = _PLAY.unpack_from(payload)
+            states = struct.unpack_from("<{0}Q".format((len(payload) - _PLAY.size) // 8), payload, _PLAY.size)
+            io.play(states, mask, rate or None)
+            return b""
+        if op == OP_ENABLE_EVENT:
+            pin, edge, bounce = _EVENT.unpack(payload)
+            self.server._subscribe(self, pin, EDGES[edge], bounce)
+            self.events.add(pin)
+            return b""
+        if op == OP_DISABLE_EVENT:
+            pin = _U8.unpack(payload)[0]
+            if pin in self.events:
+                self.events.discard(pin)
+                self.server._unsubscribe(self, pin)
+            return b""
+        if op == OP_EVENT_DETECTED:
+            return _U8.pack(bool(io.event_detected(_U8.unpack(payload)[0])))
+        if op == OP_SYNC:
+            return b""
+        if op == OP_INFO:
+            try:
+                modes = io.get_pin_modes()
+            except NotImplementedError:
+                modes = None
+            return json.dumps({
+                "number_of_pins": io.number_of_pins,
+                "has_adc": io.has_adc,
+                "has_pwm": io.has_pwm,
+                "has_input": io.has_input,
+                "pullup_resistors": io.pullup_resistors,
+                "pulldown_resistors": io.pulldown_resistors,
+                "avg_exec_time": io.avg_exec_time,
+                "pin_modes": modes,
+            }).encode("utf-8")
+        raise ValueError("Unknown opcode: {0:#x}".format(op))
+
+
+class IOServer(object):
+    """
+    Exposes :py:data:`io` to :py:class:`RemoteIO` clients, on TCP
+    :py:data:`host`:\\ :py:data:`port` or, if :py:data:`path` is given,
+    on a Unix socket. Every client is served by its own thread; the
+    operations of all the clients are serialized.
+
+    Several clients can detect events on the same pin: the events are
+    pushed to all of them, and event detection is disabled on the
+    interface when the last one disables it or disconnects. The edge and
+    bounce time are set by the first one; the others must ask for the
+    same.
+
+    Call :py:meth:`start` to serve in the background, or
+    :py:meth:`serve_forever`.
+    """
+
+    def __init__(self, io, host="127.0.0.1", port=DEFAULT_PORT, path=None):
+        self.io = io
+        self.path = path
+        self.lock = threading.RLock()
+        self._sock = _listen(host, port, path)
+        self.address = self._sock.getsockname()
+        self._connections = set()
+        # pin -> (edge, bounce, frozenset of the subscribed connections)
+        self._subscriptions = {}
+        self._thread = None
+        self._running = True
+
+    def serve_forever(self):
+        while self._running:
+            try:
+                sock, _ = self._sock.accept()
+            except (IOError, OSError):
+                break
+            if sock.family != socket.AF_UNIX:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection = _Connection(self, sock)
+            with self.lock:
+                self._connections.add(connection)
+            thread = threading.Thread(target=connection.run, name="pywiring-remote")
+            thread.daemon = True
+            thread.start()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="pywiring-server")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _subscribe(self, connection, pin, edge, bounce):
+        # Called with the lock held
+        subscription = self._subscriptions.get(pin)
+        if subscription is None or subscription[2] == frozenset((connection,)):
+            if subscription is not None:
+                # The only subscriber changes its settings
+                del self._subscriptions[pin]
+                self.io.disable_event_detect(pin)
+            self.io.enable_event_detect(pin, edge, self._push_event, bounce)
+            self._subscriptions[pin] = (edge, bounce, frozenset((connection,)))
+        elif subscription[:2] != (edge, bounce):
+            raise ValueError("Events on pin {0} are already detected with edge {1} and bounce {2}".format(
+                pin, subscription[0], subscription[1]))
+        else:
+            self._subscriptions[pin] = (edge, bounce, subscription[2] | frozenset((connection,)))
+
+    def _unsubscribe(self, connection, pin):
+        # Called with the lock held
+        subscription = self._subscriptions.get(pin)
+        if subscription is None:
+            return
+        connections = subscription[2] - frozenset((connection,))
+        if connections:
+            self._subscriptions[pin] = subscription[:2] + (connections,)
+            return
+        del self._subscriptions[pin]
+        self.io.disable_event_detect(pin)
+
+    def _push_event(self, pin):
+        # Called from the event thread of the interface, without the lock:
+        # the subscriptions are replaced, not modified
+        subscription = self._subscriptions.get(pin)
+        if subscription is not None:
+            for connection in subscription[2]:
+                connection.push_event(pin)
+
+    def _forget(self, connection):
+        with self.lock:
+            self._connections.discard(connection)
+
+    def close(self):
+        """
+        Stops accepting clients and disconnects the current ones. The
+        interface is left open.
+        """
+        self._running = False
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except (IOError, OSError):
+            pass
+        self._sock.close()
+        if self.path is not None:
+            os.unlink(self.path)
+        with self.lock:
+            connections = list(self._connections)
+        for connection in connections:
+            try:
+                connection.sock.shutdown(socket.SHUT_RDWR)
+            except (IOError, OSError):
+                pass
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class RemoteIO(IOBase):
+    """
+    Interface whose operations are executed by an :py:class:`IOServer` on
+    TCP :py:data:`host`:\\ :py:data:`port` or, if :py:data:`path` is given,
+    on a Unix socket. The attributes (:py:attr:`number_of_pins`,
+    :py:attr:`has_pwm`, ...) are the ones of the server's interface.
+
+    Reads wait for the reply. Writes are pipelined: they return as soon as
+    they're sent, and a write that failed on the server raises
+    :py:exc:`RemoteError` from the next operation that waits for a reply
+    (or from :py:meth:`sync`). Event callbacks are called in order from a
+    thread of their own, so they can use the interface; an exception raised
+    by a callback is logged.
+
+    Pins are numbered from 0 to 255; :py:exc:`ValueError` is raised for
+    the others (:py:meth:`digital_read` returns None).
+    """
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, path=None, timeout=10.0):
+        super(RemoteIO, self).__init__()
+        self.address = path if path is not None else (host, port)
+        self.timeout = timeout
+        self._sock = _connect(host, port, path)
+        self._send_lock = threading.Lock()
+        self._pending = {}
+        self._next_id = 1
+        self._error = None
+        self._closed = False
+        self._events = {}
+        self._event_queue = queue.SimpleQueue()
+
+        self._thread = threading.Thread(target=self._receive, name="pywiring-remote-client")
+        self._thread.daemon = True
+        self._thread.start()
+        self._dispatcher = threading.Thread(target=self._dispatch_events, name="pywiring-remote-events")
+        self._dispatcher.daemon = True
+        self._dispatcher.start()
+
+        info = json.loads(self._request(OP_INFO).decode("utf-8"))
+        self._pin_modes = info.pop("pin_modes")
+        for name, value in info.items():
+            setattr(self, name, value)
+
+    @property
+    def bus_id(self):
+        return ("remote", self.address)
+
+    def _send(self, op, payload=b"", wait=True):
+        with self._send_lock:
+            if self._closed:
+                raise RemoteError("Connection closed")
+            request_id = self._next_id
+            self._next_id = (request_id + 1) & 0xFFFFFFFF or 1
+            if wait:
+                # [done, reply, error]
+                self._pending[request_id] = [threading.Event(), None, None]
+            self._sock.sendall(_frame(op, request_id, payload))
+        return request_id
+
+    def _wait(self, request_id):
+        pending = self._pending[request_id]
+        if not pending[0].wait(self.timeout):
+            self._pending.pop(request_id, None)
+            raise RemoteError("Timed out waiting for the server")
+        del self._pending[request_id]
+        self._raise_error()
+        if pending[2] is not None:
+            raise RemoteError(pending[2])
+        return pending[1]
+
+    def _request(self, op, payload=b""):
+        return self._wait(self._send(op, payload))
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RemoteError(error)
+
+    def _receive(self):
+        buffer = bytearray()
+        try:
+            while True:
+                frames = _frames(self._sock, buffer)
+                if frames is None:
+                    break
+                for op, request_id, payload in frames:
+                    if op == OP_EVENT:
+                        self._event_received(_U8.unpack(payload)[0])
+                        continue
+                    pending = self._pending.get(request_id)
+                    if op == OP_ERROR:
+                        if pending is None:
+                            # A pipelined write failed
+                            self._error = payload.decode("utf-8", "replace")
+                            continue
+                        pending[2] = payload.decode("utf-8", "replace")
+                    elif pending is not None:
+                        pending[1] = payload
+                    if pending is not None:
+                        pending[0].set()
+        except (IOError, OSError):
+            pass
+        finally:
+            self._closed = True
+            for pending in list(self._pending.values()):
+                pending[2] = "Connection closed"
+                pending[0].set()
+            self._event_queue.put(None)
+
+    def _event_received(self, pin):
+        state = self._events.get(pin)
+        if state is not None:
+            state[1] = True
+            self._event_queue.put(pin)
+
+    def _dispatch_events(self):
+        # Calls the callbacks out of the thread receiving the replies, which
+        # they may wait for
+        while True:
+            pin = self._event_queue.get()
+            if pin is None:
+                return
+            state = self._events.get(pin)
+            if state is not None:
+                _dispatch(list(state[0]), pin)
+
+    def sync(self):
+        """
+        Waits until the server has executed all the operations sent so far,
+        raising :py:exc:`RemoteError` if any of them failed.
+        """
+        self._request(OP_SYNC)
+
+    def get_pin_modes(self):
+        if self._pin_modes is None:
+            raise NotImplementedError
+        return self._pin_modes
+
+    def pin_mode(self, pin, input, pullup=False, pulldown=False):
+        self._send(OP_PIN_MODE, _PIN_MODE.pack(_check_pin(pin), _mode_flags(input, pullup, pulldown)), False)
+
+    def pin_mode_bulk(self, pins):
+        payload = b"".join(_PIN_MODE.pack(_check_pin(pin), _mode_flags(*pins[pin])) for pin in pins)
+        self._send(OP_PIN_MODE_BULK, payload, False)
+
+    def port_mode(self, input, pullup=False, pulldown=False):
+        self._send(OP_PORT_MODE, _U8.pack(_mode_flags(input, pullup, pulldown)), False)
+
+    def read_port(self):
+        value = _U64.unpack(self._request(OP_READ_PORT))[0]
+        if self._batch_depth:
+            value = self._apply_pending(value)
+        return value
+
+    def digital_read(self, pin):
+        if self._batch_depth and (self._pending_set | self._pending_clear) >> pin & 1:
+            return bool(self._pending_set >> pin & 1)
+        if not 0 <= pin <= 0xFF:
+            return None
+        value = _I32.unpack(self._request(OP_DIGITAL_READ, _U8.pack(pin)))[0]
+        return None if value < 0 else bool(value)
+
+    def digital_read_bulk(self, *pins):
+        return _mask2pins(self.read_port(), pins, self.number_of_pins)
+
+    def write_port(self, mask):
+        if not self._queue_write(mask, ~mask & ((1 << self.number_of_pins) - 1)):
+            self._send(OP_WRITE_PORT, _U64.pack(mask & _MASK), False)
+
+    def modify_port(self, set_mask, clear_mask):
+        if not self._queue_write(set_mask, clear_mask):
+            self._send(OP_MODIFY_PORT, _MODIFY.pack(set_mask & _MASK, clear_mask & _MASK), False)
+
+    def digital_write(self, pin, high):
+        if high:
+            self.modify_port(1 << pin, 0)
+        else:
+            self.modify_port(0, 1 << pin)
+
+    def digital_write_bulk(self, pins):
+        self.modify_port(*_pins2masks(pins, self.number_of_pins))
+
+    def play(self, states, mask=None, rate=None):
+        """
+        Sends all the states to the server in one request, and plays them
+        there. See :py:meth:`IOBase.play`.
+        """
+        if hasattr(states, "tolist"):
+            states = states.tolist()
+        states = [state & _MASK for state in states]
+        payload = _PLAY.pack(_MASK if mask is None else mask & _MASK, rate or 0.0)
+        self._send(OP_PLAY, payload + struct.pack("<{0}Q".format(len(states)), *states), False)
+
+    def analog_read(self, pin):
+        return _I32.unpack(self._request(OP_ANALOG_READ, _U8.pack(_check_pin(pin))))[0]
+
+    def analog_write(self, pin, value):
+        _check_pin(pin)
+        if not self._queue_call(self.analog_write, pin, value):
+            self._send(OP_ANALOG_WRITE, _ANALOG_WRITE.pack(pin, int(value)), False)
+
+    def enable_event_detect(self, pin, edge, callback=None, bounce=0):
+        if edge not in EDGES:
+            raise ValueError("Invalid edge: {0}".format(edge))
+        _check_pin(pin)
+        # [callbacks, detected]
+        self._events[pin] = [[callback] if callback else [], False]
+        self._request(OP_ENABLE_EVENT, _EVENT.pack(pin, EDGES.index(edge), int(bounce)))
+
+    def add_event_callback(self, pin, callback):
+        try:
+            self._events[pin][0].append(callback)
+        except KeyError:
+            raise RuntimeError("Event detection is not enabled on pin {0}".format(pin))
+
+    def disable_event_detect(self, pin):
+        self._events.pop(pin, None)
+        self._request(OP_DISABLE_EVENT, _U8.pack(_check_pin(pin)))
+
+    def event_detected(self, pin):
+        state = self._events.get(pin)
+        if state is None or not state[1]:
+            return False
+        state[1] = False
+        return True
+
+    def close(self):
+        """
+        Disconnects from the server. The server's interface is left open.
+        """
+        if not self._closed:
+            try:
+                self.sync()
+            except RemoteError:
+                pass
+        self._closed = True
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except (IOError, OSError):
+            pass
+        self._sock.close()
+        self._thread.join()
+        if threading.current_thread() is not self._dispatcher:
+            self._dispatcher.join()
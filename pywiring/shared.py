@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""
+Device state shared between processes.
+
+An interface's shadow registers can be kept in a small POSIX shared memory
+segment, protected by a file lock, so that several processes driving the
+same device see each other's writes.
+"""
+
+__all__ = ("SharedState",)
+
+import fcntl
+import os
+import struct
+import tempfile
+from multiprocessing import shared_memory, resource_tracker
+
+_INITIALIZED = 0xA5
+
+
+class SharedState(object):
+    """
+    Keeps the attributes :py:data:`attributes` of :py:data:`owner`, packed
+    with the :py:mod:`struct` format :py:data:`format`, in the shared
+    memory segment called :py:data:`name`.
+
+    Use the object as a context manager around every read-modify-write of
+    the attributes: on entry it acquires :py:data:`lock` (the owner's
+    in-process lock) and the cross-process lock, and loads the attributes
+    from shared memory; on exit it stores them back and releases the locks.
+    It can be entered again by the thread holding it.
+
+    The process creating the segment initializes it with the current value
+    of the attributes. The segment is left in place when the processes
+    exit, like the state of the device itself; :py:meth:`unlink` removes it.
+    """
+
+    def __init__(self, name, owner, attributes, format, lock):
+        self.name = name
+        self.owner = owner
+        self.attributes = attributes
+        self.lock = lock
+        self._struct = struct.Struct("<B" + format)
+        self._depth = 0
+
+        self._lockfd = os.open(os.path.join(tempfile.gettempdir(), name + ".lock"),
+                               os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            self._shm = shared_memory.SharedMemory(name, create=True, size=self._struct.size)
+        except FileExistsError:
+            self._shm = shared_memory.SharedMemory(name)
+        # The segment must outlive this process: don't let the resource
+        # tracker unlink it at exit
+        resource_tracker.unregister(self._shm._name, "shared_memory")
+
+        fcntl.flock(self._lockfd, fcntl.LOCK_EX)
+        try:
+            if self._shm.buf[0] != _INITIALIZED:
+                self._store()
+        finally:
+            fcntl.flock(self._lockfd, fcntl.LOCK_UN)
+
+    def _store(self):
+        owner = self.owner
+        self._struct.pack_into(self._shm.buf, 0, _INITIALIZED,
+                               *[getattr(owner, attribute) for attribute in self.attributes])
+
+    def load(self):
+        """
+        Returns the current values of the attributes, as a tuple, without
+        taking any lock.
+        """
+        return self._struct.unpack_from(self._shm.buf)[1:]
+
+    def __enter__(self):
+        self.lock.acquire()
+        if not self._depth:
+            try:
+                fcntl.flock(self._lockfd, fcntl.LOCK_EX)
+            except BaseException:
+                self.lock.release()
+                raise
+            owner = self.owner
+            for attribute, value in zip(self.attributes, self.load()):
+                setattr(owner, attribute, value)
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if not self._depth:
+            try:
+                self._store()
+            finally:
+                fcntl.flock(self._lockfd, fcntl.LOCK_UN)
+        self.lock.release()
+
+    def close(self):
+        self._shm.close()
+        os.close(self._lockfd)
+
+    def unlink(self):
+        """
+        Removes the shared memory segment. Processes still using it keep
+        their mapping, but new ones will start from a fresh state.
+        """
+        # unlink() unregisters the segment from the resource tracker
+        resource_tracker.register(self._shm._name, "shared_memory")
+        self._shm.unlink()
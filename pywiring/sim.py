@@ -0,0 +1,727 @@
+# -*- coding: utf-8 -*-
+
+"""
+Simulated stand-ins for the hardware libraries used by the backends
+(smbus, smbus2, pyparallel and RPi.GPIO), to run and measure PyWiring
+without the hardware.
+
+A :py:class:`Simulation` installs them with
+:py:func:`~pywiring.override_hardware_module`, so that the interfaces
+created while it's active talk to simulated I2C buses
+(:py:class:`SimI2CBus`, with devices such as :py:class:`SimPCF8574`
+attached to them), parallel ports (:py:class:`SimParallelPort`) and GPIO
+pins (:py:class:`SimGPIO`).
+
+Every simulated bus counts the transactions it receives. Optionally, it
+also models how long they take on the hardware: I2C transactions last as
+long as their bits take at the bus frequency (e.g. :py:const:`STANDARD_MODE`
+or :py:const:`FAST_MODE`), and parallel port and GPIO accesses last a
+fixed time. The modeled time is added up in :py:attr:`busy_time`, and, if
+the simulation is :py:data:`realtime`, spent busy-waiting, so that
+measurements include it. The GIL is released while waiting, as the real
+libraries release it during their system calls, so that transactions on
+different buses from different threads overlap.
+"""
+
+__all__ = ("STANDARD_MODE", "FAST_MODE", "FAST_MODE_PLUS", "Simulation", "SimI2CBus", "SimDevice",
+           "SimPCF8574", "SimPCF8575", "SimMCP23017", "SimADS1115", "SimADS7830", "SimParallelPort", "SimGPIO")
+
+import errno
+import time
+import types
+
+from . import override_hardware_module
+
+STANDARD_MODE = 100000
+FAST_MODE = 400000
+FAST_MODE_PLUS = 1000000
+
+MODULES = ("smbus", "smbus2", "parallel", "RPi.GPIO")
+
+
+class _Timed(object):
+    """
+    Transaction counter and timing model of a simulated bus.
+    """
+
+    def __init__(self, realtime=True):
+        self.realtime = realtime
+        self.transactions = 0
+        self.busy_time = 0.0
+
+    def _spend(self, duration):
+        self.transactions += 1
+        if duration:
+            self.busy_time += duration
+            if self.realtime:
+                # Sleeping isn't accurate enough for microseconds;
+                # sleep(0) only lets the other threads run
+                end = time.perf_counter() + duration
+                while time.perf_counter() < end:
+                    time.sleep(0)
+
+    def reset_stats(self):
+        self.transactions = 0
+        self.busy_time = 0.0
+
+    def stats(self):
+        return {"transactions": self.transactions, "busy_time": self.busy_time}
+
+
+class SimDevice(object):
+    """
+    Base class of the simulated I2C devices. SMBus transactions are
+    translated into the raw bytes they carry: :py:meth:`write` receives
+    the bytes written after the address, and :py:meth:`read` returns the
+    bytes read.
+    """
+
+    def write(self, data):
+        pass
+
+    def read(self, count):
+        return [0xFF] * count
+
+
+class SimPCF8574(SimDevice):
+    """
+    PCF8574 8-bit quasi-bidirectional expander. Every byte written is
+    latched into :py:attr:`latch`; a pin written high is weakly pulled up,
+    so it can be pulled low from the outside by clearing its bit in
+    :py:attr:`inputs`. Reads return the level of the pins,
+    ``latch & inputs``, which is what hardware returns too: a pin written
+    low always reads low.
+    """
+
+    width = 1
+
+    def __init__(self):
+        mask = (1 << 8 * self.width) - 1
+        self.latch = mask
+        self.inputs = mask
+
+    @property
+    def levels(self):
+        return self.latch & self.inputs
+
+    def write(self, data):
+        # Each port state replaces the previous one: only the last counts
+        width = self.width
+        end = len(data) - len(data) % width
+        if end:
+            value = 0
+            for j in range(width):
+                value |= data[end - width + j] << 8 * j
+            self.latch = value
+
+    def read(self, count):
+        levels = self.latch & self.inputs
+        if self.width == 1:
+            return [levels] * count
+        return [levels >> 8 * (i % self.width) & 0xFF for i in range(count)]
+
+
+class SimPCF8575(SimPCF8574):
+    """
+    PCF8575 16-bit quasi-bidirectional expander: same as
+    :py:class:`SimPCF8574`, two bytes (P00-P07, then P10-P17) per port
+    state.
+    """
+
+    width = 2
+
+
+class SimMCP23017(SimDevice):
+    """
+    MCP23017 register model with IOCON.BANK = 0. The first byte written
+    sets the register pointer, the following ones are written from there,
+    moving to the next register, or toggling between the A and B register
+    when IOCON.SEQOP is set. Writes to GPIO go to OLAT.
+
+    :py:attr:`inputs` is the level driven on the pins from the outside;
+    change it with :py:meth:`set_inputs` to update the interrupt flags and
+    captured port (INTCON = 0, interrupt on change from the previous
+    level). :py:attr:`writes` holds the (register, values) of every write.
+    """
+
+    IODIR, GPINTEN, IOCON, INTF, INTCAP, GPIO, OLAT = 0x00, 0x04, 0x0A, 0x0E, 0x10, 0x12, 0x14
+
+    def __init__(self):
+        self.registers = bytearray(0x16)
+        self.registers[self.IODIR] = self.registers[self.IODIR + 1] = 0xFF
+        self.pointer = 0
+        self.inputs = 0
+        self.writes = []
+
+    def word(self, register):
+        return self.registers[register] | self.registers[register + 1] << 8
+
+    def _next(self, register):
+        if self.registers[self.IOCON] & 0x20:
+            return register ^ 1
+        return register + 1
+
+    def _port(self, inputs):
+        iodir = self.word(self.IODIR)
+        return (inputs & iodir) | (self.word(self.OLAT) & ~iodir & 0xFFFF)
+
+    def set_inputs(self, value):
+        changed = (value ^ self.inputs) & self.word(self.IODIR) & self.word(self.GPINTEN)
+        if changed and not self.word(self.INTF):
+            port = self._port(value)
+            self.registers[self.INTF], self.registers[self.INTF + 1] = changed & 0xFF, changed >> 8
+            self.registers[self.INTCAP], self.registers[self.INTCAP + 1] = port & 0xFF, port >> 8
+        self.inputs = value
+
+    def write(self, data):
+        register = self.pointer = data[0]
+        if len(data) > 1:
+            self.writes.append((register, list(data[1:])))
+        for value in data[1:]:
+            if register in (self.GPIO, self.GPIO + 1):
+                self.registers[self.OLAT + (register & 1)] = value
+            else:
+                self.registers[register] = value
+            register = self._next(register)
+
+    def read(self, count):
+        port = self._port(self.inputs)
+        values = []
+        register = self.pointer
+        for _ in range(count):
+            if register in (self.GPIO, self.GPIO + 1):
+                values.append(port >> 8 * (register & 1) & 0xFF)
+            else:
+                values.append(self.registers[register])
+            if register in (self.INTCAP, self.INTCAP + 1, self.GPIO, self.GPIO + 1):
+                # Reading INTCAP or GPIO clears the interrupt
+                self.registers[self.INTF] = self.registers[self.INTF + 1] = 0
+            register = self._next(register)
+        return values
+
+
+class SimADS1115(SimDevice):
+    """
+    ADS1115 register model: the first byte written selects the register,
+    two more bytes write it. Conversions are ready at once: the conversion
+    register holds the input selected by the config register.
+    :py:attr:`inputs` holds the signed conversion result of each input
+    against GND (any sequence indexed by channel); differential inputs
+    read the difference. :py:attr:`configs` holds every value written to
+    the config register.
+    """
+
+    # Inputs compared by the differential MUX settings
+    DIFFERENTIAL = ((0, 1), (0, 3), (1, 3), (2, 3))
+
+    def __init__(self):
+        self.pointer = 0
+        self.config = 0x8583
+        self.configs = []
+        self.inputs = [0, 0, 0, 0]
+
+    def write(self, data):
+        self.pointer = data[0]
+        if self.pointer == 0x01 and len(data) == 3:
+            self.config = data[1] << 8 | data[2]
+            self.configs.append(self.config)
+
+    def read(self, count):
+        if self.pointer == 0x01:
+            value = self.config | 0x8000
+        else:
+            mux = self.config >> 12 & 7
+            if mux & 4:
+                value = self.inputs[mux & 3]
+            else:
+                positive, negative = self.DIFFERENTIAL[mux]
+                value = max(-0x8000, min(0x7FFF, self.inputs[positive] - self.inputs[negative]))
+            value &= 0xFFFF
+        return [value >> 8, value & 0xFF][:count]
+
+
+class SimADS7830(SimDevice):
+    """
+    ADS7830 model: every command byte starts a conversion of the
+    single-ended channel it selects, returned by every byte read after it.
+    :py:attr:`inputs` holds the 8-bit result of each channel (any sequence
+    indexed by channel), and :py:attr:`commands` every command byte
+    received.
+    """
+
+    def __init__(self):
+        self.commands = []
+        self.inputs = [0] * 8
+
+    def write(self, data):
+        self.commands.extend(data)
+
+    def read(self, count):
+        command = self.commands[-1]
+        channel = (command >> 6 & 1) | (command >> 4 & 3) << 1
+        return [self.inputs[channel]] * count
+
+
+class SimI2CBus(_Timed):
+    """
+    Simulated I2C bus. Attach devices with :py:meth:`attach`; transactions
+    to addresses with no device fail like on hardware, with an
+    :py:class:`IOError` (EREMOTEIO).
+
+    If :py:data:`frequency` (Hz) is set, a transaction lasts 9 bit times
+    per byte (8 data bits and the acknowledge), including the address
+    bytes, plus a bit time for each start and stop condition, plus
+    :py:data:`overhead` seconds (the cost of the system call).
+    """
+
+    def __init__(self, number, frequency=None, overhead=0.0, realtime=True):
+        super(SimI2CBus, self).__init__(realtime)
+        self.number = number
+        self.frequency = frequency
+        self.overhead = overhead
+        self.devices = {}
+
+    def attach(self, address, device):
+        """
+        Attaches :py:data:`device` at :py:data:`address` and returns it.
+        """
+        self.devices[address] = device
+        return device
+
+    def detach(self, address):
+        return self.devices.pop(address)
+
+    def duration(self, written, read):
+        """
+        Modeled duration of a transaction writing :py:data:`written` bytes
+        and then reading :py:data:`read` bytes, not counting the address
+        bytes.
+        """
+        if not self.frequency:
+            return self.overhead
+        # Address byte and start condition of each part, plus the stop
+        parts = (1 if written else 0) + (1 if read else 0)
+        bits = 9 * (written + read + parts) + parts + 1
+        return bits / float(self.frequency) + self.overhead
+
+    def transfer(self, address, data=(), count=0):
+        """
+        Writes the bytes in :py:data:`data` to the device at
+        :py:data:`address`, then reads :py:data:`count` bytes from it, in one
+        transaction (with a repeated start in between).
+        """
+        device = self.devices.get(address)
+        self._spend(self.duration(len(data), count))
+        if device is None:
+            raise IOError(errno.EREMOTEIO, "Remote I/O error")
+        if data:
+            device.write(list(data))
+        if count:
+            return device.read(count)
+        return []
+
+
+class _SMBus(object):
+    """
+    Simulated ``smbus.SMBus`` handle, bound to the buses of a
+    :py:class:`Simulation`.
+    """
+
+    simulation = None
+
+    def __init__(self, bus=None):
+        self._bus = None
+        if bus is not None:
+            self.open(bus)
+
+    def open(self, bus):
+        self._bus = self.simulation.bus(bus)
+
+    def close(self):
+        self._bus = None
+
+    def read_byte(self, address):
+        return self._bus.transfer(address, count=1)[0]
+
+    def write_byte(self, address, value):
+        self._bus.transfer(address, (value,))
+
+    def read_byte_data(self, address, cmd):
+        return self._bus.transfer(address, (cmd,), 1)[0]
+
+    def write_byte_data(self, address, cmd, value):
+        self._bus.transfer(address, (cmd, value))
+
+    def read_word_data(self, address, cmd):
+        low, high = self._bus.transfer(address, (cmd,), 2)
+        return high << 8 | low
+
+    def write_word_data(self, address, cmd, value):
+        self._bus.transfer(address, (cmd, value & 0xFF, value >> 8))
+
+    def read_i2c_block_data(self, address, cmd, length=32):
+        return self._bus.transfer(address, (cmd,), length)
+
+    def write_i2c_block_data(self, address, cmd, values):
+        self._bus.transfer(address, [cmd] + list(values))
+
+    def i2c_rdwr(self, *messages):
+        for msg in messages:
+            if msg.read:
+                msg.data = self._bus.transfer(msg.addr, count=len(msg))
+            else:
+                self._bus.transfer(msg.addr, msg.data)
+
+
+class _I2CMsg(object):
+    """
+    Simulated smbus2 ``i2c_msg``. :py:meth:`read` and :py:meth:`write`
+    create messages; on a message, :py:attr:`read` tells whether it's a
+    read.
+    """
+
+    def __init__(self, address, data, read):
+        self.addr = address
+        self.data = data
+        self.read = read
+
+    @classmethod
+    def read(cls, address, length):
+        return cls(address, [0] * length, True)
+
+    @classmethod
+    def write(cls, address, data):
+        return cls(address, list(data), False)
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+
+class SimParallelPort(_Timed):
+    """
+    Simulated parallel port registers: :py:attr:`data`, :py:attr:`control`
+    and :py:attr:`status` (the raw register values; set :py:attr:`status`
+    to drive the inputs). Every register access lasts
+    :py:data:`access_time` seconds.
+    """
+
+    def __init__(self, number, access_time=0.0, realtime=True):
+        super(SimParallelPort, self).__init__(realtime)
+        self.number = number
+        self.access_time = access_time
+        self.data = 0
+        self.control = 0
+        self.status = 0
+
+
+class _Parallel(object):
+    """
+    Simulated ``parallel.Parallel`` handle, bound to the ports of a
+    :py:class:`Simulation`.
+    """
+
+    simulation = None
+
+    def __init__(self, port=0):
+        self._port = self.simulation.port(port)
+
+    def _access(self):
+        port = self._port
+        port._spend(port.access_time)
+        return port
+
+    def getData(self):
+        return self._access().data
+
+    def setData(self, value):
+        self._access().data = value & 0xFF
+
+    def PPRSTATUS(self):
+        return self._access().status
+
+    def PPRCONTROL(self):
+        return self._access().control
+
+    def PPWCONTROL(self, value):
+        self._access().control = value & 0xFF
+
+    def _set_control_bit(self, bit, level):
+        port = self._access()
+        port.control = port.control | bit if level else port.control & ~bit
+
+    def setDataStrobe(self, level):
+        self._set_control_bit(0x01, not level)
+
+    def setAutoFeed(self, level):
+        self._set_control_bit(0x02, not level)
+
+    def setInitOut(self, level):
+        self._set_control_bit(0x04, level)
+
+    def setSelect(self, level):
+        self._set_control_bit(0x08, not level)
+
+    def getInError(self):
+        return bool(self._access().status & 0x08)
+
+    def getInSelected(self):
+        return bool(self._access().status & 0x10)
+
+    def getInPaperOut(self):
+        return bool(self._access().status & 0x20)
+
+    def getInAcknowledge(self):
+        return bool(self._access().status & 0x40)
+
+    def getInBusy(self):
+        return not self._access().status & 0x80
+
+    def PPRELEASE(self):
+        pass
+
+
+class SimGPIO(_Timed):
+    """
+    Simulated RPi.GPIO module. Output pins read back what was written;
+    input pins read the level set with :py:meth:`set_input`, or the level
+    of their pull resistor. Every call that accesses the pins lasts
+    :py:data:`access_time` seconds.
+
+    Edges on inputs, set with :py:meth:`set_input` or :py:meth:`inject`,
+    call the callbacks registered with :py:meth:`add_event_detect` from
+    the caller's thread, as RPi.GPIO calls them from its event thread.
+    """
+
+    BOARD, BCM = 10, 11
+    OUT, IN = 0, 1
+    LOW, HIGH = 0, 1
+    PUD_OFF, PUD_DOWN, PUD_UP = 20, 21, 22
+    RISING, FALLING, BOTH = 31, 32, 33
+
+    def __init__(self, access_time=0.0, realtime=True):
+        super(SimGPIO, self).__init__(realtime)
+        self.access_time = access_time
+        self.mode = None
+        self.directions = {}
+        self.outputs = {}
+        self.inputs = {}
+        self._pulls = {}
+        self._events = {}
+        self._detected = set()
+
+    # RPi.GPIO
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def getmode(self):
+        return self.mode
+
+    def setwarnings(self, enabled):
+        pass
+
+    def _channels(self, channel):
+        return channel if isinstance(channel, (list, tuple)) else (channel,)
+
+    def setup(self, channel, direction, pull_up_down=PUD_OFF, initial=None):
+        if self.mode is None:
+            raise RuntimeError("Please set pin numbering mode using GPIO.setmode(GPIO.BOARD) or "
+                               "GPIO.setmode(GPIO.BCM)")
+        self._spend(self.access_time)
+        for pin in self._channels(channel):
+            self.directions[pin] = direction
+            self._pulls[pin] = pull_up_down
+            if direction == self.OUT:
+                self.outputs[pin] = initial or self.LOW
+
+    def _level(self, pin):
+        direction = self.directions.get(pin)
+        if direction is None:
+            raise RuntimeError("You must setup() the GPIO channel first")
+        if direction == self.OUT:
+            return self.outputs[pin]
+        level = self.inputs.get(pin)
+        if level is None:
+            return self.HIGH if self._pulls.get(pin) == self.PUD_UP else self.LOW
+        return level
+
+    def input(self, channel):
+        self._spend(self.access_time)
+        return self._level(channel)
+
+    def output(self, channel, value):
+        self._spend(self.access_time)
+        channels = self._channels(channel)
+        values = value if isinstance(value, (list, tuple)) else (value,) * len(channels)
+        if len(values) != len(channels):
+            raise RuntimeError("Number of channels != number of values")
+        for pin, level in zip(channels, values):
+            if self.directions.get(pin) != self.OUT:
+                raise RuntimeError("The GPIO channel has not been set up as an OUTPUT")
+            self.outputs[pin] = 1 if level else 0
+
+    def cleanup(self, channel=None):
+        pins = list(self.directions) if channel is None else self._channels(channel)
+        for pin in pins:
+            self.directions.pop(pin, None)
+            self.outputs.pop(pin, None)
+            self._events.pop(pin, None)
+            self._detected.discard(pin)
+
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        if self.directions.get(channel) != self.IN:
+            raise RuntimeError("You must setup() the GPIO channel as an input first")
+        if channel in self._events:
+            raise RuntimeError("Conflicting edge detection already enabled for this GPIO channel")
+        self._events[channel] = (edge, [callback] if callback else [])
+
+    def add_event_callback(self, channel, callback):
+        if channel not in self._events:
+            raise RuntimeError("Add event detection using add_event_detect first before adding a callback")
+        self._events[channel][1].append(callback)
+
+    def remove_event_detect(self, channel):
+        self._events.pop(channel, None)
+        self._detected.discard(channel)
+
+    def event_detected(self, channel):
+        self._spend(self.access_time)
+        if channel in self._detected:
+            self._detected.discard(channel)
+            return True
+        return False
+
+    # Simulation
+
+    def set_input(self, pin, level, detected=True):
+        """
+        Drives input :py:data:`pin` to :py:data:`level` from the outside,
+        calling the callbacks if it's an edge being detected, unless
+        :py:data:`detected` is False (an edge missed by the event
+        detection).
+        """
+        level = 1 if level else 0
+        previous = self.inputs.get(pin)
+        self.inputs[pin] = level
+        if previous is None:
+            previous = self.HIGH if self._pulls.get(pin) == self.PUD_UP else self.LOW
+        event = self._events.get(pin)
+        if event is None or level == previous or not detected:
+            return
+        edge, callbacks = event
+        if edge == self.BOTH or (edge == self.RISING) == bool(level):
+            self._detected.add(pin)
+            for callback in callbacks:
+                callback(pin)
+
+    def inject(self, edges, lost=()):
+        """
+        Applies the (pin, level) changes in :py:data:`edges` in order, as
+        :py:meth:`set_input`. The changes whose index is in :py:data:`lost`
+        aren't detected.
+        """
+        if not lost:
+            for pin, level in edges:
+                self.set_input(pin, level)
+            return
+        for i, (pin, level) in enumerate(edges):
+            self.set_input(pin, level, i not in lost)
+
+
+class Simulation(object):
+    """
+    Installs simulated versions of the hardware libraries in
+    :py:data:`modules` with :py:func:`~pywiring.override_hardware_module`,
+    until :py:meth:`close` is called; the interfaces created in between
+    use the simulated hardware. It can be used as a context manager.
+
+    :py:data:`i2c_frequency` (Hz) and :py:data:`i2c_overhead` (seconds)
+    are the timing model of the I2C buses (see :py:class:`SimI2CBus`);
+    :py:data:`parport_access_time` and :py:data:`gpio_access_time` are the
+    duration of each parallel port register access and RPi.GPIO call. By
+    default nothing takes time. If :py:data:`realtime` is False, the
+    modeled time is only added up, not spent.
+
+    Buses and ports are created on first use; attach I2C devices to them
+    before creating the interfaces::
+
+        with Simulation(i2c_frequency=FAST_MODE) as sim:
+            sim.bus(1).attach(0x20, SimPCF8574())
+            io = PCF8574IO(1, 0x20)
+    """
+
+    def __init__(self, i2c_frequency=None, i2c_overhead=0.0, parport_access_time=0.0, gpio_access_time=0.0,
+                 realtime=True, modules=MODULES):
+        self.i2c_frequency = i2c_frequency
+        self.i2c_overhead = i2c_overhead
+        self.parport_access_time = parport_access_time
+        self.realtime = realtime
+        self.buses = {}
+        self.ports = {}
+        self.gpio = SimGPIO(gpio_access_time, realtime)
+        self._previous = {}
+
+        smbus = types.ModuleType("smbus")
+        smbus.SMBus = type("SMBus", (_SMBus,), {"simulation": self})
+        smbus.i2c_msg = _I2CMsg
+        parallel = types.ModuleType("parallel")
+        parallel.Parallel = type("Parallel", (_Parallel,), {"simulation": self})
+        simulated = {"smbus": smbus, "smbus2": smbus, "parallel": parallel, "RPi.GPIO": self.gpio}
+
+        from . import _hardware_modules
+        for name in modules:
+            self._previous[name] = _hardware_modules.get(name)
+            override_hardware_module(name, simulated[name])
+
+    def bus(self, number):
+        """
+        Returns the simulated I2C bus :py:data:`number`.
+        """
+        bus = self.buses.get(number)
+        if bus is None:
+            bus = self.buses[number] = SimI2CBus(number, self.i2c_frequency, self.i2c_overhead, self.realtime)
+        return bus
+
+    def port(self, number):
+        """
+        Returns the simulated parallel port :py:data:`number`.
+        """
+        port = self.ports.get(number)
+        if port is None:
+            port = self.ports[number] = SimParallelPort(number, self.parport_access_time, self.realtime)
+        return port
+
+    def _simulated(self):
+        for number, bus in sorted(self.buses.items()):
+            yield "i2c-{0}".format(number), bus
+        for number, port in sorted(self.ports.items()):
+            yield "parport{0}".format(number), port
+        yield "gpio", self.gpio
+
+    def stats(self):
+        """
+        Returns the transactions received and the modeled busy time of
+        every simulated bus, keyed by "i2c-N", "parportN" and "gpio".
+        """
+        return {name: simulated.stats() for name, simulated in self._simulated()}
+
+    def reset_stats(self):
+        for _, simulated in self._simulated():
+            simulated.reset_stats()
+
+    def close(self):
+        """
+        Restores the hardware libraries that were in use before.
+        """
+        for name, module in self._previous.items():
+            override_hardware_module(name, module)
+        self._previous = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
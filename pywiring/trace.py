@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+
+"""
+Recording and replay of the hardware calls issued by the backends.
+
+A :py:class:`Recorder` stands in for the hardware libraries (smbus,
+smbus2, pyparallel, RPi.GPIO) through :py:func:`~pywiring.override_hardware_module`
+and logs every call made on them, with its arguments, result and timing,
+to an append-only binary trace file. A :py:class:`Replayer` later serves
+the recorded results from that file, so that the same code runs without
+the hardware attached: to benchmark it, or to compare the transactions
+issued by two releases with :py:func:`counts`.
+
+The file starts with :py:data:`MAGIC`, followed by one record per event:
+a 32-bit little-endian length and a :py:mod:`marshal` payload
+``(start, duration, handle, name, args, kwargs, kind, result)``. The
+handle is the name of the library for calls made on the library itself,
+or the number of an object returned by an earlier call (e.g. an
+``SMBus`` instance).
+"""
+
+__all__ = ("MAGIC", "ReplayError", "Recorder", "Replayer", "read_records", "counts")
+
+import builtins
+import importlib
+import marshal
+import mmap
+import struct
+import threading
+import time
+from collections import Counter, deque
+
+from . import override_hardware_module
+
+MAGIC = b"PWTRACE\x01"
+
+MODULES = ("smbus", "smbus2", "parallel", "RPi.GPIO")
+
+_LENGTH = struct.Struct("<I")
+
+# Record kinds
+CALL = 0
+"""
+A call that returned a plain value.
+"""
+NEW = 1
+"""
+A call that returned an object, recorded as a new handle.
+"""
+RAISE = 2
+"""
+A call that raised an exception, recorded as (class name, args).
+"""
+VALUE = 3
+"""
+A non-callable attribute (e.g. ``RPi.GPIO.BCM``), recorded when first read.
+"""
+
+
+class ReplayError(IOError):
+    """
+    Raised when the code being replayed issues a call that isn't in the
+    trace, or that doesn't match the recorded one.
+    """
+
+
+def _dumps(value):
+    try:
+        return marshal.dumps(value)
+    except ValueError:
+        return None
+
+
+def _plain(value):
+    # The value itself if marshal can store it, its repr otherwise
+    return repr(value) if _dumps(value) is None else value
+
+
+def _normalized(value):
+    # The value as it is read back from a trace
+    data = _dumps(value)
+    return repr(value) if data is None else marshal.loads(data)
+
+
+class _RecordingProxy(object):
+    # Wraps a library or an object returned by it, and records the calls
+    # made on it
+
+    def __init__(self, recorder, handle, target):
+        self._recorder = recorder
+        self._handle = handle
+        self._target = target
+        self._values = set()
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if not callable(value):
+            if name not in self._values:
+                self._values.add(name)
+                self._recorder._write(time.perf_counter(), 0.0, self._handle, name, (), None, VALUE, value)
+            return value
+
+        recorder = self._recorder
+        handle = self._handle
+
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = value(*args, **kwargs)
+            except Exception as e:
+                recorder._write(start, time.perf_counter() - start, handle, name, args, kwargs, RAISE,
+                                (type(e).__name__, tuple(_plain(arg) for arg in e.args)))
+                raise
+            duration = time.perf_counter() - start
+            if result is None or _dumps(result) is not None:
+                recorder._write(start, duration, handle, name, args, kwargs, CALL, result)
+                return result
+            proxy = recorder._new_handle(result)
+            recorder._write(start, duration, handle, name, args, kwargs, NEW, proxy._handle)
+            return proxy
+
+        call.__name__ = name
+        # Cache the wrapper, so that the lookup only happens once
+        setattr(self, name, call)
+        return call
+
+
+class Recorder(object):
+    """
+    Records the calls made on the hardware libraries listed in
+    :py:data:`modules` to the file :py:data:`path`, overwriting it.
+
+    The recording proxies are installed with
+    :py:func:`~pywiring.override_hardware_module` when the recorder is
+    created and removed by :py:meth:`close`, so only the interfaces
+    instantiated in between are recorded. The libraries are wrapped as
+    :py:func:`~pywiring.hardware_module` would return them, including any
+    module previously installed with
+    :py:func:`~pywiring.override_hardware_module`; a library that can't be
+    imported is only an error once a backend tries to use it.
+
+    The recorder can be used as a context manager.
+    """
+
+    def __init__(self, path, modules=MODULES):
+        self.path = path
+        self._file = open(path, "wb")
+        self._file.write(MAGIC)
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._handles = 0
+        self._previous = {}
+        self.records = 0
+
+        from . import _hardware_modules
+        for name in modules:
+            self._previous[name] = _hardware_modules.get(name)
+            override_hardware_module(name, _LazyModule(self, name))
+
+    def _new_handle(self, target):
+        with self._lock:
+            self._handles += 1
+            handle = self._handles
+        return _RecordingProxy(self, handle, target)
+
+    def _write(self, start, duration, handle, name, args, kwargs, kind, result):
+        start -= self._start
+        kwargs = kwargs or None
+        payload = _dumps((start, duration, handle, name, args, kwargs, kind, result))
+        if payload is None:
+            payload = marshal.dumps((start, duration, handle, name, _plain(args), _plain(kwargs),
+                                     kind, _plain(result)))
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(_LENGTH.pack(len(payload)))
+            self._file.write(payload)
+            self.records += 1
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        """
+        Removes the recording proxies and closes the trace file.
+        """
+        for name, module in self._previous.items():
+            override_hardware_module(name, module)
+        self._previous = {}
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _LazyModule(_RecordingProxy):
+    # Imports the library when it's first used
+
+    def __init__(self, recorder, name):
+        super(_LazyModule, self).__init__(recorder, name, None)
+        self._name = name
+
+    def __getattr__(self, name):
+        if self._target is None:
+            # Not through the override installed by the recorder
+            module = self._recorder._previous.get(self._name)
+            self._target = module if module is not None else importlib.import_module(self._name)
+        return super(_LazyModule, self).__getattr__(name)
+
+
+def read_records(buf):
+    """
+    Yields the (offset, length) of every record in the trace
+    :py:data:`buf`. A truncated last record, as left by a process that
+    didn't close its recorder, is ignored.
+    """
+    if buf[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a PyWiring trace")
+    offset = len(MAGIC)
+    size = len(buf)
+    while offset + _LENGTH.size <= size:
+        length, = _LENGTH.unpack_from(buf, offset)
+        offset += _LENGTH.size
+        if offset + length > size:
+            break
+        yield offset, length
+        offset += length
+
+
+def counts(path):
+    """
+    Returns a :py:class:`~collections.Counter` of the calls recorded in
+    the trace :py:data:`path`, keyed by (library, method) tuples; objects
+    are counted under the library they come from. Comparing the counts of
+    two traces shows how the transactions issued by two versions differ.
+    """
+    result = Counter()
+    with open(path, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        origins = {}
+        for offset, length in read_records(buf):
+            _, _, handle, name, _, _, kind, value = marshal.loads(buf[offset:offset + length])
+            origin = origins.get(handle, handle)
+            if kind == NEW:
+                origins[value] = origin
+            if kind != VALUE:
+                result[origin, name] += 1
+    finally:
+        buf.close()
+    return result
+
+
+class _ReplayProxy(object):
+    # Serves the recorded results of the calls made on a handle
+
+    def __init__(self, replayer, handle):
+        self._replayer = replayer
+        self._handle = handle
+
+    def __getattr__(self, name):
+        replayer = self._replayer
+        handle = self._handle
+        value = replayer._values.get((handle, name), replayer)
+        if value is not replayer:
+            return value
+        if (handle, name) not in replayer._calls:
+            raise AttributeError("{0!r} has no recorded attribute {1!r}".format(handle, name))
+
+        def call(*args, **kwargs):
+            return replayer._replay(handle, name, args, kwargs)
+
+        call.__name__ = name
+        setattr(self, name, call)
+        return call
+
+
+class Replayer(object):
+    """
+    Replays the trace :py:data:`path` recorded by a :py:class:`Recorder`:
+    installs stand-ins for the recorded libraries with
+    :py:func:`~pywiring.override_hardware_module`, which return the
+    recorded results, until :py:meth:`close` is called.
+
+    The file is memory-mapped and indexed when the replayer is created;
+    the records are only decoded as they are replayed. The calls made on
+    each object are matched, in order, with the calls recorded on the
+    corresponding object, method by method, so that the interleaving of
+    calls on different objects (e.g. from different threads) doesn't
+    matter. With :py:data:`strict`, the arguments must also match the
+    recorded ones. A call that can't be matched raises
+    :py:class:`ReplayError`, and a call that raised an exception when it
+    was recorded raises it again.
+
+    :py:data:`pace` scales the timing of the recording: 0 (the default)
+    replays as fast as possible; otherwise every call returns when it
+    ended in the recording, counted from when the replayer was created and
+    scaled by :py:data:`pace`, so that the calls last as long and are as
+    far apart as they were (at 1), or half as much (at 0.5). Calls made
+    later than that don't wait.
+
+    The replayer can be used as a context manager.
+    """
+
+    def __init__(self, path, pace=0, strict=True):
+        self.path = path
+        self.pace = pace
+        self.strict = strict
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        with open(path, "rb") as f:
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # (handle, name) -> deque of (offset, length)
+        self._calls = {}
+        self._values = {}
+        modules = set()
+        for offset, length in read_records(self._buf):
+            record = marshal.loads(self._buf[offset:offset + length])
+            handle, name, kind = record[2], record[3], record[6]
+            if isinstance(handle, str):
+                modules.add(handle)
+            if kind == VALUE:
+                self._values[handle, name] = record[7]
+            else:
+                self._calls.setdefault((handle, name), deque()).append((offset, length))
+        self.calls = sum(len(calls) for calls in self._calls.values())
+
+        from . import _hardware_modules
+        self._previous = {}
+        for name in modules:
+            self._previous[name] = _hardware_modules.get(name)
+            override_hardware_module(name, _ReplayProxy(self, name))
+
+    @property
+    def remaining(self):
+        """
+        Number of recorded calls not replayed yet.
+        """
+        with self._lock:
+            return sum(len(calls) for calls in self._calls.values())
+
+    def _replay(self, handle, name, args, kwargs):
+        with self._lock:
+            try:
+                offset, length = self._calls[handle, name].popleft()
+            except IndexError:
+                raise ReplayError("No more recorded calls to {0}.{1}".format(handle, name))
+        start, duration, _, _, recorded_args, recorded_kwargs, kind, result = \
+            marshal.loads(self._buf[offset:offset + length])
+        if self.strict and (recorded_args != args or recorded_kwargs != (kwargs or None)):
+            # The arguments can differ only by what marshal does to them
+            if (recorded_args != _normalized(args) or
+                    recorded_kwargs != _normalized(kwargs or None)):
+                raise ReplayError("{0}.{1} called with {2!r} {3!r}, recorded with {4!r} {5!r}".format(
+                    handle, name, args, kwargs or None, recorded_args, recorded_kwargs))
+        if self.pace:
+            delay = self._start + (start + duration) * self.pace - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        if kind == NEW:
+            return _ReplayProxy(self, result)
+        if kind == RAISE:
+            exc_name, exc_args = result
+            exc_class = getattr(builtins, exc_name, None)
+            if not (isinstance(exc_class, type) and issubclass(exc_class, Exception)):
+                exc_class = ReplayError
+            raise exc_class(*exc_args)
+        return result
+
+    def close(self):
+        """
+        Removes the stand-ins and unmaps the trace.
+        """
+        for name, module in self._previous.items():
+            override_hardware_module(name, module)
+        self._previous = {}
+        self._buf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the ADC backends against register models of the devices, on the
+simulated I2C bus of pywiring.sim.
+"""
+
+import pytest
+
+from pywiring.adc import ADS1115IO, ADS7830IO
+from pywiring.sim import Simulation, SimADS1115, SimADS7830
+
+# Input of each ADS7830 channel
+INPUTS = list(range(10, 90, 10))
+
+
+@pytest.fixture
+def sim():
+    with Simulation() as sim:
+        yield sim
+
+
+@pytest.fixture
+def ads1115(sim):
+    device = sim.bus(1).attach(0x48, SimADS1115())
+    adc = ADS1115IO(1)
+    yield adc, device
+    adc.close()
+
+
+@pytest.fixture
+def ads7830(sim):
+    device = sim.bus(1).attach(0x4B, SimADS7830())
+    device.inputs = list(INPUTS)
+    adc = ADS7830IO(1, 0x4B)
+    yield adc, device
+    adc.close()
+
+
+# (full scale, PGA bits), (data rate, DR bits), from the ADS1115 datasheet
+FULL_SCALES = [(6.144, 0b000), (4.096, 0b001), (2.048, 0b010), (1.024, 0b011), (0.512, 0b100), (0.256, 0b101)]
+DATA_RATES = [(8, 0b000), (16, 0b001), (32, 0b010), (64, 0b011), (128, 0b100), (250, 0b101), (475, 0b110),
+              (860, 0b111)]
+
+
+@pytest.mark.parametrize("full_scale,pga", FULL_SCALES)
+@pytest.mark.parametrize("data_rate,dr", DATA_RATES)
+def test_ads1115_config_word(sim, full_scale, pga, data_rate, dr):
+    device = sim.bus(1).attach(0x48, SimADS1115())
+    adc = ADS1115IO(1, full_scale=full_scale, data_rate=data_rate)
+    try:
+        # Single-shot mode, comparator disabled
+        assert device.configs == [pga << 9 | 0x0100 | dr << 5 | 0x0003]
+    finally:
+        adc.close()
+
+
+@pytest.mark.parametrize("channel,word", [(0, 0xC3E3), (1, 0xD3E3), (2, 0xE3E3), (3, 0xF3E3)])
+def test_ads1115_conversion_config(ads1115, channel, word):
+    adc, device = ads1115
+    adc.read_raw(channel)
+    # OS set, MUX = AINx against GND, 4.096 V, single-shot, 860 SPS
+    assert device.configs[-1] == word
+
+
+def test_ads1115_invalid_settings(sim):
+    sim.bus(1).attach(0x48, SimADS1115())
+    with pytest.raises(ValueError):
+        ADS1115IO(1, full_scale=5.0)
+    with pytest.raises(ValueError):
+        ADS1115IO(1, data_rate=100)
+
+
+def test_ads1115_sign(ads1115):
+    adc, device = ads1115
+    device.inputs = [0x7FFF, -1, -32768, 0x4000]
+    assert [adc.read_raw(channel) for channel in range(4)] == [32767, -1, -32768, 16384]
+    assert adc.read_voltage(3) == pytest.approx(2.048)
+    assert adc.read_voltage(2) == pytest.approx(-4.096)
+    # Negative results are read as 0
+    assert adc.analog_read(0) == 1023
+    assert adc.analog_read(1) == 0
+    assert adc.analog_read(2) == 0
+    assert adc.digital_read(3) is False and adc.digital_read(0) is True
+
+
+def test_ads1115_inputs_only(ads1115):
+    adc, _ = ads1115
+    with pytest.raises(IOError):
+        adc.digital_write(0, True)
+    with pytest.raises(ValueError):
+        adc.read_raw(4)
+
+
+def test_ads1115_continuous_single_channel(ads1115):
+    adc, device = ads1115
+    device.inputs[2] = -100
+    reader = adc.start_continuous([2], size=64)
+    try:
+        # Continuous mode on AIN2: MODE bit clear
+        assert device.configs[-1] == 0x62E3
+        assert reader.wait(5, timeout=2) >= 5
+        with pytest.raises(RuntimeError):
+            adc.read_raw(0)
+    finally:
+        adc.stop_continuous()
+    # Back to single-shot mode
+    assert device.configs[-1] == 0x03E3
+    timestamps, samples = reader.read()
+    assert len(timestamps) >= 5 and samples.shape[1] == 1
+    assert (samples == -100).all()
+    assert not reader.running
+    adc.read_raw(0)
+
+
+def test_ads1115_continuous_sequence(ads1115):
+    adc, device = ads1115
+    device.inputs = [1, 2, 3, 4]
+    reader = adc.start_continuous([3, 0])
+    try:
+        assert reader.wait(2, timeout=2) >= 2
+    finally:
+        adc.stop_continuous()
+    _, samples = reader.read()
+    assert (samples[:, 0] == 4).all() and (samples[:, 1] == 1).all()
+    # One single-shot conversion per sample
+    assert {word >> 12 for word in device.configs[1:-1]} == {0xF, 0xC}
+
+
+def test_ads7830_command_bytes(ads7830):
+    adc, device = ads7830
+    for channel in range(8):
+        adc.read_raw(channel)
+    # SD = 1, C2 C1 C0 = channel bits 0, 2, 1, PD1 PD0 = 01 (external reference)
+    assert device.commands == [0x84, 0xC4, 0x94, 0xD4, 0xA4, 0xE4, 0xB4, 0xF4]
+
+
+def test_ads7830_internal_reference(sim):
+    device = sim.bus(1).attach(0x48, SimADS7830())
+    device.inputs = list(INPUTS)
+    adc = ADS7830IO(1, internal_reference=True)
+    try:
+        assert adc.read_raw(0) == 10
+        assert adc.read_raw(5) == 60
+        assert device.commands == [0x8C, 0xEC]
+    finally:
+        adc.close()
+
+
+def test_ads7830_scaling(ads7830):
+    adc, device = ads7830
+    device.inputs[1] = 255
+    assert adc.analog_read(1) == 1023
+    assert adc.analog_read(0) == 10 * 1023 // 255
+
+
+def test_ads7830_continuous(ads7830):
+    adc, device = ads7830
+    reader = adc.start_continuous([6], size=256)
+    try:
+        assert reader.wait(64, timeout=2) >= 64
+    finally:
+        adc.stop_continuous()
+    _, samples = reader.read()
+    assert samples.dtype.name == "uint8"
+    assert (samples == 70).all()
+    # Block reads: one command byte per up to 32 samples
+    assert set(device.commands) == {0xB4}
+    assert len(device.commands) * 32 >= reader.count
+
+    reader = adc.start_continuous([0, 7])
+    try:
+        assert reader.wait(4, timeout=2) >= 4
+    finally:
+        adc.stop_continuous()
+    _, samples = reader.read()
+    assert (samples[:, 0] == 10).all() and (samples[:, 1] == 80).all()
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the asyncio front-end: one worker thread per bus, operations run
+in the order they were issued, and exceptions raised by the awaiting
+coroutine.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from pywiring import IOBase, aio
+from pywiring.aio import AsyncIO
+
+
+class LoggingIO(IOBase):
+    """
+    Logs the (name, operation, thread) of every call. Operations on pin
+    0 are slow.
+    """
+
+    number_of_pins = 8
+
+    def __init__(self, bus, name, log):
+        self.bus = bus
+        self.name = name
+        self.log = log
+        self.level = 0
+        self.callbacks = {}
+        self.closed = False
+
+    @property
+    def bus_id(self):
+        return ("test", self.bus)
+
+    def _record(self, operation):
+        self.log.append((self.name, operation, threading.current_thread()))
+
+    def digital_write(self, pin, high):
+        if pin == 0:
+            time.sleep(0.01)
+        self._record(("write", pin, high))
+
+    def read_port(self):
+        self._record("read_port")
+        return self.level
+
+    def analog_read(self, pin):
+        raise ValueError("No ADC")
+
+    def enable_event_detect(self, pin, edge, callback=None, bounce=0):
+        self.callbacks[pin] = callback
+
+    def close(self):
+        self.closed = True
+
+
+def test_operations_run_in_order_on_one_thread():
+    log = []
+
+    async def main():
+        first, second = AsyncIO(LoggingIO(1, "first", log)), AsyncIO(LoggingIO(1, "second", log))
+        # The slow write is issued first: the others wait for it
+        await asyncio.gather(*[io.digital_write(pin, True) for pin in range(4) for io in (first, second)])
+        await first.close()
+        await second.close()
+
+    asyncio.run(main())
+    assert [(name, operation) for name, operation, _ in log] == [
+        (name, ("write", pin, True)) for pin in range(4) for name in ("first", "second")]
+    threads = {thread for _, _, thread in log}
+    assert len(threads) == 1
+    thread = threads.pop()
+    assert thread is not threading.current_thread()
+    assert thread.name.startswith("pywiring-")
+
+
+def test_buses_have_their_own_thread():
+    log = []
+
+    async def main():
+        ios = [AsyncIO(LoggingIO(bus, bus, log)) for bus in (1, 2)]
+        assert ios[0]._executor is not ios[1]._executor
+        await asyncio.gather(*[io.read_port() for io in ios])
+        for io in ios:
+            await io.close()
+
+    asyncio.run(main())
+    assert len({thread for _, _, thread in log}) == 2
+
+
+def test_exceptions_raised_in_the_caller():
+    log = []
+
+    async def main():
+        io = AsyncIO(LoggingIO(1, "io", log))
+        try:
+            with pytest.raises(ValueError, match="No ADC"):
+                await io.analog_read(0)
+            # The worker thread is still usable
+            io.io.level = 0x42
+            assert await io.read_port() == 0x42
+            with pytest.raises(TypeError):
+                await io.run(len)
+        finally:
+            await io.close()
+
+    asyncio.run(main())
+    assert [operation for _, operation, _ in log] == ["read_port"]
+
+
+def test_executor_released_on_close():
+    log = []
+
+    async def main():
+        first, second = AsyncIO(LoggingIO(3, "first", log)), AsyncIO(LoggingIO(3, "second", log))
+        assert first._executor is second._executor
+        await first.close()
+        assert first.io.closed
+        assert ("test", 3) in aio._executors
+        # Closing twice does nothing
+        await first.close()
+        await second.close()
+        assert ("test", 3) not in aio._executors
+
+    asyncio.run(main())
+
+
+def test_attributes_and_run():
+    log = []
+
+    async def main():
+        async with AsyncIO(LoggingIO(1, "io", log)) as io:
+            assert io.number_of_pins == 8
+            result = await io.run(lambda: (io.io.read_port(), threading.current_thread()))
+            assert result[1] is log[-1][2]
+
+    asyncio.run(main())
+
+
+def test_coroutine_callbacks_scheduled_on_the_loop():
+    log = []
+    calls = []
+
+    async def main():
+        async with AsyncIO(LoggingIO(1, "io", log)) as io:
+            received = asyncio.Event()
+            loop_thread = threading.current_thread()
+
+            async def callback(pin):
+                calls.append((pin, threading.current_thread() is loop_thread))
+                received.set()
+
+            await io.enable_event_detect(5, "RISING", callback)
+            wrapper = io.io.callbacks[5]
+            assert wrapper is not callback
+            # Called from another thread, like the event poller
+            thread = threading.Thread(target=wrapper, args=(5,))
+            thread.start()
+            await asyncio.wait_for(received.wait(), 5)
+            thread.join()
+
+            # Plain functions are passed as they are
+            await io.enable_event_detect(6, "RISING", calls.append)
+            assert io.io.callbacks[6] == calls.append
+
+    asyncio.run(main())
+    assert calls == [(5, True)]
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+from pywiring import IOBase
+
+
+class RecordingIO(IOBase):
+    number_of_pins = 8
+
+    def __init__(self):
+        self.level = 0
+        self.writes = []
+
+    def read_port(self):
+        return self._apply_pending(self.level) if self._batch_depth else self.level
+
+    def modify_port(self, set_mask, clear_mask):
+        if self._queue_write(set_mask, clear_mask):
+            return
+        self.writes.append((set_mask, clear_mask))
+        self.level = (self.level & ~clear_mask) | set_mask
+
+
+def test_batch_merges_writes():
+    io = RecordingIO()
+    with io.batch():
+        io.modify_port(0b01, 0)
+        with io.batch():
+            io.modify_port(0b10, 0b01)
+        assert io.read_port() == 0b10
+        assert io.writes == []
+    assert io.writes == [(0b10, 0b01)]
+
+
+def test_batch_discarded_on_exception():
+    io = RecordingIO()
+    try:
+        with io.batch():
+            io.modify_port(0b01, 0)
+            raise KeyError
+    except KeyError:
+        pass
+    assert io.writes == [] and io.level == 0
+
+
+def test_other_threads_write_through():
+    io = RecordingIO()
+    with io.batch():
+        io.modify_port(0b01, 0)
+        thread = threading.Thread(target=io.modify_port, args=(0b100, 0))
+        thread.start()
+        thread.join()
+        # Written right away, not queued in this thread's batch
+        assert io.writes == [(0b100, 0)]
+    assert io.writes == [(0b100, 0), (0b01, 0)]
+
+
+def test_concurrent_batches():
+    io = RecordingIO()
+    inside = threading.Barrier(2)
+
+    def run(pin):
+        with io.batch():
+            io.modify_port(1 << pin, 0)
+            inside.wait()
+
+    threads = [threading.Thread(target=run, args=(pin,)) for pin in (0, 1)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(io.writes) == [(0b01, 0), (0b10, 0)]
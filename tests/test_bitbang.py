@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the bit-banged protocols: the port states of every SPI mode and
+bit order, and the latching of the shift registers, checked by models of
+the devices on a simulated PCF8574 of pywiring.sim, which see every state
+written to the port.
+"""
+
+import pytest
+
+from pywiring.bitbang import LSBFIRST, MSBFIRST, SPI, ShiftIn, ShiftOut
+from pywiring.i2c import PCF8574IO
+from pywiring.sim import Simulation, SimPCF8574
+
+SCK, MOSI, MISO, CS = 0, 1, 2, 3
+
+
+class Wires(SimPCF8574):
+    """
+    Calls :py:meth:`change` for every port state written, not only the
+    last one. The pins in :py:attr:`driven` read as :py:attr:`output`.
+    """
+
+    driven = 0
+
+    def __init__(self):
+        super(Wires, self).__init__()
+        self.output = 0
+
+    def write(self, data):
+        for state in data:
+            previous, self.latch = self.latch, state
+            self.change(previous, state)
+
+    def change(self, previous, state):
+        pass
+
+    def read(self, count):
+        return [self.latch & ~self.driven | self.output & self.driven] * count
+
+
+def rising(previous, state, pin):
+    return not previous >> pin & 1 and state >> pin & 1
+
+
+def falling(previous, state, pin):
+    return previous >> pin & 1 and not state >> pin & 1
+
+
+class SPISlave(Wires):
+    """
+    SPI device in :py:data:`mode`, recording the bytes received in
+    :py:attr:`received`, one bytearray per selection, and answering with the
+    bytes of :py:attr:`response`.
+    """
+
+    driven = 1 << MISO
+
+    def __init__(self, mode, bit_order, response=b""):
+        super(SPISlave, self).__init__()
+        self.idle = mode >> 1
+        self.leading_sample = not mode & 1
+        self.bit_order = bit_order
+        self.response = bytearray(response)
+        self.received = []
+        self.bits = []
+        self.outgoing = []
+
+    def _shift_out(self):
+        bit = self.outgoing.pop(0) if self.outgoing else 0
+        self.output = bit << MISO
+
+    def change(self, previous, state):
+        selected = not state >> CS & 1
+        if falling(previous, state, CS):
+            assert state >> SCK & 1 == self.idle, "Selected with the clock active"
+            self.bits = []
+            self.outgoing = []
+            for byte in self.response:
+                bits = [byte >> (7 - i) & 1 for i in range(8)]
+                self.outgoing += bits if self.bit_order == MSBFIRST else bits[::-1]
+            self.received.append(bytearray())
+            if self.leading_sample:
+                self._shift_out()
+        elif rising(previous, state, CS):
+            assert state >> SCK & 1 == self.idle, "Deselected with the clock active"
+            assert not self.bits, "Deselected in the middle of a byte"
+        if not selected or not (previous ^ state) >> SCK & 1:
+            return
+        leading = (state >> SCK & 1) != self.idle
+        if leading == self.leading_sample:
+            self.bits.append(state >> MOSI & 1)
+            if len(self.bits) == 8:
+                bits = self.bits if self.bit_order == MSBFIRST else self.bits[::-1]
+                self.received[-1].append(sum(bit << (7 - i) for i, bit in enumerate(bits)))
+                self.bits = []
+        else:
+            self._shift_out()
+
+
+class ShiftRegisters(Wires):
+    """
+    Chain of 74HC595 on SER (MOSI), SRCLK (SCK) and RCLK (CS): the
+    outputs of the register closest to the interface are the low byte of
+    :py:attr:`outputs`. Every new value of the outputs is recorded in
+    :py:attr:`history`.
+    """
+
+    def __init__(self, count):
+        super(ShiftRegisters, self).__init__()
+        self.count = count
+        self.shift = 0
+        self.outputs = 0
+        self.history = []
+
+    def change(self, previous, state):
+        if rising(previous, state, SCK):
+            self.shift = (self.shift << 1 | state >> MOSI & 1) & ((1 << 8 * self.count) - 1)
+        if rising(previous, state, CS):
+            self.outputs = self.shift
+            self.history.append(self.outputs)
+
+
+class ParallelIn(Wires):
+    """
+    Chain of 74HC165 with /PL on CS, CP on SCK and Q7 on MISO: the inputs
+    of the register closest to the interface are the high byte of
+    :py:attr:`parallel`, and are shifted out first.
+    """
+
+    driven = 1 << MISO
+
+    def __init__(self, inputs, count):
+        super(ParallelIn, self).__init__()
+        self.parallel = inputs
+        self.count = count
+        self.shift = 0
+
+    def _update(self):
+        self.output = (self.shift >> (8 * self.count - 1) & 1) << MISO
+
+    def change(self, previous, state):
+        if not state >> CS & 1:
+            self.shift = self.parallel
+        elif rising(previous, state, SCK):
+            self.shift = self.shift << 1 & ((1 << 8 * self.count) - 1)
+        self._update()
+
+
+@pytest.fixture
+def attach():
+    """
+    Attaches a device to the simulated bus and returns the interface to it.
+    """
+    ios = []
+    with Simulation() as sim:
+
+        def attach(device):
+            sim.bus(1).attach(0x20, device)
+            ios.append(PCF8574IO(1, 0x20))
+            return ios[-1]
+
+        try:
+            yield attach
+        finally:
+            for io in ios:
+                io.close()
+
+
+@pytest.mark.parametrize("mode", range(4))
+@pytest.mark.parametrize("bit_order", [MSBFIRST, LSBFIRST])
+def test_spi_write(attach, mode, bit_order):
+    device = SPISlave(mode, bit_order)
+    io = attach(device)
+    spi = SPI(io, SCK, MOSI, cs=CS, mode=mode, bit_order=bit_order)
+    # Deselected, with the clock idle
+    assert device.latch & spi.mask == (mode >> 1) << SCK | 1 << CS
+    spi.write(b"\x01\x80\xA5")
+    spi.write(bytearray([0x3C]))
+    assert device.received == [bytearray(b"\x01\x80\xA5"), bytearray(b"\x3C")]
+
+
+@pytest.mark.parametrize("mode", range(4))
+@pytest.mark.parametrize("bit_order", [MSBFIRST, LSBFIRST])
+def test_spi_transfer(attach, mode, bit_order):
+    device = SPISlave(mode, bit_order, response=b"\xC3\x81\x7E")
+    io = attach(device)
+    spi = SPI(io, SCK, MOSI, MISO, CS, mode=mode, bit_order=bit_order)
+    assert spi.transfer(b"\x12\x34\x56") == bytearray(b"\xC3\x81\x7E")
+    assert device.received == [bytearray(b"\x12\x34\x56")]
+
+
+def test_spi_states(attach):
+    io = attach(Wires())
+    mode0 = SPI(io, SCK, MOSI, cs=CS)
+    mode3 = SPI(io, SCK, MOSI, cs=CS, mode=3, bit_order=LSBFIRST)
+    sck, mosi, cs = 1 << SCK, 1 << MOSI, 1 << CS
+    # Data set with the clock idle, then the leading edge
+    assert mode0.compile(b"\x81") == ([0, mosi, mosi | sck] + [0, sck] * 6 + [mosi, mosi | sck] + [mosi, cs])
+    # Clock idle high, data set on the leading edge, LSB first
+    assert mode3.compile(b"\x02") == ([sck, 0, sck, mosi, mosi | sck] + [0, sck] * 6 + [sck | cs])
+
+
+def test_spi_cache(attach):
+    spi = SPI(attach(Wires()), SCK, MOSI, cache_size=2)
+    first = spi.compile(b"\x01")
+    assert spi.compile(bytearray(b"\x01")) is first
+    spi.compile(b"\x02")
+    spi.compile(b"\x03")
+    assert spi.compile(b"\x01") is not first
+    assert len(spi._cache) == 2
+
+
+def test_spi_errors(attach):
+    io = attach(Wires())
+    with pytest.raises(ValueError):
+        SPI(io, SCK, MOSI, mode=4)
+    with pytest.raises(RuntimeError):
+        SPI(io, SCK, MOSI).transfer(b"\x00")
+
+
+@pytest.mark.parametrize("bit_order,outputs", [(MSBFIRST, 0x1234), (LSBFIRST, 0x482C)])
+def test_shift_out_latch(attach, bit_order, outputs):
+    device = ShiftRegisters(2)
+    io = attach(device)
+    shift = ShiftOut(io, MOSI, SCK, CS, bit_order=bit_order)
+    shift.write(b"\x12\x34")
+    # The outputs change once, when the whole chain is loaded, and the
+    # first byte ends up in the last register
+    assert device.history == [outputs]
+    shift.write(b"\xFF\x00")
+    assert device.history[1:] == [0xFF00]
+
+
+@pytest.mark.parametrize("bit_order,expected", [(MSBFIRST, b"\x12\x34"), (LSBFIRST, b"\x48\x2C")])
+def test_shift_in(attach, bit_order, expected):
+    io = attach(ParallelIn(0x1234, 2))
+    shift = ShiftIn(io, MISO, SCK, CS, bit_order=bit_order)
+    # The register closest to the interface comes first
+    assert shift.read(2) == bytearray(expected)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+import numpy
+import pytest
+
+from pywiring import IOBase
+from pywiring.capture import capture, stream
+
+
+class CountingIO(IOBase):
+    """
+    Port whose state goes through :py:attr:`values`, one per read.
+    """
+
+    def __init__(self, number_of_pins, values):
+        self.number_of_pins = number_of_pins
+        self.values = values
+        self.reads = 0
+
+    def read_port(self):
+        value = self.values[self.reads % len(self.values)]
+        self.reads += 1
+        return value
+
+
+@pytest.mark.parametrize("pins,dtype", [(8, numpy.uint8), (16, numpy.uint16), (32, numpy.uint32),
+                                        (33, numpy.uint64), (64, numpy.uint64), (-48, numpy.uint64),
+                                        (0, numpy.uint64), (96, object)])
+def test_sample_type(pins, dtype):
+    top = 1 << (abs(pins) or 64) - 1
+    io = CountingIO(pins, [top | 1, 0])
+    result = capture(io, rate=10000, duration=0.002)
+    assert result.samples.dtype == dtype
+    assert len(result.samples) == 20
+    # The highest pin is kept by the default mask
+    assert int(result.samples[0]) == top | 1
+    assert int(result.samples[1]) == 0
+
+
+def test_pins_mask():
+    io = CountingIO(64, [(1 << 63) | (1 << 40) | 0b111])
+    result = capture(io, pins=[0, 2, 63], rate=10000, duration=0.001)
+    assert set(int(sample) for sample in result.samples) == {(1 << 63) | 0b101}
+
+
+def test_stream_wide_port():
+    io = CountingIO(64, [1 << 63])
+    with stream(io, rate=20000, chunk_size=16, chunks=4) as chunks:
+        timestamps, samples = next(chunks)
+    assert samples.dtype == numpy.uint64
+    assert (samples == 1 << 63).all()
+    assert (numpy.diff(timestamps) > 0).all()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of CompositeIO: pin numbers offset onto each interface, and port and
+bulk operations split into one operation per interface, on the simulated
+I2C buses of pywiring.sim.
+"""
+
+import threading
+
+import pytest
+
+from pywiring import IOBase
+from pywiring.composite import CompositeIO
+from pywiring.i2c import PCF8574IO
+from pywiring.sim import Simulation, SimPCF8574
+
+
+class Inputs(SimPCF8574):
+    """
+    Reads return :py:attr:`inputs`, whatever was written to the port. The
+    threads the port is written from are recorded in :py:attr:`threads`.
+    """
+
+    def __init__(self):
+        super(Inputs, self).__init__()
+        self.threads = []
+
+    def write(self, data):
+        self.threads.append(threading.current_thread())
+        super(Inputs, self).write(data)
+
+    def read(self, count):
+        return [self.inputs] * count
+
+
+class Setup(object):
+    """
+    Three PCF8574: pins 0-7 and 8-15 on bus 1, pins 16-23 on bus 2.
+    """
+
+    def __init__(self, sim):
+        self.buses = sim.bus(1), sim.bus(2)
+        self.devices = [self.buses[0].attach(0x20, Inputs()), self.buses[0].attach(0x21, Inputs()),
+                        self.buses[1].attach(0x20, Inputs())]
+        self.io = CompositeIO([PCF8574IO(1, 0x20), PCF8574IO(1, 0x21), PCF8574IO(2, 0x20)])
+
+    def reset_stats(self):
+        for bus in self.buses:
+            bus.reset_stats()
+
+    @property
+    def transactions(self):
+        return tuple(bus.transactions for bus in self.buses)
+
+    @property
+    def latches(self):
+        return [device.latch for device in self.devices]
+
+
+@pytest.fixture
+def setup():
+    with Simulation() as sim:
+        setup = Setup(sim)
+        setup.io.port_mode(False)
+        try:
+            yield setup
+        finally:
+            setup.io.close()
+
+
+def test_pins(setup):
+    io = setup.io
+    assert io.number_of_pins == 24
+    assert [offset for _, offset, _ in io.devices] == [0, 8, 16]
+    assert len(io.get_pin_modes()) == 24
+    with pytest.raises(ValueError):
+        io.pin_mode(24, True)
+    with pytest.raises(ValueError):
+        io.analog_read(-1)
+    assert io.digital_read(24) is None
+
+
+def test_pin_offsets(setup):
+    io = setup.io
+    io.write_port(0)
+    setup.reset_stats()
+    io.digital_write(9, True)
+    assert setup.latches == [0x00, 0x02, 0x00]
+    assert setup.transactions == (1, 0)
+    io.digital_write(23, True)
+    io.digital_write(0, True)
+    assert setup.latches == [0x01, 0x02, 0x80]
+    assert setup.transactions == (2, 1)
+
+
+def test_write_port_one_write_per_device(setup):
+    io = setup.io
+    setup.reset_stats()
+    io.write_port(0xA5C3F0)
+    assert setup.latches == [0xF0, 0xC3, 0xA5]
+    assert setup.transactions == (2, 1)
+    # Pins past the last interface are ignored
+    io.write_port(0x1FF0000)
+    assert setup.latches == [0x00, 0x00, 0xFF]
+
+
+def test_bulk_writes_only_the_devices_involved(setup):
+    io = setup.io
+    io.write_port(0)
+    setup.reset_stats()
+    io.modify_port(1 << 17, 1 << 20)
+    assert setup.transactions == (0, 1)
+    io.digital_write_bulk({1: True, 2: True, 19: True})
+    assert setup.transactions == (1, 2)
+    assert setup.latches == [0x06, 0x00, 0x0A]
+    io.digital_write_bulk({})
+    assert setup.transactions == (1, 2)
+
+
+def test_bulk_reads(setup):
+    io = setup.io
+    io.port_mode(True)
+    for device, inputs in zip(setup.devices, (0x81, 0x42, 0x24)):
+        device.inputs = inputs
+    setup.reset_stats()
+    assert io.read_port() == 0x244281
+    assert setup.transactions == (2, 1)
+    # Only the devices the pins are on are read
+    assert io.digital_read_bulk(0, 1, 18, 21) == {0: True, 1: False, 18: True, 21: True}
+    assert setup.transactions == (3, 2)
+    assert io.digital_read(14) is True
+    assert io.digital_read(15) is False
+
+
+def test_buses_driven_from_their_own_thread(setup):
+    io = setup.io
+    for device in setup.devices:
+        del device.threads[:]
+    io.write_port(0xFFFFFF)
+    io.write_port(0)
+    caller = threading.current_thread()
+    first, second, third = [device.threads for device in setup.devices]
+    assert first == second == [caller] * 2
+    assert len(set(third)) == 1
+    assert third[0] is not caller
+    # The first bus involved is driven by the calling thread
+    io.digital_write(20, True)
+    assert third[-1] is caller
+
+
+def test_play_split_per_device(setup):
+    io = setup.io
+    io.write_port(0x00FF00)
+    io.play([0x010001, 0x020002, 0x040003], mask=0xFF00FF)
+    # The pins out of the mask keep their levels
+    assert setup.latches == [0x03, 0xFF, 0x04]
+
+
+def test_unknown_number_of_pins():
+    with pytest.raises(ValueError, match="number of pins"):
+        CompositeIO([IOBase()])
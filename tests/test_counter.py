@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from pywiring.counter import EdgeRing, QuadratureCounter, PulseCounter
+from pywiring.raspi import RasPiIO
+from pywiring.sim import Simulation
+
+A, B, PULSE = 17, 27, 22
+
+# Gray code of a quadrature encoder moving forwards, as A << 1 | B
+FORWARD = (0b00, 0b10, 0b11, 0b01)
+
+
+def quadrature_edges(steps, start=0):
+    """
+    Returns the (pin, level) changes of an encoder moving by steps counts
+    (backwards if negative) from position start.
+    """
+    direction = 1 if steps >= 0 else -1
+    edges = []
+    position = start
+    for _ in range(abs(steps)):
+        state = FORWARD[position % 4]
+        position += direction
+        new = FORWARD[position % 4]
+        if (new ^ state) & 0b10:
+            edges.append((A, new >> 1))
+        else:
+            edges.append((B, new & 1))
+    return edges
+
+
+@pytest.fixture
+def sim():
+    with Simulation() as sim:
+        yield sim
+
+
+@pytest.fixture
+def io(sim):
+    io = RasPiIO()
+    yield io
+    io.close()
+
+
+def expected_step(previous, new):
+    index = FORWARD.index(previous)
+    if new == FORWARD[(index + 1) % 4]:
+        return 1
+    if new == FORWARD[(index - 1) % 4]:
+        return -1
+    return 0
+
+
+@pytest.mark.parametrize("previous", range(4))
+@pytest.mark.parametrize("new", range(4))
+def test_transition_table(previous, new):
+    assert QuadratureCounter._TRANSITIONS[previous << 2 | new] == expected_step(previous, new)
+
+
+@pytest.mark.parametrize("codes,start,counts,missed", [
+    ([], 0b00, 0, 0),
+    ([0b10, 0b11, 0b01, 0b00], 0b00, 4, 0),
+    ([0b01, 0b11, 0b10, 0b00], 0b00, -4, 0),
+    ([0b10, 0b11, 0b10, 0b00], 0b00, 0, 0),
+    ([0b00, 0b10], 0b01, 2, 0),
+    # A state skipped: two counts in the direction of the last valid step
+    ([0b10, 0b01], 0b00, 3, 1),
+    ([0b01, 0b10], 0b00, -3, 1),
+    # Same level twice (a bounce read after it settled): no count
+    ([0b10, 0b10, 0b11], 0b00, 2, 0),
+])
+def test_decode(io, codes, start, counts, missed):
+    import numpy
+    with QuadratureCounter(io, A, B) as counter:
+        counter._state = start
+        timestamps = numpy.zeros(len(codes))
+        assert counter._decode(timestamps, numpy.array(codes, dtype=numpy.uint8), 0) == (counts, missed)
+
+
+def test_skipped_state_keeps_direction_across_batches(io):
+    import numpy
+    with QuadratureCounter(io, A, B) as counter:
+        counter._state = 0b00
+        counter._decode(numpy.zeros(2), numpy.array([0b01, 0b11], dtype=numpy.uint8), 0)
+        assert counter._decode(numpy.zeros(1), numpy.array([0b00], dtype=numpy.uint8), 0) == (-2, 1)
+
+
+@pytest.mark.parametrize("steps,start", [(1, 0), (4, 0), (1001, 0), (-1, 0), (-7, 2), (13, 3)])
+def test_quadrature_position(sim, io, steps, start):
+    # Put the encoder at the start position before creating the counter
+    io.pin_mode_bulk({A: (True,), B: (True,)})
+    sim.gpio.inject([(A, FORWARD[start] >> 1), (B, FORWARD[start] & 1)])
+    with QuadratureCounter(io, A, B) as counter:
+        sim.gpio.inject(quadrature_edges(steps, start))
+        assert counter.position == steps
+        assert counter.missed == 0
+        assert counter.edges == abs(steps)
+        assert counter.last_edge is not None
+
+
+def test_quadrature_direction_changes(sim, io):
+    with QuadratureCounter(io, A, B) as counter:
+        sim.gpio.inject(quadrature_edges(10))
+        sim.gpio.inject(quadrature_edges(-3, 10))
+        sim.gpio.inject(quadrature_edges(5, 7))
+        assert counter.position == 12
+        counter.reset(100)
+        sim.gpio.inject(quadrature_edges(-2, 12))
+        assert counter.position == 98
+
+
+def test_quadrature_lost_edge(sim, io):
+    with QuadratureCounter(io, A, B) as counter:
+        # The sixth edge changes the level without an event
+        sim.gpio.inject(quadrature_edges(8), lost={5})
+        assert counter.position == 8
+        assert counter.missed == 1
+
+
+def test_ring_overrun(sim, io):
+    with QuadratureCounter(io, A, B, size=16) as counter:
+        sim.gpio.inject(quadrature_edges(20))
+        assert counter.missed == 4
+        assert counter.edges == 16
+
+
+@pytest.mark.parametrize("edge,count", [("RISING", 5), ("FALLING", 5), ("BOTH", 10)])
+def test_pulse_counter(sim, io, edge, count):
+    with PulseCounter(io, PULSE, edge) as counter:
+        sim.gpio.inject([(PULSE, i & 1) for i in range(1, 11)])
+        assert counter.position == count
+        assert counter.missed == 0
+
+
+def test_pulse_counter_overrun(sim, io):
+    with PulseCounter(io, PULSE, size=4) as counter:
+        sim.gpio.inject([(PULSE, i & 1) for i in range(1, 21)])
+        assert counter.position == 10
+        assert counter.missed == 6
+
+
+def test_pins_claimed_once(io):
+    with QuadratureCounter(io, A, B):
+        with pytest.raises(ValueError):
+            PulseCounter(io, B)
+    PulseCounter(io, B).close()
+
+
+def test_edge_ring_drain():
+    ring = EdgeRing(5)
+    assert ring.size == 8
+    for code in range(6):
+        ring.push(code)
+    timestamps, codes, lost = ring.drain()
+    assert list(codes) == list(range(6)) and lost == 0
+    for code in range(11):
+        ring.push(code)
+    timestamps, codes, lost = ring.drain()
+    assert list(codes) == list(range(3, 11)) and lost == 3
+    assert len(ring.drain()[1]) == 0
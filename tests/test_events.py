@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+from pywiring.events import InterruptLine, Poller, PortWatch
+from pywiring.i2c import PCF8574IO
+from pywiring.raspi import RasPiIO
+from pywiring.sim import Simulation, SimPCF8574
+
+
+class Port(object):
+    def __init__(self):
+        self.value = 0
+
+    def read_port(self):
+        return self.value
+
+
+def wait_for(condition, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+def test_update_dispatches_edges():
+    watch = PortWatch(Port())
+    fired = []
+    watch.enable(0, "RISING", fired.append)
+    watch.enable(1, "FALLING", fired.append)
+    watch.enable(2, "BOTH", fired.append)
+    assert watch.update(0b010) == 0
+    assert watch.update(0b101) == 0b111
+    assert fired == [0, 1, 2]
+    assert watch.detected(0) and not watch.detected(0)
+    assert watch.update(0b000) == 0b101
+    assert fired == [0, 1, 2, 2]
+
+
+def test_bounce():
+    watch = PortWatch(Port())
+    fired = []
+    watch.enable(0, "BOTH", fired.append, bounce=10)
+    watch.update(0, now=0.0)
+    watch.update(1, now=1.0)
+    watch.update(0, now=1.005)
+    watch.update(1, now=1.02)
+    assert fired == [0, 0]
+
+
+def test_raising_callback_doesnt_stop_the_poller():
+    port = Port()
+    watch = PortWatch(port)
+    fired = []
+
+    def broken(pin):
+        raise ValueError("broken callback")
+
+    watch.enable(0, "BOTH", broken)
+    watch.add_callback(0, fired.append)
+    poller = Poller(min_interval=0.001, max_interval=0.005)
+    poller.add(watch)
+    try:
+        assert wait_for(lambda: watch.previous is not None)
+        port.value = 1
+        assert wait_for(lambda: fired == [0])
+        port.value = 0
+        assert wait_for(lambda: fired == [0, 0])
+        assert poller._thread is not None and poller._thread.is_alive()
+    finally:
+        poller.remove(watch)
+    assert wait_for(lambda: poller._thread is None)
+
+
+def test_poller_survives_a_failing_watch():
+    poller = Poller(min_interval=0.001, max_interval=0.005)
+    polled = threading.Event()
+
+    class Exploding(object):
+        def poll(self):
+            raise RuntimeError("unexpected")
+
+    class Watch(object):
+        def poll(self):
+            polled.set()
+            return 0
+
+    exploding, watch = Exploding(), Watch()
+    poller.add(exploding)
+    poller.add(watch)
+    try:
+        assert polled.wait(2)
+        polled.clear()
+        assert polled.wait(2)
+    finally:
+        poller.remove(exploding)
+        poller.remove(watch)
+    assert wait_for(lambda: poller._thread is None)
+    poller.add(watch)
+    try:
+        polled.clear()
+        assert polled.wait(2)
+    finally:
+        poller.remove(watch)
+
+
+class InterruptingPCF8574(SimPCF8574):
+    """
+    PCF8574 whose /INT output, on pin INT of the simulated RPi.GPIO, is
+    asserted when an input changes and released when the port is read.
+    Reads return :py:attr:`inputs`, whatever was written to the port.
+    """
+
+    def __init__(self, gpio):
+        super(InterruptingPCF8574, self).__init__()
+        self.gpio = gpio
+        self.reads = 0
+
+    def change(self, inputs):
+        self.inputs = inputs
+        self.gpio.set_input(INT, 0)
+
+    def read(self, count):
+        self.reads += 1
+        self.gpio.set_input(INT, 1)
+        return [self.inputs] * count
+
+
+INT = 4
+
+
+def test_interrupt_line():
+    with Simulation() as sim:
+        host = RasPiIO()
+        devices = [sim.bus(1).attach(address, InterruptingPCF8574(sim.gpio)) for address in (0x20, 0x21)]
+        ports = [PCF8574IO(1, address) for address in (0x20, 0x21)]
+        line = InterruptLine(host, INT)
+        fired = []
+        try:
+            assert host.digital_read(INT)
+            for port in ports:
+                port.port_mode(True)
+                port.use_interrupt(line)
+            ports[0].enable_event_detect(3, "FALLING", lambda pin: fired.append((0, pin)))
+            ports[1].enable_event_detect(5, "BOTH", lambda pin: fired.append((1, pin)))
+            reads = [device.reads for device in devices]
+
+            devices[1].change(0xFF & ~(1 << 5))
+            # Both ports sharing the line are read, once
+            assert fired == [(1, 5)]
+            assert [device.reads for device in devices] == [reads[0] + 1, reads[1] + 1]
+
+            devices[0].change(0xFF & ~(1 << 3))
+            devices[1].change(0xFF)
+            assert fired == [(1, 5), (0, 3), (1, 5)]
+            assert ports[0].event_detected(3)
+
+            # Without an interrupt, the ports aren't read
+            reads = [device.reads for device in devices]
+            time.sleep(0.02)
+            assert [device.reads for device in devices] == reads
+        finally:
+            line.close()
+            for port in ports:
+                port.close()
+            host.close()
+
+
+def test_interrupt_line_stuck_low():
+    with Simulation() as sim:
+        host = RasPiIO()
+        device = sim.bus(1).attach(0x20, SimPCF8574())
+        port = PCF8574IO(1, 0x20)
+        line = InterruptLine(host, INT)
+        try:
+            port.port_mode(True)
+            port.use_interrupt(line)
+            port.enable_event_detect(0, "BOTH")
+            reads = sim.bus(1).transactions
+            # Nothing releases the line: the ports are read max_rounds times
+            sim.gpio.set_input(INT, 0)
+            assert sim.bus(1).transactions - reads == line.max_rounds
+        finally:
+            line.close()
+            port.close()
+            host.close()
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the 16-bit expander backends against register models of the
+devices, on the simulated I2C bus of pywiring.sim.
+"""
+
+import pytest
+
+from pywiring.i2c import PCF8575IO, MCP23017IO
+from pywiring.sim import Simulation, SimMCP23017, SimPCF8575
+
+IODIR, GPINTEN, IOCON, GPPU, INTF, INTCAP, GPIO, OLAT = 0x00, 0x04, 0x0A, 0x0C, 0x0E, 0x10, 0x12, 0x14
+
+
+class RecordingPCF8575(SimPCF8575):
+    def __init__(self):
+        super(RecordingPCF8575, self).__init__()
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(list(data))
+        super(RecordingPCF8575, self).write(data)
+
+
+@pytest.fixture
+def sim():
+    with Simulation() as sim:
+        yield sim
+
+
+@pytest.fixture
+def pcf(sim):
+    device = sim.bus(1).attach(0x20, RecordingPCF8575())
+    io = PCF8575IO(1, 0x20)
+    yield io, device
+    io.close()
+
+
+@pytest.fixture
+def mcp(sim):
+    device = sim.bus(1).attach(0x20, SimMCP23017())
+    io = MCP23017IO(1)
+    yield io, device
+    io.close()
+
+
+def test_pcf8575_byte_order(pcf):
+    io, device = pcf
+    io.port_mode(False)
+    del device.writes[:]
+    io.write_port(0x1234)
+    # P00-P07 first, then P10-P17
+    assert device.writes == [[0x34, 0x12]]
+    assert device.latch == 0x1234
+    device.inputs = 0xFFFF
+    io.port_mode(True)
+    device.inputs = 0xABCD
+    assert io.read_port() == 0xABCD
+    assert io.digital_read(0) and not io.digital_read(1) and io.digital_read(15)
+
+
+def test_pcf8575_inputs_written_high(pcf):
+    io, device = pcf
+    io.port_mode(False)
+    io.write_port(0)
+    assert device.latch == 0
+    io.pin_mode_bulk({3: (True,), 12: (True,)})
+    assert device.latch == 1 << 3 | 1 << 12
+    # Writing the port doesn't pull the inputs low
+    io.write_port(0x0001)
+    assert device.latch == 1 << 0 | 1 << 3 | 1 << 12
+    device.inputs = ~(1 << 12) & 0xFFFF
+    assert io.read_port() == 1 << 3
+    assert io.read_outputs() == 0x0001
+
+
+def test_pcf8575_mode_changes_sent_once(pcf):
+    io, device = pcf
+    io.pin_mode(5, False)
+    count = len(device.writes)
+    io.pin_mode(5, False)
+    assert len(device.writes) == count
+
+
+def test_pcf8575_play(pcf):
+    io, device = pcf
+    io.port_mode(False)
+    del device.writes[:]
+    io.play(range(40))
+    data = [byte for write in device.writes for byte in write]
+    assert data == [byte for state in range(40) for byte in (state, 0)]
+    # Transactions never split a state
+    assert all(len(write) % 2 == 0 for write in device.writes)
+    assert device.latch == 39
+
+
+def test_mcp23017_setup(mcp):
+    io, device = mcp
+    assert device.writes[0] == (IOCON, [0x40])
+
+
+def test_mcp23017_iodir_and_pullups(mcp):
+    io, device = mcp
+    del device.writes[:]
+    io.pin_mode_bulk({0: (False,), 9: (False,), 3: (True, True)})
+    assert device.word(IODIR) == 0xFFFF & ~(1 << 0 | 1 << 9)
+    assert device.word(GPPU) == 1 << 3
+    # Word writes, low byte (A) first
+    assert device.writes == [(GPPU, [0x08, 0x00]), (IODIR, [0xFE, 0xFD])]
+    # Nothing changes, nothing is written
+    io.pin_mode(0, False)
+    assert len(device.writes) == 2
+
+
+def test_mcp23017_olat_writes(mcp):
+    io, device = mcp
+    io.port_mode(False)
+    del device.writes[:]
+    io.write_port(0xA55A)
+    assert device.writes == [(OLAT, [0x5A, 0xA5])]
+    io.digital_write(15, False)
+    assert device.word(OLAT) == 0x255A
+    io.modify_port(0x0001, 0x0002)
+    assert device.word(OLAT) == 0x2559
+    assert io.read_outputs() == 0x2559
+    # Writes to GPIO never happen: they'd be redirected to OLAT anyway
+    assert all(register == OLAT for register, _ in device.writes)
+
+
+def test_mcp23017_read_port(mcp):
+    io, device = mcp
+    io.pin_mode_bulk({pin: (False,) for pin in range(8)})
+    io.write_port(0x00FF)
+    device.inputs = 0x8100
+    # Only the inputs are reported
+    assert io.read_port() == 0x8100
+    assert io.digital_read_bulk(8, 15, 0) == {8: True, 15: True, 0: False}
+
+
+def test_mcp23017_play(mcp):
+    io, device = mcp
+    io.port_mode(False)
+    del device.writes[:]
+    io.play([0x0102, 0x0304, 0x0506])
+    assert device.writes == [(IOCON, [0x60]), (OLAT, [0x02, 0x01, 0x04, 0x03, 0x06, 0x05]), (IOCON, [0x40])]
+    assert device.word(OLAT) == 0x0506
+    assert io.read_outputs() == 0x0506
+
+
+def test_mcp23017_interrupts(mcp):
+    io, device = mcp
+    io.port_mode(True)
+    io.enable_event_detect(4, "BOTH")
+    io.enable_event_detect(12, "BOTH")
+    assert device.word(GPINTEN) == 1 << 4 | 1 << 12
+    io.disable_event_detect(4)
+    assert device.word(GPINTEN) == 1 << 12
+    io.disable_event_detect(12)
+    assert device.word(GPINTEN) == 0
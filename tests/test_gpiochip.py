@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the GPIO character device backend against a fake chip, which
+stands in for the kernel behind LinuxGPIOChip's ioctls: the line
+configurations and values go through the same ctypes structures as on
+hardware, and edge events are read from a pipe.
+"""
+
+import ctypes
+import errno
+import os
+import threading
+
+import pytest
+
+from pywiring import gpiochip
+from pywiring.gpiochip import (
+    GPIOChipIO, LinuxGPIOChip, gpio_v2_line_event,
+    GPIO_GET_CHIPINFO_IOCTL, GPIO_V2_GET_LINE_IOCTL, GPIO_V2_LINE_SET_CONFIG_IOCTL,
+    GPIO_V2_LINE_GET_VALUES_IOCTL, GPIO_V2_LINE_SET_VALUES_IOCTL,
+    GPIO_V2_LINE_ATTR_ID_FLAGS, GPIO_V2_LINE_ATTR_ID_OUTPUT_VALUES, GPIO_V2_LINE_ATTR_ID_DEBOUNCE,
+    GPIO_V2_LINE_FLAG_INPUT, GPIO_V2_LINE_FLAG_OUTPUT, GPIO_V2_LINE_FLAG_BIAS_PULL_UP,
+    GPIO_V2_LINE_FLAG_EDGE_RISING, GPIO_V2_LINE_FLAG_EDGE_FALLING,
+    GPIO_V2_LINE_EVENT_RISING_EDGE, GPIO_V2_LINE_EVENT_FALLING_EDGE,
+)
+
+
+class FakeChip(LinuxGPIOChip):
+    """
+    A chip with :py:data:`lines` lines. :py:attr:`levels` holds the level
+    driven from the outside on each line offset, :py:attr:`flags` and
+    :py:attr:`debounce` the configuration of each requested line.
+    """
+
+    def __init__(self, lines=32):
+        self.lines = lines
+        self.levels = {}
+        self.outputs = {}
+        self.flags = {}
+        self.debounce = {}
+        self.offsets = None
+        self.ioctls = []
+        self._event_writer = None
+        self._seqno = 0
+        super(FakeChip, self).__init__("fake")
+
+    def _open(self, path):
+        return os.open(os.devnull, os.O_RDONLY)
+
+    def _apply_config(self, config):
+        for index, offset in enumerate(self.offsets):
+            flags = config.flags
+            debounce = 0
+            for i in range(config.num_attrs):
+                attr = config.attrs[i]
+                if not (attr.mask >> index) & 1:
+                    continue
+                if attr.attr.id == GPIO_V2_LINE_ATTR_ID_FLAGS:
+                    flags = attr.attr.flags
+                elif attr.attr.id == GPIO_V2_LINE_ATTR_ID_DEBOUNCE:
+                    debounce = attr.attr.debounce_period_us
+                elif attr.attr.id == GPIO_V2_LINE_ATTR_ID_OUTPUT_VALUES:
+                    self.outputs[offset] = (attr.attr.values >> index) & 1
+            self.flags[offset] = flags
+            self.debounce[offset] = debounce
+
+    def _level(self, offset):
+        if self.flags[offset] & GPIO_V2_LINE_FLAG_OUTPUT:
+            return self.outputs.get(offset, 0)
+        return self.levels.get(offset, 0)
+
+    def _ioctl(self, fd, request, arg):
+        self.ioctls.append(request)
+        if request == GPIO_GET_CHIPINFO_IOCTL:
+            arg.lines = self.lines
+        elif request == GPIO_V2_GET_LINE_IOCTL:
+            self.offsets = list(arg.offsets[:arg.num_lines])
+            self._apply_config(arg.config)
+            reader, self._event_writer = os.pipe()
+            arg.fd = reader
+        elif request == GPIO_V2_LINE_SET_CONFIG_IOCTL:
+            self._apply_config(arg)
+        elif request == GPIO_V2_LINE_GET_VALUES_IOCTL:
+            arg.bits = 0
+            for index, offset in enumerate(self.offsets):
+                if (arg.mask >> index) & 1 and self._level(offset):
+                    arg.bits |= 1 << index
+        elif request == GPIO_V2_LINE_SET_VALUES_IOCTL:
+            for index, offset in enumerate(self.offsets):
+                if (arg.mask >> index) & 1:
+                    if not self.flags[offset] & GPIO_V2_LINE_FLAG_OUTPUT:
+                        raise IOError(errno.EPERM, "Line is not an output")
+                    self.outputs[offset] = (arg.bits >> index) & 1
+        else:
+            raise IOError(errno.ENOTTY, "Unknown ioctl")
+        return 0
+
+    def drive(self, offset, level, timestamp_ns=0):
+        """
+        Drives input line :py:data:`offset` from the outside, queuing an
+        edge event if edge detection is enabled for that edge.
+        """
+        previous = self.levels.get(offset, 0)
+        self.levels[offset] = level
+        flags = self.flags.get(offset, 0)
+        if level == previous:
+            return
+        if level and flags & GPIO_V2_LINE_FLAG_EDGE_RISING:
+            event_id = GPIO_V2_LINE_EVENT_RISING_EDGE
+        elif not level and flags & GPIO_V2_LINE_FLAG_EDGE_FALLING:
+            event_id = GPIO_V2_LINE_EVENT_FALLING_EDGE
+        else:
+            return
+        self._seqno += 1
+        event = gpio_v2_line_event(timestamp_ns=timestamp_ns, id=event_id, offset=offset,
+                                   seqno=self._seqno, line_seqno=self._seqno)
+        os.write(self._event_writer, bytes(event))
+
+    def close(self):
+        super(FakeChip, self).close()
+        if self._event_writer is not None:
+            os.close(self._event_writer)
+            self._event_writer = None
+
+
+@pytest.fixture
+def chip():
+    return FakeChip()
+
+
+@pytest.fixture
+def io(chip):
+    io = GPIOChipIO(chip, lines=[4, 17, 22, 27])
+    yield io
+    io.close()
+
+
+def test_request_lines_as_inputs(chip, io):
+    assert chip.offsets == [4, 17, 22, 27]
+    assert io.number_of_pins == 4
+    assert all(chip.flags[offset] == GPIO_V2_LINE_FLAG_INPUT for offset in chip.offsets)
+
+
+def test_all_lines_by_default():
+    chip = FakeChip(lines=80)
+    io = GPIOChipIO(chip)
+    try:
+        assert chip.offsets == list(range(64))
+    finally:
+        io.close()
+
+
+def test_pin_mode(chip, io):
+    io.pin_mode(0, False)
+    io.pin_mode(1, True, pullup=True)
+    assert chip.flags[4] & GPIO_V2_LINE_FLAG_OUTPUT
+    assert chip.flags[17] & GPIO_V2_LINE_FLAG_INPUT
+    assert chip.flags[17] & GPIO_V2_LINE_FLAG_BIAS_PULL_UP
+    assert chip.flags[22] & GPIO_V2_LINE_FLAG_INPUT
+    with pytest.raises(ValueError):
+        io.pin_mode(2, True, pullup=True, pulldown=True)
+
+
+def test_pin_mode_bulk_is_one_ioctl(chip, io):
+    del chip.ioctls[:]
+    io.pin_mode_bulk({0: (False,), 1: (False,), 2: (True, False, True)})
+    assert chip.ioctls == [GPIO_V2_LINE_SET_CONFIG_IOCTL]
+    assert chip.flags[4] & GPIO_V2_LINE_FLAG_OUTPUT and chip.flags[17] & GPIO_V2_LINE_FLAG_OUTPUT
+
+
+def test_read_port(chip, io):
+    chip.levels.update({17: 1, 27: 1})
+    del chip.ioctls[:]
+    assert io.read_port() == 0b1010
+    assert chip.ioctls == [GPIO_V2_LINE_GET_VALUES_IOCTL]
+    assert io.digital_read(1) and not io.digital_read(0)
+    assert io.digital_read_bulk(0, 1, 3) == {0: False, 1: True, 3: True}
+    assert io.analog_read(1) == 255
+    assert io.analog_read(0) == 0
+
+
+def test_write_port(chip, io):
+    io.pin_mode_bulk({0: (False,), 2: (False,)})
+    del chip.ioctls[:]
+    io.write_port(0b0101)
+    assert chip.ioctls == [GPIO_V2_LINE_SET_VALUES_IOCTL]
+    assert chip.outputs[4] == 1 and chip.outputs[22] == 1
+    io.modify_port(0, 0b0001)
+    assert chip.outputs[4] == 0 and chip.outputs[22] == 1
+    io.digital_write(0, True)
+    assert chip.outputs[4] == 1
+    # Input pins are left alone
+    io.write_port(0b1111)
+    assert 17 not in chip.outputs and 27 not in chip.outputs
+    assert io.read_port() & 0b0101 == 0b0101
+
+
+def test_output_values_kept_across_reconfiguration(chip, io):
+    io.pin_mode(0, False)
+    io.digital_write(0, True)
+    io.pin_mode(1, False)
+    assert chip.outputs[4] == 1
+
+
+def test_edge_events(chip, io):
+    io.pin_mode(1, True)
+    fired = []
+    done = threading.Event()
+
+    def callback(pin):
+        fired.append(pin)
+        if len(fired) == 2:
+            done.set()
+
+    io.enable_event_detect(1, "RISING", callback, bounce=5)
+    assert chip.flags[17] & GPIO_V2_LINE_FLAG_EDGE_RISING
+    assert not chip.flags[17] & GPIO_V2_LINE_FLAG_EDGE_FALLING
+    assert chip.debounce[17] == 5000
+
+    chip.drive(17, 1, timestamp_ns=1000)
+    chip.drive(17, 0, timestamp_ns=2000)
+    chip.drive(17, 1, timestamp_ns=3000)
+    assert done.wait(2)
+    assert fired == [1, 1]
+    assert io.event_detected(1) and not io.event_detected(1)
+    assert io.event_timestamp(1) == 3000
+
+    io.disable_event_detect(1)
+    assert not chip.flags[17] & (GPIO_V2_LINE_FLAG_EDGE_RISING | GPIO_V2_LINE_FLAG_EDGE_FALLING)
+
+
+def test_raising_callback_doesnt_stop_events(chip, io):
+    fired = threading.Event()
+
+    def broken(pin):
+        raise ValueError("broken callback")
+
+    io.enable_event_detect(0, "BOTH", broken)
+    io.add_event_callback(0, lambda pin: fired.set())
+    chip.drive(4, 1)
+    assert fired.wait(2)
+    fired.clear()
+    chip.drive(4, 0)
+    assert fired.wait(2)
+    assert io._thread.is_alive()
+
+
+def test_event_structure_size():
+    # struct gpio_v2_line_event in linux/gpio.h
+    assert ctypes.sizeof(gpio_v2_line_event) == 48
+    assert ctypes.sizeof(gpiochip.gpio_v2_line_request) == 592
+    assert ctypes.sizeof(gpiochip.gpio_v2_line_config) == 272
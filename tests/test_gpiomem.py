@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import os
+import struct
+
+import pytest
+
+from pywiring import gpiomem
+from pywiring.gpiomem import GPIOMem, BLOCK_SIZE, GPFSEL0, GPSET0, GPCLR0, GPLEV0
+
+
+@pytest.fixture
+def block(tmp_path):
+    path = tmp_path / "gpiomem"
+    path.write_bytes(bytes(BLOCK_SIZE))
+    fd = os.open(str(path), os.O_RDWR)
+    mem = GPIOMem(str(path))
+    yield mem, fd
+    mem.close()
+    os.close(fd)
+
+
+def register(fd, offset):
+    return struct.unpack("<I", os.pread(fd, 4, offset))[0]
+
+
+def set_register(fd, offset, value):
+    os.pwrite(fd, struct.pack("<I", value), offset)
+
+
+def test_register_offsets():
+    # BCM2835 ARM Peripherals, section 6.1
+    assert (GPFSEL0, GPSET0, GPCLR0, GPLEV0) == (0x00, 0x1C, 0x28, 0x34)
+    assert gpiomem.BLOCK_SIZE == 4096
+
+
+def test_set_and_clear(block):
+    mem, fd = block
+    mem.set(1 << 4 | 1 << 17)
+    assert register(fd, GPSET0) == 1 << 4 | 1 << 17
+    assert register(fd, GPCLR0) == 0
+    mem.clear(1 << 31 | 1 << 40)
+    assert register(fd, GPCLR0) == 1 << 31
+    # Empty masks aren't stored
+    set_register(fd, GPSET0, 0)
+    mem.set(0)
+    mem.clear(0)
+    assert register(fd, GPSET0) == 0 and register(fd, GPCLR0) == 1 << 31
+    # Nothing else is touched
+    data = os.pread(fd, BLOCK_SIZE, 0)
+    assert data[:GPSET0] == bytes(GPSET0)
+    assert data[GPLEV0:] == bytes(BLOCK_SIZE - GPLEV0)
+
+
+def test_read_levels(block):
+    mem, fd = block
+    set_register(fd, GPLEV0, 0x80020010)
+    assert mem.read_levels() == 0x80020010
+
+
+def test_read_function(block):
+    mem, fd = block
+    # Pin 4 output, pin 9 ALT0 in GPFSEL0; pin 17 output in GPFSEL1
+    set_register(fd, GPFSEL0, 1 << 12 | 4 << 27)
+    set_register(fd, GPFSEL0 + 4, 1 << 21)
+    assert mem.read_function(4) == 1
+    assert mem.read_function(9) == 4
+    assert mem.read_function(17) == 1
+    assert mem.read_function(5) == 0 and mem.read_function(10) == 0
+
+
+def test_raspi_through_gpiomem(block, tmp_path):
+    from pywiring.raspi import RasPiIO
+    from pywiring.sim import Simulation
+
+    mem, fd = block
+    with Simulation():
+        io = RasPiIO(gpiomem=str(tmp_path / "gpiomem"))
+        try:
+            io.pin_mode_bulk({4: (False,), 17: (False,), 22: (True,)})
+            io.digital_write(17, True)
+            assert register(fd, GPSET0) == 1 << 17
+            io.modify_port(1 << 4, 1 << 17)
+            assert register(fd, GPSET0) == 1 << 4
+            assert register(fd, GPCLR0) == 1 << 17
+            set_register(fd, GPLEV0, 1 << 4 | 1 << 22 | 1 << 30)
+            assert io.read_port() == 1 << 4 | 1 << 22
+            assert io.digital_read(22) and not io.digital_read(17)
+        finally:
+            io.close()
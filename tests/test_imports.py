@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def imported_modules(statement):
+    code = "import sys; {0}; print(' '.join(sorted(sys.modules)))".format(statement)
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=ROOT)
+    return set(output.decode().split())
+
+
+def test_i2c_doesnt_import_shared_memory():
+    modules = imported_modules("import pywiring.i2c")
+    assert "pywiring.i2c" in modules
+    assert "pywiring.shared" not in modules
+    assert "multiprocessing.shared_memory" not in modules
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the instrumentation proxies, on the simulated hardware of
+pywiring.sim: the counters must match the transactions the hardware
+received.
+"""
+
+import pytest
+
+from pywiring import instrument
+from pywiring.i2c import PCF8574IO, PCF8575IO
+from pywiring.sim import Simulation, SimPCF8574, SimPCF8575
+
+
+@pytest.fixture
+def sim():
+    with Simulation() as sim:
+        yield sim
+
+
+def measure(sim, io, func):
+    stats = instrument.instrument(io)
+    before = sim.bus(1).transactions
+    try:
+        func()
+        return stats.snapshot(), sim.bus(1).transactions - before
+    finally:
+        instrument.uninstrument(io)
+
+
+def test_play_counts_every_smbus_call(sim):
+    sim.bus(1).attach(0x20, SimPCF8574())
+    io = PCF8574IO(1, 0x20)
+    try:
+        io.port_mode(False)
+        # 40 states: one block write of 33 bytes, then one of 7
+        data, transactions = measure(sim, io, lambda: io.play(list(range(40))))
+    finally:
+        io.close()
+    assert transactions == 2
+    assert data["transactions"] == data["writes"] == 2
+    assert data["calls"] == {"write_i2c_block_data": 2}
+    assert data["latency"]["count"] == 2
+
+
+def test_play_single_byte_chunk(sim):
+    sim.bus(1).attach(0x20, SimPCF8574())
+    io = PCF8574IO(1, 0x20)
+    try:
+        io.port_mode(False)
+        data, transactions = measure(sim, io, lambda: io.play(list(range(34))))
+    finally:
+        io.close()
+    assert transactions == 2
+    assert data["calls"] == {"write_i2c_block_data": 1, "write_byte": 1}
+    assert data["writes"] == 2
+
+
+def test_plain_reads_counted_as_reads(sim):
+    sim.bus(1).attach(0x20, SimPCF8575())
+    io = PCF8575IO(1, 0x20)
+    try:
+        io.port_mode(True)
+        data, transactions = measure(sim, io, lambda: [io.read_port() for _ in range(3)])
+    finally:
+        io.close()
+    assert transactions == 3
+    assert data["transactions"] == data["reads"] == 3
+    assert data["calls"] == {"i2c_rdwr": 3}
+
+
+def test_uninstrument_restores_handles(sim):
+    sim.bus(1).attach(0x20, SimPCF8574())
+    io = PCF8574IO(1, 0x20)
+    try:
+        bus = io._bus
+        stats = instrument.instrument(io)
+        assert io._bus is not bus
+        io.read_port()
+        assert io.avg_exec_time == stats.latency.mean / 1e6
+        instrument.uninstrument(io)
+        assert io._bus is bus
+        assert io.avg_exec_time == PCF8574IO.avg_exec_time
+        assert instrument.snapshot() == {}
+    finally:
+        io.close()
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the HD44780 driver on a simulated PCF8574 backpack: the 4-bit
+sequences are decoded from the bytes the expander receives.
+"""
+
+import errno
+
+import pytest
+
+from pywiring.i2c import LCDBackpack
+from pywiring.lcd import HD44780
+from pywiring.sim import Simulation, SimPCF8574
+
+RS, RW, EN, BACKLIGHT = 0x01, 0x02, 0x04, 0x08
+
+
+class RecordingPCF8574(SimPCF8574):
+    def __init__(self):
+        super(RecordingPCF8574, self).__init__()
+        self.states = []
+        self.fail = False
+
+    def write(self, data):
+        if self.fail:
+            raise IOError(errno.EREMOTEIO, "Remote I/O error")
+        self.states.extend(data)
+        super(RecordingPCF8574, self).write(data)
+
+
+def nibbles(states):
+    """
+    Returns the (rs, nibble) latched on each falling edge of E.
+    """
+    latched = []
+    previous = 0
+    for state in states:
+        if previous & EN and not state & EN:
+            latched.append((state & RS, state >> 4))
+        previous = state
+    return latched
+
+
+def transfers(states):
+    """
+    Returns the (rs, byte) sent by the 4-bit sequence in :py:data:`states`.
+    """
+    latched = nibbles(states)
+    assert len(latched) % 2 == 0
+    return [(high[0], high[1] << 4 | low[1]) for high, low in zip(latched[::2], latched[1::2])]
+
+
+def chars(text):
+    return [(1, ord(char)) for char in text]
+
+
+@pytest.fixture
+def lcd():
+    with Simulation() as sim:
+        device = sim.bus(1).attach(0x27, RecordingPCF8574())
+        io = LCDBackpack(1, 0x27)
+        lcd = HD44780(io, cols=16, rows=2)
+        yield lcd, device
+        io.close()
+
+
+def test_init_sequence(lcd):
+    lcd, device = lcd
+    latched = nibbles(device.states)
+    # Three times 8-bit mode, then 4-bit mode
+    assert latched[:4] == [(0, 0x3)] * 3 + [(0, 0x2)]
+    # Function set (2 lines), display on, entry mode left, clear
+    assert transfers(device.states[8:]) == [(0, 0x28), (0, 0x0C), (0, 0x06), (0, 0x01)]
+    # From the reset sequence on (the first write is port_mode's, of the
+    # power-on state of the expander), RW is always low and the backlight on
+    assert all(not state & RW and state & BACKLIGHT for state in device.states[1:])
+
+
+def test_refresh_sends_changed_cells(lcd):
+    lcd, device = lcd
+    del device.states[:]
+    lcd.write("Hi")
+    assert lcd.refresh() == 2 * 4
+    assert transfers(device.states) == chars("Hi")
+
+    del device.states[:]
+    assert lcd.refresh() == 0
+    assert device.states == []
+
+    # The cursor is moved only when the next cell isn't the one after it
+    lcd.set_cursor(5, 0)
+    lcd.write("xy")
+    lcd.set_cursor(0, 1)
+    lcd.write("a")
+    lcd.set_cursor(15, 1)
+    lcd.write("z")
+    lcd.refresh()
+    assert transfers(device.states) == ([(0, 0x80 | 5)] + chars("xy") + [(0, 0x80 | 0x40)] + chars("a") +
+                                        [(0, 0x80 | 0x4F)] + chars("z"))
+
+    # Rewriting the same text sends nothing
+    del device.states[:]
+    lcd.set_cursor(0, 0)
+    lcd.write("Hi")
+    assert lcd.refresh() == 0
+
+
+def test_newlines_and_clipping(lcd):
+    lcd, device = lcd
+    del device.states[:]
+    lcd.write("ab\ncd" + "e" * 20)
+    lcd.refresh()
+    assert lcd.framebuffer[0][:3] == ["a", "b", " "]
+    assert "".join(lcd.framebuffer[1]) == "cd" + "e" * 14
+    assert transfers(device.states) == chars("ab") + [(0, 0x80 | 0x40)] + chars("cd" + "e" * 14)
+
+
+def test_failed_refresh_is_retried(lcd):
+    lcd, device = lcd
+    lcd.write("Hi")
+    device.fail = True
+    with pytest.raises(IOError):
+        lcd.refresh()
+    device.fail = False
+    del device.states[:]
+    # The cells weren't shown, and the cursor position is unknown
+    assert lcd.refresh() > 0
+    assert transfers(device.states) == [(0, 0x80)] + chars("Hi")
+    del device.states[:]
+    assert lcd.refresh() == 0
+
+
+def test_clear(lcd):
+    lcd, device = lcd
+    lcd.write("Hi")
+    lcd.refresh()
+    del device.states[:]
+    lcd.clear()
+    assert transfers(device.states) == [(0, 0x01)]
+    assert lcd.framebuffer[0] == [" "] * 16
+    del device.states[:]
+    assert lcd.refresh() == 0
+    lcd.write("A")
+    lcd.refresh()
+    assert transfers(device.states) == chars("A")
+
+
+def test_backlight(lcd):
+    lcd, device = lcd
+    lcd.backlight = False
+    assert not device.latch & BACKLIGHT
+    del device.states[:]
+    lcd.write("A")
+    lcd.refresh()
+    assert all(not state & BACKLIGHT for state in device.states)
+    lcd.backlight = True
+    assert device.latch & BACKLIGHT
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of pywiring.open(), the backend registry and the hardware module
+overrides.
+"""
+
+import json
+import types
+
+import pytest
+
+import pywiring
+from pywiring import get_backend, hardware_module, override_hardware_module, register_backend
+from pywiring.i2c import PCF8574IO
+from pywiring.sim import Simulation, SimPCF8574
+
+
+class Recorder(object):
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    monkeypatch.setattr(pywiring, "_backends", dict(pywiring._backends))
+    register_backend("Recorder", __name__, "Recorder")
+
+
+@pytest.mark.parametrize("uri,kwargs", [
+    ("recorder", {}),
+    ("recorder:", {}),
+    ("RECORDER:bus=1", {"bus": 1}),
+    ("recorder:addr=0x20,bus=0", {"address": 0x20, "bus": 0}),
+    ("recorder:port=0o17,mask=0b101", {"port": 0o17, "mask": 0b101}),
+    ("recorder:rate=2.5,ttl=1e-3", {"rate": 2.5, "ttl": 0.001}),
+    ("recorder:a=true,b=Yes,c=on,d=false,e=NO,f=off", {"a": True, "b": True, "c": True, "d": False, "e": False,
+                                                      "f": False}),
+    ("recorder:path=/tmp/io.sock,host=localhost", {"path": "/tmp/io.sock", "host": "localhost"}),
+    (" recorder : bus = 1 , , addr = 0x27 ", {"bus": 1, "address": 0x27}),
+    ("recorder:name=", {"name": ""}),
+])
+def test_uri_arguments(recorder, uri, kwargs):
+    io = pywiring.open(uri)
+    assert isinstance(io, Recorder)
+    assert io.kwargs == kwargs
+
+
+def test_invalid_argument(recorder):
+    with pytest.raises(ValueError, match="bus"):
+        pywiring.open("recorder:bus")
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError, match="Unknown backend: nothing"):
+        pywiring.open("nothing:bus=1")
+    with pytest.raises(ValueError):
+        get_backend("")
+
+
+def test_backend_module_imported_when_opened(monkeypatch):
+    monkeypatch.setattr(pywiring, "_backends", dict(pywiring._backends))
+    register_backend("missing", "pywiring_no_such_module", "MissingIO")
+    with pytest.raises(ImportError):
+        pywiring.open("missing")
+
+
+def test_open_builtin_backend():
+    with Simulation() as sim:
+        device = sim.bus(1).attach(0x20, SimPCF8574())
+        io = pywiring.open("pcf8574:bus=1,addr=0x20,read_cache_ttl=0.5")
+        try:
+            assert isinstance(io, PCF8574IO)
+            assert io.read_cache_ttl == 0.5
+            io.port_mode(False)
+            io.write_port(0x5A)
+            assert device.latch == 0x5A
+        finally:
+            io.close()
+    assert get_backend("PCF8574") is PCF8574IO
+
+
+def test_override_hardware_module():
+    fake = types.ModuleType("json")
+    assert hardware_module("json") is json
+    override_hardware_module("json", fake)
+    try:
+        assert hardware_module("json") is fake
+    finally:
+        override_hardware_module("json")
+    assert hardware_module("json") is json
+    # Restoring a module that isn't overridden does nothing
+    override_hardware_module("json", None)
+    assert hardware_module("json") is json
+
+
+def test_simulation_restores_overrides():
+    previous = types.ModuleType("smbus")
+    override_hardware_module("smbus", previous)
+    try:
+        with Simulation():
+            assert hardware_module("smbus") is not previous
+        assert hardware_module("smbus") is previous
+    finally:
+        override_hardware_module("smbus")
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the ParallelIO pin mapping onto the data, control and status
+registers, and of the register writes it skips, on the simulated parallel
+port of pywiring.sim.
+"""
+
+import pytest
+
+from pywiring.parport import (CONTROL_AUTOFD, CONTROL_INIT, CONTROL_SELECT, CONTROL_STROBE, STATUS_ACK,
+                              STATUS_BUSY, STATUS_ERROR, STATUS_PAPEROUT, STATUS_SELECT, ParallelIO)
+from pywiring.sim import Simulation
+
+# Strobe, Auto Feed and Select are inverted: all the outputs low
+IDLE_CONTROL = CONTROL_STROBE | CONTROL_AUTOFD | CONTROL_SELECT
+
+
+@pytest.fixture
+def lpt():
+    with Simulation() as sim:
+        port = sim.port(0)
+        # Data direction and IRQ enable bits, which must be kept
+        port.control = 0x30
+        io = ParallelIO(0)
+        try:
+            yield io, port
+        finally:
+            io.close()
+
+
+def test_initial_state(lpt):
+    io, port = lpt
+    assert port.data == 0
+    assert port.control == 0x30 | IDLE_CONTROL
+
+
+@pytest.mark.parametrize("pin,bit,inverted", [(0, CONTROL_STROBE, True), (9, CONTROL_AUTOFD, True),
+                                              (10, CONTROL_INIT, False), (11, CONTROL_SELECT, True)])
+def test_control_lines(lpt, pin, bit, inverted):
+    io, port = lpt
+    io.digital_write(pin, True)
+    assert bool(port.control & bit) != inverted
+    # The other lines and the bits that aren't outputs don't change
+    assert port.control & ~bit == (0x30 | IDLE_CONTROL) & ~bit
+    assert port.data == 0
+    io.digital_write(pin, False)
+    assert port.control == 0x30 | IDLE_CONTROL
+
+
+def test_data_pins(lpt):
+    io, port = lpt
+    for pin in range(1, 9):
+        io.write_port(1 << pin)
+        assert port.data == 1 << (pin - 1)
+        assert port.control == 0x30 | IDLE_CONTROL
+    io.write_port(0xFFF)
+    assert port.data == 0xFF
+    assert port.control == 0x30 | CONTROL_INIT
+
+
+@pytest.mark.parametrize("pin,bit", [(0, STATUS_ACK), (1, STATUS_BUSY), (2, STATUS_PAPEROUT), (3, STATUS_SELECT),
+                                     (4, STATUS_ERROR)])
+def test_status_lines(lpt, pin, bit):
+    io, port = lpt
+    # Every input low (Busy is inverted), then only this one high
+    low = STATUS_BUSY
+    port.status = low
+    assert io.read_port() == 0
+    port.status = low ^ bit
+    assert io.read_port() == 1 << pin
+    assert io.digital_read(pin) is True
+    assert io.digital_read_bulk(*range(5)) == {i: i == pin for i in range(5)}
+    assert io.digital_read(5) is None
+
+
+def test_unchanged_registers_not_written(lpt):
+    io, port = lpt
+    port.reset_stats()
+    io.write_port(0)
+    assert port.transactions == 0
+    # Data pins only: one data register write
+    io.modify_port(0x006, 0)
+    assert port.transactions == 1
+    io.digital_write(2, True)
+    assert port.transactions == 1
+    # Control pins only: one control register write
+    io.digital_write(10, True)
+    assert port.transactions == 2
+    # Both
+    io.write_port(0x001)
+    assert port.transactions == 4
+    assert port.data == 0
+    assert port.control == 0x30 | IDLE_CONTROL & ~CONTROL_STROBE
+
+
+def test_play_data_pins(lpt):
+    io, port = lpt
+    io.digital_write(11, True)
+    port.reset_stats()
+    io.play([0x002, 0x1FE, 0x100], mask=0x1FE)
+    # One data register write per state, and the control pins kept
+    assert port.transactions == 3
+    assert port.data == 0x80
+    assert port.control == 0x30 | (IDLE_CONTROL & ~CONTROL_SELECT)
+    io.digital_write(1, True)
+    assert port.data == 0x81
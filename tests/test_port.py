@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the bitmask port API (read_port, write_port, modify_port) and of
+the bulk methods built on it, on every backend over pywiring.sim, and of
+the pin by pin fallbacks of IOBase.
+"""
+
+import warnings
+
+import pytest
+
+from pywiring import IOBase
+from pywiring.i2c import MCP23017IO, PCF8574IO, PCF8575IO
+from pywiring.parport import DATA_PINS, STATUS_LINES, ParallelIO
+from pywiring.raspi import RasPiIO
+from pywiring.sim import Simulation, SimMCP23017, SimPCF8574, SimPCF8575
+
+
+class Inputs(SimPCF8574):
+    """
+    Reads return :py:attr:`inputs`, whatever was written to the port.
+    """
+
+    def read(self, count):
+        return [self.inputs] * count
+
+
+class Backend(object):
+    """
+    An interface on the simulation, with its output and input pins as
+    masks, and accessors of the levels on the simulated hardware.
+    """
+
+    def __init__(self, io, outputs, inputs, driven, drive):
+        self.io = io
+        self.outputs = outputs
+        self.inputs = inputs
+        self.driven = driven
+        self.drive = drive
+
+
+def pcf8574(sim):
+    device = sim.bus(1).attach(0x20, Inputs())
+    io = PCF8574IO(1, 0x20)
+    io.pin_mode_bulk({pin: (pin >= 4,) for pin in range(8)})
+    return Backend(io, 0x0F, 0xF0, lambda: device.latch & 0x0F, lambda levels: setattr(device, "inputs", levels))
+
+
+def pcf8575(sim):
+    device = sim.bus(1).attach(0x20, SimPCF8575())
+    io = PCF8575IO(1, 0x20)
+    io.pin_mode_bulk({pin: (pin >= 8,) for pin in range(16)})
+    return Backend(io, 0x00FF, 0xFF00, lambda: device.latch & 0x00FF,
+                   lambda levels: setattr(device, "inputs", levels | 0x00FF))
+
+
+def mcp23017(sim):
+    device = sim.bus(1).attach(0x20, SimMCP23017())
+    io = MCP23017IO(1)
+    io.pin_mode_bulk({pin: (pin & 1,) for pin in range(16)})
+    return Backend(io, 0x5555, 0xAAAA, lambda: device.word(device.OLAT) & 0x5555,
+                   lambda levels: device.set_inputs(levels))
+
+
+def parport(sim):
+    port = sim.port(0)
+    io = ParallelIO(0)
+
+    def drive(levels):
+        port.status = 0
+        for pin, bit, inverted in STATUS_LINES:
+            if bool(levels >> pin & 1) != inverted:
+                port.status |= bit
+
+    # Data pins only: the control lines have their own mapping
+    return Backend(io, DATA_PINS, 0x1F, lambda: port.data << 1, drive)
+
+
+def raspi(sim):
+    io = RasPiIO()
+    for pin in range(8):
+        io.pin_mode(pin, pin >= 4)
+
+    def driven():
+        return sum(level << pin for pin, level in sim.gpio.outputs.items())
+
+    def drive(levels):
+        for pin in range(4, 8):
+            sim.gpio.set_input(pin, levels >> pin & 1)
+
+    return Backend(io, 0x0F, 0xF0, driven, drive)
+
+
+@pytest.fixture(params=[pcf8574, pcf8575, mcp23017, parport, raspi])
+def backend(request):
+    with warnings.catch_warnings():
+        # Pin modes can't be set on the parallel port
+        warnings.simplefilter("ignore", RuntimeWarning)
+        with Simulation() as sim:
+            backend = request.param(sim)
+            try:
+                yield backend
+            finally:
+                backend.io.close()
+
+
+def pins(mask):
+    return [pin for pin in range(mask.bit_length()) if mask >> pin & 1]
+
+
+def test_write_port(backend):
+    io, outputs = backend.io, backend.outputs
+    for value in (outputs, 0, 0x5A5A & outputs, ~0):
+        io.write_port(value)
+        assert backend.driven() == value & outputs
+
+
+def test_modify_port(backend):
+    io, outputs = backend.io, backend.outputs
+    first, second = pins(outputs)[:2]
+    others = outputs & ~(1 << first | 1 << second)
+    io.write_port(others)
+    io.modify_port(1 << first, 0)
+    assert backend.driven() == others | 1 << first
+    # Pins in both masks are pulled high; the others are left untouched
+    io.modify_port(1 << second, 1 << first | 1 << second)
+    assert backend.driven() == others | 1 << second
+    io.modify_port(0, others)
+    assert backend.driven() == 1 << second
+    io.modify_port(0, 0)
+    assert backend.driven() == 1 << second
+
+
+def test_bulk_writes_are_masks(backend):
+    io, outputs = backend.io, backend.outputs
+    io.write_port(0)
+    levels = {pin: i & 1 for i, pin in enumerate(pins(outputs))}
+    # Pins out of range are ignored
+    levels[-1] = levels[io.number_of_pins] = 1
+    io.digital_write_bulk(levels)
+    expected = sum(1 << pin for pin, level in levels.items() if level and 0 <= pin < io.number_of_pins)
+    assert backend.driven() == expected
+
+
+def test_read_port(backend):
+    io, inputs = backend.io, backend.inputs
+    for value in (0, inputs, 0xA5A5 & inputs, 0x5A5A & inputs):
+        backend.drive(value)
+        assert io.read_port() & inputs == value
+        read = io.digital_read_bulk(*pins(inputs))
+        assert read == {pin: bool(value >> pin & 1) for pin in pins(inputs)}
+        assert [io.digital_read(pin) for pin in pins(inputs)] == [bool(value >> pin & 1) for pin in pins(inputs)]
+
+
+class Pins(IOBase):
+    """
+    Interface with only the pin by pin methods, for the fallbacks of IOBase.
+    """
+
+    number_of_pins = 6
+
+    def __init__(self):
+        self.levels = [False] * self.number_of_pins
+        self.writes = []
+
+    def digital_read(self, pin):
+        return self.levels[pin]
+
+    def digital_write(self, pin, high):
+        self.writes.append((pin, bool(high)))
+        self.levels[pin] = bool(high)
+
+
+def test_fallbacks():
+    io = Pins()
+    io.write_port(0b101101)
+    assert io.levels == [True, False, True, True, False, True]
+    assert io.read_port() == 0b101101
+    del io.writes[:]
+    io.modify_port(0b000010, 0b000011)
+    # Only the pins in the masks are written, pin 1 high
+    assert io.writes == [(0, False), (1, True)]
+    assert io.read_port() == 0b101110
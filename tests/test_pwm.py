@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+from pywiring import IOBase
+from pywiring.pwm import PWMScheduler, _compile
+
+
+class RecordingIO(IOBase):
+    number_of_pins = 8
+
+    def __init__(self):
+        self.level = 0
+        self.history = []
+        self.lock = threading.Lock()
+
+    def digital_write(self, pin, high):
+        if high:
+            self.modify_port(1 << pin, 0)
+        else:
+            self.modify_port(0, 1 << pin)
+
+    def modify_port(self, set_mask, clear_mask):
+        with self.lock:
+            self.level = (self.level & ~clear_mask) | set_mask
+            self.history.append((set_mask, clear_mask))
+
+
+def test_compile_merges_edges():
+    io = RecordingIO()
+    slots = _compile({(io, 0): 0.5, (io, 1): 0.5, (io, 2): 0.25}, 0.01)
+    assert [offset for offset, _ in slots] == [0.0, 0.0025, 0.005]
+    func, args, edges = slots[0][1][0]
+    assert func == io.modify_port and args == (0b111, 0) and edges == 3
+    assert slots[1][1][0][1:] == ((2, False), 1)
+    assert slots[2][1][0][1:] == ((0, 0b11), 2)
+
+
+def test_compile_keeps_both_edges_of_short_pulses():
+    io = RecordingIO()
+    # 1/255 of 100 Hz is shorter than the merge window
+    slots = _compile({(io, 0): 1 / 255.0, (io, 1): 254 / 255.0}, 0.01)
+    writes = [args for _, slot in slots for _, args, _ in slot]
+    assert writes == [(0b11, 0), (0, False), (1, False)]
+
+
+def test_short_pulses_are_generated():
+    io = RecordingIO()
+    scheduler = PWMScheduler()
+    scheduler.set(io, 0, 100, 1 / 255.0)
+    time.sleep(0.1)
+    scheduler.remove(io, 0)
+    rising = io.history.count((1, 0))
+    falling = io.history.count((0, 1))
+    assert rising >= 5 and falling >= rising
+    assert io.level == 0
+    assert scheduler.stats()["edges"] >= 10
+
+
+def test_remove_stops_the_wave():
+    io = RecordingIO()
+    scheduler = PWMScheduler()
+    scheduler.set(io, 1, 200, 0.5)
+    scheduler.set(io, 2, 200, 0.25)
+    time.sleep(0.05)
+    scheduler.remove(io, 1, True)
+    time.sleep(0.01)
+    del io.history[:]
+    time.sleep(0.05)
+    assert io.history and all(not (set_mask | clear_mask) & 0b10 for set_mask, clear_mask in io.history)
+    assert io.level & 0b10
+    assert scheduler.channels() == {(io, 2): (200, 0.25)}
+    scheduler.remove_io(io)
+    deadline = time.time() + 1
+    while scheduler._thread is not None and time.time() < deadline:
+        time.sleep(0.01)
+    assert scheduler._thread is None
+
+
+def test_scheduler_sleeps_between_edges():
+    io = RecordingIO()
+    scheduler = PWMScheduler()
+    scheduler.set(io, 0, 100, 0.5)
+    time.sleep(0.3)
+    stats = scheduler.stats()
+    scheduler.remove(io, 0)
+    assert stats["edges"] >= 40
+    # Two edges every 10 ms: the thread mostly sleeps
+    assert stats["cpu_usage"] < 0.5
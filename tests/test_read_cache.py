@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the read cache of PCF8574IO (read_cache_ttl), on the simulated
+I2C bus of pywiring.sim, with a controlled clock.
+"""
+
+import pytest
+
+import pywiring.i2c
+from pywiring.i2c import PCF8574IO
+from pywiring.sim import Simulation, SimPCF8574
+
+TTL = 0.01
+
+
+class Inputs(SimPCF8574):
+    """
+    Reads return :py:attr:`inputs`, whatever was written to the port.
+    """
+
+    def read(self, count):
+        return [self.inputs] * count
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def cached(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(pywiring.i2c, "monotonic", clock)
+    with Simulation() as sim:
+        bus = sim.bus(1)
+        device = bus.attach(0x20, Inputs())
+        io = PCF8574IO(1, 0x20, read_cache_ttl=TTL)
+        io.pin_mode_bulk({pin: (pin >= 4,) for pin in range(8)})
+        try:
+            yield io, device, bus, clock
+        finally:
+            io.close()
+
+
+def test_reads_within_ttl_served_from_cache(cached):
+    io, device, bus, clock = cached
+    device.inputs = 0x5F
+    before = bus.transactions
+    assert io.read_port() == 0x50
+    device.inputs = 0xAF
+    clock.now += TTL / 2
+    assert io.read_port() == 0x50
+    assert io.digital_read(4) and not io.digital_read(5)
+    assert bus.transactions == before + 1
+    assert (io.cache_misses, io.cache_hits) == (1, 3)
+
+
+def test_cache_expires(cached):
+    io, device, bus, clock = cached
+    device.inputs = 0x1F
+    assert io.read_port() == 0x10
+    device.inputs = 0x2F
+    clock.now += TTL * 2
+    assert io.read_port() == 0x20
+    assert (io.cache_misses, io.cache_hits) == (2, 0)
+    # The window starts again from the last bus read
+    clock.now += TTL / 2
+    assert io.read_port() == 0x20
+    assert (io.cache_misses, io.cache_hits) == (2, 1)
+
+
+def test_writes_invalidate_the_cache(cached):
+    io, device, bus, clock = cached
+    device.inputs = 0x1F
+    io.read_port()
+    device.inputs = 0x2F
+    io.digital_write(0, True)
+    assert io.read_port() == 0x20
+    device.inputs = 0x4F
+    io.pin_mode(3, False)
+    assert io.read_port() == 0x40
+    device.inputs = 0x8F
+    io.play([0x01, 0x00])
+    assert io.read_port() == 0x80
+    assert (io.cache_misses, io.cache_hits) == (4, 0)
+
+
+def test_refresh(cached):
+    io, device, bus, clock = cached
+    device.inputs = 0x1F
+    io.read_port()
+    device.inputs = 0x3F
+    before = bus.transactions
+    assert io.refresh() == 0x30
+    assert bus.transactions == before + 1
+    assert io.read_port() == 0x30
+    assert (io.cache_misses, io.cache_hits) == (2, 1)
+
+
+def test_no_cache_by_default():
+    with Simulation() as sim:
+        bus = sim.bus(1)
+        device = bus.attach(0x20, Inputs())
+        io = PCF8574IO(1, 0x20)
+        io.port_mode(True)
+        try:
+            before = bus.transactions
+            io.read_port()
+            device.inputs = 0x0F
+            assert io.read_port() == 0x0F
+            assert bus.transactions == before + 2
+            assert (io.cache_misses, io.cache_hits) == (0, 0)
+        finally:
+            io.close()
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of IOServer and RemoteIO over a Unix socket, serving a RasPiIO on
+the simulated RPi.GPIO of pywiring.sim.
+"""
+
+import threading
+import time
+
+import pytest
+
+from pywiring.raspi import RasPiIO
+from pywiring.remote import IOServer, RemoteIO, RemoteError
+from pywiring.sim import Simulation
+
+PIN = 17
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+class Listener(object):
+    def __init__(self):
+        self.pins = []
+        self.received = threading.Event()
+
+    def __call__(self, pin):
+        self.pins.append(pin)
+        self.received.set()
+
+    def wait(self):
+        assert self.received.wait(5.0)
+        self.received.clear()
+
+
+@pytest.fixture
+def server(tmp_path):
+    with Simulation() as sim:
+        io = RasPiIO()
+        io.pin_mode(PIN, True)
+        server = IOServer(io, path=str(tmp_path / "io.sock"))
+        server.start()
+        yield sim, server
+        server.close()
+        io.close()
+
+
+def connect(server):
+    return RemoteIO(path=server.path)
+
+
+def edge(sim):
+    sim.gpio.set_input(PIN, 0)
+    sim.gpio.set_input(PIN, 1)
+
+
+def test_events_pushed_to_every_subscriber(server):
+    sim, server = server
+    first, second = connect(server), connect(server)
+    try:
+        listeners = Listener(), Listener()
+        first.enable_event_detect(PIN, "RISING", listeners[0])
+        second.enable_event_detect(PIN, "RISING", listeners[1])
+        edge(sim)
+        for listener in listeners:
+            listener.wait()
+            assert listener.pins == [PIN]
+    finally:
+        first.close()
+        second.close()
+
+
+def test_disconnect_keeps_other_subscribers(server):
+    sim, server = server
+    first, second = connect(server), connect(server)
+    listener = Listener()
+    try:
+        first.enable_event_detect(PIN, "RISING")
+        second.enable_event_detect(PIN, "RISING", listener)
+        first.close()
+        wait_for(lambda: len(server._connections) == 1)
+        assert PIN in sim.gpio._events
+        edge(sim)
+        listener.wait()
+    finally:
+        second.close()
+    wait_for(lambda: not server._connections)
+    assert PIN not in sim.gpio._events
+
+
+def test_disable_by_last_subscriber(server):
+    sim, server = server
+    first, second = connect(server), connect(server)
+    try:
+        first.enable_event_detect(PIN, "RISING")
+        second.enable_event_detect(PIN, "RISING")
+        first.disable_event_detect(PIN)
+        first.sync()
+        assert PIN in sim.gpio._events
+        # Disabling a pin the client isn't subscribed to does nothing
+        first.disable_event_detect(PIN)
+        first.sync()
+        assert PIN in sim.gpio._events
+        second.disable_event_detect(PIN)
+        second.sync()
+        assert PIN not in sim.gpio._events
+    finally:
+        first.close()
+        second.close()
+
+
+def test_conflicting_settings(server):
+    sim, server = server
+    first, second = connect(server), connect(server)
+    try:
+        first.enable_event_detect(PIN, "RISING")
+        with pytest.raises(RemoteError):
+            second.enable_event_detect(PIN, "FALLING")
+        # The first client can still change its own settings
+        first.enable_event_detect(PIN, "FALLING")
+        second.enable_event_detect(PIN, "FALLING")
+    finally:
+        first.close()
+        second.close()
+
+
+def test_callbacks_can_use_the_interface(server):
+    sim, server = server
+    client = connect(server)
+    levels = []
+    received = threading.Event()
+
+    def callback(pin):
+        levels.append(client.digital_read(pin))
+        client.sync()
+        received.set()
+
+    try:
+        client.enable_event_detect(PIN, "RISING", callback)
+        edge(sim)
+        assert received.wait(5.0)
+        assert levels == [True]
+    finally:
+        client.close()
+
+
+def test_callback_exceptions_logged(server, caplog):
+    sim, server = server
+    client = connect(server)
+    listener = Listener()
+
+    def fail(pin):
+        raise ZeroDivisionError
+
+    try:
+        client.enable_event_detect(PIN, "RISING", fail)
+        client.add_event_callback(PIN, listener)
+        edge(sim)
+        listener.wait()
+        assert "ZeroDivisionError" in caplog.text
+        # The connection is still up
+        edge(sim)
+        listener.wait()
+        assert client.digital_read(PIN)
+        assert client.event_detected(PIN)
+    finally:
+        client.close()
+
+
+def test_pin_range(server):
+    sim, server = server
+    client = connect(server)
+    try:
+        for call in (lambda: client.pin_mode(256, True), lambda: client.pin_mode_bulk({-1: (True,)}),
+                     lambda: client.analog_read(300), lambda: client.analog_write(256, 10),
+                     lambda: client.enable_event_detect(256, "RISING"),
+                     lambda: client.disable_event_detect(1000)):
+            with pytest.raises(ValueError):
+                call()
+        assert client.digital_read(256) is None
+        client.sync()
+    finally:
+        client.close()
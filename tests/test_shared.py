@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the PCF8574IO state shared between processes (shared=True), on
+the simulated I2C bus of pywiring.sim.
+"""
+
+import sys
+import threading
+import time
+
+import pytest
+
+from pywiring.i2c import PCF8574IO
+from pywiring.sim import Simulation, SimPCF8574
+
+ADDRESS = 0x27
+
+
+@pytest.fixture
+def shared():
+    with Simulation() as sim:
+        device = sim.bus(1).attach(ADDRESS, SimPCF8574())
+        io = PCF8574IO(1, ADDRESS, shared=True)
+        try:
+            yield io, device
+        finally:
+            io._shared.unlink()
+            io.close()
+
+
+def test_reads_dont_lose_writes(shared):
+    io, device = shared
+    io.pin_mode_bulk({pin: (pin >= 4,) for pin in range(8)})
+    io.write_port(0)
+    stop = threading.Event()
+    errors = []
+
+    def write(pin):
+        try:
+            for i in range(500):
+                if i & 1:
+                    io.modify_port(0, 1 << pin)
+                else:
+                    io.modify_port(1 << pin, 0)
+            io.modify_port(1 << pin, 0)
+        except Exception as e:
+            errors.append(e)
+
+    def read():
+        try:
+            while not stop.is_set():
+                io.read_outputs()
+                io.read_port()
+                io.read_outputs()
+        except Exception as e:
+            errors.append(e)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        readers = [threading.Thread(target=read) for _ in range(2)]
+        writers = [threading.Thread(target=write, args=(pin,)) for pin in range(4)]
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join(10.0)
+        stop.set()
+        for thread in readers:
+            thread.join(10.0)
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert not errors
+    # Every writer left its pin high
+    assert io.read_outputs() == 0x0F
+    assert io._shared.load() == (0x0F, 0xF0)
+    assert device.latch & 0x0F == 0x0F
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def test_reads_during_a_write(shared):
+    # A thread writes under the lock; the new state is only stored when it
+    # releases it. Reads from other threads in between must not replace
+    # the state it's about to store with the stored one.
+    io, device = shared
+    io.port_mode(False)
+    io.write_port(0x01)
+    outputs = []
+    with io._shared:
+        io.write_port(0x05)
+        reader = threading.Thread(target=lambda: outputs.append(io.read_outputs()))
+        reader.start()
+        reader.join(5.0)
+        # Waits for the bus, held by this thread
+        reader = threading.Thread(target=io.read_port)
+        reader.start()
+        wait_for(lambda: io._bus._queue)
+    reader.join(5.0)
+    assert outputs == [0x01]
+    assert io._shared.load()[0] == 0x05
+    assert io.read_outputs() == 0x05
+
+
+def test_read_outputs_sees_other_instances(shared):
+    io, device = shared
+    other = PCF8574IO(1, ADDRESS, shared=True)
+    try:
+        io.port_mode(False)
+        io.write_port(0x81)
+        assert other.read_outputs() == 0x81
+        other.modify_port(0x10, 0x01)
+        assert io.read_outputs() == 0x90
+        assert device.latch == 0x90
+    finally:
+        other.close()
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the serialization of the transactions issued on a SharedBus by
+several threads, on the simulated I2C bus of pywiring.sim.
+"""
+
+import threading
+import time
+import types
+
+import pytest
+
+from pywiring import hardware_module, override_hardware_module
+from pywiring.i2c import PCF8575IO, open_bus
+from pywiring.sim import Simulation, SimDevice, SimPCF8575
+
+
+class Log(SimDevice):
+    """
+    Records the bytes written to it, in order.
+    """
+
+    def __init__(self, log):
+        self.log = log
+
+    def write(self, data):
+        self.log.extend(data)
+
+    def read(self, count):
+        return [0] * count
+
+
+@pytest.fixture
+def bus():
+    with Simulation() as sim:
+        log = []
+        sim.bus(1).attach(0x20, Log(log))
+        bus = open_bus(1)
+        yield bus, log
+        bus.close()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def test_lock_holder_not_interleaved(bus):
+    bus, log = bus
+    other = threading.Thread(target=bus.write_byte, args=(0x20, 0xFF))
+    with bus.lock:
+        bus.write_byte(0x20, 1)
+        other.start()
+        wait_for(lambda: bus._queue)
+        # The request of the other thread stays queued
+        bus.write_byte(0x20, 2)
+        bus.write_bytes(0x20, [3, 4, 5])
+        assert log == [1, 2, 3, 4, 5]
+        assert len(bus._queue) == 1
+    other.join(5.0)
+    assert log == [1, 2, 3, 4, 5, 0xFF]
+    assert not bus._queue
+
+
+def test_concurrent_requests(bus):
+    bus, log = bus
+    count = 200
+
+    def run(value):
+        for _ in range(count):
+            bus.write_byte(0x20, value)
+
+    threads = [threading.Thread(target=run, args=(value,)) for value in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5.0)
+    assert sorted(log) == sorted(list(range(4)) * count)
+    assert not bus._queue
+
+
+def test_errors_raised_in_the_calling_thread(bus):
+    bus, log = bus
+    with pytest.raises(IOError):
+        bus.write_byte(0x21, 0)
+    with bus.lock:
+        with pytest.raises(IOError):
+            bus.write_byte(0x21, 0)
+    bus.write_byte(0x20, 7)
+    assert log == [7]
+
+
+def test_interrupted_request(bus):
+    bus, log = bus
+    results = {}
+
+    def interrupt():
+        raise KeyboardInterrupt
+
+    def run(name, func, args):
+        try:
+            results[name] = bus._call(func, args)
+        except BaseException as e:
+            results[name] = e
+
+    first = threading.Thread(target=run, args=("first", interrupt, ()))
+    second = threading.Thread(target=run, args=("second", bus._smbus.write_byte, (0x20, 9)))
+    with bus.lock:
+        first.start()
+        wait_for(lambda: len(bus._queue) == 1)
+        second.start()
+        wait_for(lambda: len(bus._queue) == 2)
+    first.join(5.0)
+    second.join(5.0)
+    assert not bus._queue
+    # Whichever thread ran the interrupted request gets the interrupt; the
+    # other one's request fails, or is done
+    if isinstance(results["second"], KeyboardInterrupt):
+        assert isinstance(results["first"], IOError)
+        assert log == []
+    else:
+        assert isinstance(results["first"], KeyboardInterrupt)
+        assert results["second"] is None
+        assert log == [9]
+    bus.write_byte(0x20, 1)
+    assert log[-1] == 1
+
+
+def plain_smbus():
+    # python-smbus: no plain I2C transactions
+    def missing(self):
+        raise AttributeError("i2c_rdwr")
+
+    module = types.ModuleType("smbus")
+    module.SMBus = type("SMBus", (hardware_module("smbus").SMBus,), {"i2c_rdwr": property(missing)})
+    return module
+
+
+def test_plain_reads_through_smbus2():
+    with Simulation() as sim:
+        device = sim.bus(1).attach(0x20, SimPCF8575())
+        override_hardware_module("smbus", plain_smbus())
+        io = PCF8575IO(1, 0x20)
+        try:
+            io.port_mode(True)
+            device.inputs = 0x1234
+            before = sim.bus(1).transactions
+            assert io.read_port() == 0x1234
+            assert sim.bus(1).transactions == before + 1
+            assert io._bus._rdwr is not io._bus._smbus
+        finally:
+            io.close()
+
+
+def test_plain_reads_without_smbus2():
+    def missing(name):
+        raise ImportError("No module named 'smbus2'")
+
+    smbus2 = types.ModuleType("smbus2")
+    smbus2.__getattr__ = missing
+    with Simulation() as sim:
+        sim.bus(1).attach(0x20, SimPCF8575())
+        override_hardware_module("smbus", plain_smbus())
+        override_hardware_module("smbus2", smbus2)
+        bus = open_bus(1)
+        try:
+            with pytest.raises(IOError, match="smbus2"):
+                bus.read_bytes(0x20, 2)
+        finally:
+            bus.close()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the recording and replay of hardware calls.
+"""
+
+import marshal
+import time
+
+import pytest
+
+from pywiring import hardware_module
+from pywiring.i2c import PCF8574IO
+from pywiring.sim import Simulation, SimPCF8574
+from pywiring.trace import CALL, MAGIC, NEW, Recorder, Replayer, ReplayError, counts, _LENGTH
+
+
+def write_trace(path, records):
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        for record in records:
+            payload = marshal.dumps(record)
+            f.write(_LENGTH.pack(len(payload)))
+            f.write(payload)
+
+
+@pytest.fixture
+def spaced(tmp_path):
+    # Two 10 ms calls, the second one 100 ms after the first
+    path = str(tmp_path / "spaced.trace")
+    write_trace(path, [
+        (0.0, 0.0, "smbus", "SMBus", (), None, NEW, 1),
+        (0.0, 0.01, 1, "read_byte", (0x20,), None, CALL, 0x55),
+        (0.1, 0.01, 1, "read_byte", (0x20,), None, CALL, 0xAA),
+    ])
+    return path
+
+
+def replay_time(path, pace):
+    start = time.perf_counter()
+    with Replayer(path, pace=pace):
+        bus = hardware_module("smbus").SMBus()
+        assert bus.read_byte(0x20) == 0x55
+        first = time.perf_counter() - start
+        assert bus.read_byte(0x20) == 0xAA
+        return first, time.perf_counter() - start
+
+
+def test_pace_keeps_gaps(spaced):
+    first, total = replay_time(spaced, 1)
+    assert first >= 0.01
+    # The second call ends 110 ms after the replay started, not 10 ms
+    # after the first one
+    assert 0.11 <= total < 0.5
+
+
+def test_pace_scales_gaps(spaced):
+    first, total = replay_time(spaced, 0.5)
+    assert first >= 0.005
+    assert 0.055 <= total < 0.11
+
+
+def test_no_pace(spaced):
+    _, total = replay_time(spaced, 0)
+    assert total < 0.01
+
+
+def test_late_calls_dont_wait(spaced):
+    with Replayer(spaced, pace=1):
+        time.sleep(0.12)
+        bus = hardware_module("smbus").SMBus()
+        bus.read_byte(0x20)
+        start = time.perf_counter()
+        bus.read_byte(0x20)
+        assert time.perf_counter() - start < 0.01
+
+
+def test_record_and_replay(tmp_path):
+    path = str(tmp_path / "session.trace")
+    with Simulation() as sim:
+        sim.bus(1).attach(0x20, SimPCF8574())
+        with Recorder(path):
+            io = PCF8574IO(1, 0x20)
+            io.port_mode(False)
+            io.write_port(0x5A)
+            value = io.read_port()
+            io.close()
+    assert counts(path)["smbus", "write_byte"] >= 2
+
+    with Replayer(path) as replayer:
+        io = PCF8574IO(1, 0x20)
+        io.port_mode(False)
+        io.write_port(0x5A)
+        assert io.read_port() == value
+        io.close()
+        assert replayer.remaining == 0
+
+    with Replayer(path):
+        io = PCF8574IO(1, 0x20)
+        try:
+            with pytest.raises(ReplayError):
+                io.write_port(0x00)
+        finally:
+            io.close()